@@ -0,0 +1,79 @@
+"""Compare per-domain profile extraction with the generic fallback.
+
+Runs price and image extraction over the fixture corpus in
+benchmarks/fixtures/extraction (expected values in expected.json), once with
+the page URL (profile path) and once without (generic path), and reports
+accuracy and mean time per page. Pages are padded with inert markup to
+approximate the size of real marketplace pages.
+
+    cd backend && python benchmarks/extraction_bench.py --repeat 200 --pad-kb 400
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures' / 'extraction'
+sys.path.insert(0, str(BACKEND_DIR))
+
+from core.web_extract import extract_main_image_from_html, extract_price_from_html  # noqa: E402
+
+_FILLER = '<div class="nav-item"><a href="/c/{i}">Category {i}</a><span data-x="{i}">item</span></div>\n'
+
+
+def pad(html: str, pad_kb: int) -> str:
+    if pad_kb <= 0:
+        return html
+    block = ''.join(_FILLER.format(i=i) for i in range(50))
+    filler = block * max(1, (pad_kb * 1024) // len(block))
+    # Heavy headers/nav come before the product block on real pages
+    return html.replace('<body>', '<body>\n' + filler, 1)
+
+
+def same_amount(found, expected) -> bool:
+    try:
+        return float(str(found).replace(',', '')) == float(expected)
+    except (TypeError, ValueError):
+        return False
+
+
+def run(repeat: int, pad_kb: int):
+    expected = json.loads((FIXTURES_DIR / 'expected.json').read_text(encoding='utf-8'))
+    pages = {name: pad((FIXTURES_DIR / name).read_text(encoding='utf-8'), pad_kb) for name in expected}
+
+    totals = {}
+    print(f"{'fixture':<20} {'mode':<8} {'price':<14} {'ok':<4} {'image ok':<9} {'ms/page':>8}")
+    for name, spec in expected.items():
+        html = pages[name]
+        for mode, url in (('profile', spec['url']), ('generic', None)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                price = extract_price_from_html(html, url=url)
+                image = extract_main_image_from_html(html, base_url=url)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            price_ok = bool(price) and same_amount(price.get('amount'), spec['amount'])
+            image_ok = image == spec['image']
+            t = totals.setdefault(mode, {'price_ok': 0, 'image_ok': 0, 'ms': 0.0})
+            t['price_ok'] += price_ok
+            t['image_ok'] += image_ok
+            t['ms'] += elapsed_ms
+            shown = (price or {}).get('display') or '-'
+            print(f"{name:<20} {mode:<8} {shown:<14} {'yes' if price_ok else 'NO':<4} "
+                  f"{'yes' if image_ok else 'NO':<9} {elapsed_ms:>8.3f}")
+
+    n = len(expected)
+    print()
+    for mode, t in totals.items():
+        print(f"{mode:<8} price accuracy {t['price_ok']}/{n}, image accuracy {t['image_ok']}/{n}, "
+              f"mean {t['ms'] / n:.3f} ms/page")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--pad-kb', type=int, default=300, help="Inert markup added to each page (KB)")
+    args = parser.parse_args()
+    run(args.repeat, args.pad_kb)
@@ -0,0 +1,88 @@
+"""Measure worker cold start: import time and first-request latency.
+
+Each run is a fresh interpreter. 'cold' is a worker that loads everything
+itself (no preload); 'preloaded' runs core.warmup.warm_up() first, as the
+gunicorn master does with preload_app, and times only what a forked worker
+still pays. Reports the median over --runs.
+
+    cd backend && python benchmarks/startup_bench.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Authenticated endpoint without credentials: exercises JWT auth and throttles, touches no data
+_REQUESTS = ('/api/v1/health/', '/api/v1/history/')
+
+
+def child(mode: str):
+    timings = {}
+    started = time.perf_counter()
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+    timings['django_setup_ms'] = (time.perf_counter() - started) * 1000
+
+    if mode == 'preloaded':
+        from core.warmup import after_fork, warm_up
+        t = time.perf_counter()
+        warm_up()
+        after_fork()
+        timings['warm_up_ms'] = (time.perf_counter() - t) * 1000
+        # Everything up to here happens once in the master, before fork()
+        started = time.perf_counter()
+
+    from django.test import Client
+    client = Client(HTTP_HOST='localhost')
+    for i, path in enumerate(_REQUESTS):
+        t = time.perf_counter()
+        client.get(path)
+        timings[f'request_{i + 1}_ms'] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    client.get(_REQUESTS[-1])
+    timings['warm_request_ms'] = (time.perf_counter() - t) * 1000
+    timings['ready_to_first_response_ms'] = (time.perf_counter() - started) * 1000 - timings['warm_request_ms']
+    timings['heavy_modules_loaded'] = sorted(
+        m for m in ('openai', 'PIL.Image', 'requests', 'rest_framework_simplejwt.tokens') if m in sys.modules
+    )
+    print(json.dumps(timings))
+
+
+def run(runs: int):
+    results = {}
+    for mode in ('cold', 'preloaded'):
+        samples = []
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, __file__, '--child', mode],
+                cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(json.loads(out.strip().splitlines()[-1]))
+        results[mode] = samples
+
+    for mode, samples in results.items():
+        print(f"== {mode} (median of {len(samples)})")
+        for key in samples[0]:
+            if key == 'heavy_modules_loaded':
+                continue
+            print(f"  {key:<28} {statistics.median(s[key] for s in samples):8.1f}")
+        print(f"  {'modules after requests':<28} {', '.join(samples[0]['heavy_modules_loaded']) or '-'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', choices=('cold', 'preloaded'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+    else:
+        run(args.runs)
@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Outermost body-writing middleware: compresses what everything below produced
+    'core.middleware.CompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -146,6 +149,10 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# WebP thumbnail widths generated for every stored upload
+MEDIA_THUMBNAIL_SIZES = tuple(
+    int(size) for size in os.getenv('MEDIA_THUMBNAIL_SIZES', '128,512').split(',') if size.strip()
+)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -170,18 +177,186 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    # Token buckets in the shared cache, budgeted per User.plan (PLAN_THROTTLE_RATES);
+    # /analyze/ adds core.throttling.AnalyzeThrottle, which keeps exact buckets in the database
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
+        'core.throttling.PlanTokenBucketThrottle',
     ],
-    'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/hour',  # 100 requests per hour for anonymous users
-    },
+    # orjson-backed; behaves like rest_framework.renderers.JSONRenderer when orjson is missing
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'core.renderers.ORJSONRenderer',
     ],
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
 }
 
+# Response compression (core.middleware.CompressionMiddleware): brotli when the client
+# accepts it and the package is installed, else gzip; small bodies are sent as-is.
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True') == 'True'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '5'))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '6'))
+# Responses carrying secrets (JWTs) are never compressed
+RESPONSE_COMPRESS_EXCLUDE = ['/api/v1/auth/', '/admin/']
+
+# Per-agent model routing (core.routing): model, max completion tokens, timeout and a
+# fallback model tried once when the primary call fails. Light text agents go to a
+# faster, cheaper model; vision and web-search agents keep the strong one.
+GPT_MODEL_NAME = os.getenv('GPT_MODEL_NAME', 'gpt-5.1')
+GPT_LIGHT_MODEL_NAME = os.getenv('GPT_LIGHT_MODEL_NAME', 'gpt-4.1-mini')
+GPT_FALLBACK_MODEL_NAME = os.getenv('GPT_FALLBACK_MODEL_NAME', 'gpt-4.1')
+_STRONG_ROUTE = {'model': GPT_MODEL_NAME, 'fallback_model': GPT_FALLBACK_MODEL_NAME}
+_LIGHT_ROUTE = {'model': GPT_LIGHT_MODEL_NAME, 'fallback_model': GPT_MODEL_NAME}
+AGENT_ROUTES = {
+    'default': {**_STRONG_ROUTE, 'max_tokens': 800, 'timeout_s': 60, 'temperature': 0.2},
+    'VisualIdentificationAgent': {**_STRONG_ROUTE, 'max_tokens': 800, 'timeout_s': 60},
+    'BuyLinkAgent': {**_STRONG_ROUTE, 'timeout_s': 90},
+    'KnowledgeEnrichmentAgent': {**_LIGHT_ROUTE, 'max_tokens': 700, 'timeout_s': 30},
+    'UseCaseAgent': {**_LIGHT_ROUTE, 'max_tokens': 600, 'timeout_s': 30},
+    'ImpactAnalysisAgent': {**_LIGHT_ROUTE, 'max_tokens': 700, 'timeout_s': 30},
+    'RecommendationAgent': {**_LIGHT_ROUTE, 'max_tokens': 700, 'timeout_s': 30},
+    'ProductChatAgent': {**_LIGHT_ROUTE, 'max_tokens': 600, 'timeout_s': 30},
+    'ChatSummaryAgent': {**_LIGHT_ROUTE, 'max_tokens': 400, 'timeout_s': 30},
+    # Rewrites agent output that local JSON repair (core.json_repair) could not fix
+    'JsonRepair': {**_LIGHT_ROUTE, 'max_tokens': 1200, 'timeout_s': 30, 'temperature': 0},
+}
+# Per-agent overrides as JSON, e.g. {"UseCaseAgent": {"model": "gpt-5-mini", "temperature": null}}
+for _agent, _overrides in json.loads(os.getenv('AGENT_ROUTES_OVERRIDES', '{}') or '{}').items():
+    AGENT_ROUTES[_agent] = {**AGENT_ROUTES.get(_agent, {}), **_overrides}
+# Agent JSON output is repaired locally (fences, prose, trailing commas, truncation) and
+# coerced to the agent's schema; only if that fails is one JsonRepair model call made.
+LLM_JSON_REPAIR_CALL = os.getenv('LLM_JSON_REPAIR_CALL', 'True') == 'True'
+# USD per 1M (input, output) tokens, for per-route cost logging
+MODEL_PRICING_USD_PER_1M = {
+    'gpt-5.1': (1.25, 10.0),
+    'gpt-5': (1.25, 10.0),
+    'gpt-5-mini': (0.25, 2.0),
+    'gpt-4.1': (2.0, 8.0),
+    'gpt-4.1-mini': (0.4, 1.6),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+}
+
+# Image+URL analyses: 'concurrent' runs the vision call and web-context gathering in
+# parallel and reconciles them afterwards; 'sequential' feeds web context into the vision prompt.
+VISION_WEB_CONTEXT_MODE = os.getenv('VISION_WEB_CONTEXT_MODE', 'concurrent')
+# Cascaded vision: identify at low detail on a downscaled copy first and only re-send
+# the image at high detail when confidence is below the threshold. Keep the threshold
+# above the orchestrator's 0.5 abort rule, or weak low-detail answers get accepted.
+VISION_CASCADE = os.getenv('VISION_CASCADE', 'True') == 'True'
+VISION_CASCADE_ACCEPT_CONFIDENCE = float(os.getenv('VISION_CASCADE_ACCEPT_CONFIDENCE', '0.75'))
+VISION_LOW_DETAIL_MAX_PX = int(os.getenv('VISION_LOW_DETAIL_MAX_PX', '512'))
+
+# Chat memory: recent turns kept verbatim in the prompt are capped at this many
+# (estimated) tokens; older turns are folded into a rolling summary.
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1200'))
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv('CHAT_SUMMARY_MAX_CHARS', '1600'))
+# Chat prompts carry only the top-k report sections relevant to the question
+CHAT_RETRIEVAL_TOP_K = int(os.getenv('CHAT_RETRIEVAL_TOP_K', '5'))
+CHAT_CONTEXT_MAX_CHARS = int(os.getenv('CHAT_CONTEXT_MAX_CHARS', '4000'))
+# Repeated questions on the same report are answered from cache (fuzzy-matched)
+CHAT_ANSWER_CACHE_TTL = int(os.getenv('CHAT_ANSWER_CACHE_TTL', '86400'))
+CHAT_ANSWER_CACHE_PER_REPORT = int(os.getenv('CHAT_ANSWER_CACHE_PER_REPORT', '64'))
+CHAT_ANSWER_CACHE_SIMILARITY = float(os.getenv('CHAT_ANSWER_CACHE_SIMILARITY', '0.8'))
+# Shorter questions (after dropping filler words) are too ambiguous to share answers
+CHAT_ANSWER_CACHE_MIN_TOKENS = int(os.getenv('CHAT_ANSWER_CACHE_MIN_TOKENS', '2'))
+
+# Two-tier cache: a small in-process LRU (L1) in front of a shared store (L2).
+# L2 is Redis when REDIS_URL is set, otherwise a SQLite file (WAL mode) shared by
+# all workers on the host. Use core.cache.CacheNamespace for namespaced keys.
+REDIS_URL = os.getenv('REDIS_URL', '')
+CACHE_DIR = Path(os.getenv('CACHE_DIR', str(BASE_DIR / 'run' / 'cache')))
+if REDIS_URL:
+    _SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+else:
+    _SHARED_CACHE = {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': str(CACHE_DIR / 'shared.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_L2_MAX_ENTRIES', '50000'))},
+    }
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache_backends.LayeredCache',
+        'KEY_PREFIX': 'vp',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': int(os.getenv('CACHE_L1_MAX_ENTRIES', '1024')),
+            'L1_TTL': float(os.getenv('CACHE_L1_TTL', '30')),
+        },
+    },
+    'shared': _SHARED_CACHE,
+}
+
+# Buy-link results (web search + prices) per product: served as-is while fresh,
+# served stale with a background refresh until the stale TTL, then refetched.
+BUY_LINK_CACHE_FRESH_S = int(os.getenv('BUY_LINK_CACHE_FRESH_S', str(6 * 3600)))
+BUY_LINK_CACHE_STALE_S = int(os.getenv('BUY_LINK_CACHE_STALE_S', str(7 * 86400)))
+
+# Buy-link prices are refreshed out of band by `manage.py refresh_prices` (run it
+# from cron or with --loop); analyses only read the latest known price.
+PRICE_REFRESH_INTERVAL_S = int(os.getenv('PRICE_REFRESH_INTERVAL_S', str(12 * 3600)))
+PRICE_REFRESH_BUDGET = int(os.getenv('PRICE_REFRESH_BUDGET', '100'))
+PRICE_REFRESH_HOST_INTERVAL_S = float(os.getenv('PRICE_REFRESH_HOST_INTERVAL_S', '2'))
+PRICE_REFRESH_MAX_PER_HOST = int(os.getenv('PRICE_REFRESH_MAX_PER_HOST', '20'))
+# Only links shown by an analysis within ACTIVE_S are refreshed; rows not shown for
+# PRUNE_S are deleted; prices older than MAX_AGE_INTERVALS refresh intervals are not served.
+PRICE_REFRESH_ACTIVE_S = int(os.getenv('PRICE_REFRESH_ACTIVE_S', str(14 * 86400)))
+PRICE_PRUNE_S = int(os.getenv('PRICE_PRUNE_S', str(60 * 86400)))
+PRICE_MAX_AGE_INTERVALS = int(os.getenv('PRICE_MAX_AGE_INTERVALS', '4'))
+
+# URL-only analyses reuse a prior identification of the same marketplace product
+# id (ASIN, Flipkart item id, ...) for this many days instead of re-identifying it.
+PRODUCT_IDENTITY_MAX_AGE_DAYS = int(os.getenv('PRODUCT_IDENTITY_MAX_AGE_DAYS', '90'))
+
+# Throttle budgets per scope and plan ('anon' = unauthenticated, keyed by IP).
+# 'analyze' applies to /analyze/ on top of the general 'api' budget.
+PLAN_THROTTLE_RATES = {
+    'api': {
+        'anon': os.getenv('THROTTLE_API_ANON', '100/hour'),
+        'free': os.getenv('THROTTLE_API_FREE', '300/hour'),
+        'pro': os.getenv('THROTTLE_API_PRO', '1000/hour'),
+        'enterprise': os.getenv('THROTTLE_API_ENTERPRISE', '5000/hour'),
+    },
+    'analyze': {
+        'anon': os.getenv('THROTTLE_ANALYZE_ANON', '10/hour'),
+        'free': os.getenv('THROTTLE_ANALYZE_FREE', '20/hour'),
+        'pro': os.getenv('THROTTLE_ANALYZE_PRO', '200/hour'),
+        'enterprise': os.getenv('THROTTLE_ANALYZE_ENTERPRISE', '1000/hour'),
+    },
+}
+
+# Admission control: at most this many analysis pipelines run at once across all
+# workers on the host; extra requests get 503 + Retry-After immediately.
+PIPELINE_MAX_IN_FLIGHT = int(os.getenv('PIPELINE_MAX_IN_FLIGHT', '8'))
+PIPELINE_RETRY_AFTER_S = int(os.getenv('PIPELINE_RETRY_AFTER_S', '15'))
+PIPELINE_SLOT_DIR = Path(os.getenv('PIPELINE_SLOT_DIR', str(BASE_DIR / 'run' / 'pipeline-slots')))
+
+# Per-process priority scheduling of admitted analyses by plan (core.scheduler).
+# Slots are per worker process; queues only form with threaded workers (gunicorn --threads).
+SCHEDULER_SLOTS = int(os.getenv('SCHEDULER_SLOTS', '2'))
+SCHEDULER_TIER_WEIGHTS = {
+    'enterprise': int(os.getenv('SCHEDULER_WEIGHT_ENTERPRISE', '6')),
+    'pro': int(os.getenv('SCHEDULER_WEIGHT_PRO', '3')),
+    'free': int(os.getenv('SCHEDULER_WEIGHT_FREE', '1')),
+}
+# A job queued this long is served next regardless of tier
+SCHEDULER_STARVATION_S = float(os.getenv('SCHEDULER_STARVATION_S', '20'))
+SCHEDULER_MAX_WAIT_S = float(os.getenv('SCHEDULER_MAX_WAIT_S', '60'))
+
+# End-to-end time budget of one analyze request (core.deadline), counted from arrival.
+# Keep it below GUNICORN_TIMEOUT so the partial report is saved before the worker is killed.
+ANALYZE_DEADLINE_S = float(os.getenv('ANALYZE_DEADLINE_S', '100'))
+# Model calls and page fetches are not started with less than this left
+DEADLINE_MIN_CALL_S = float(os.getenv('DEADLINE_MIN_CALL_S', '3'))
+# Optional stages (recommendations, live buy-link search) need this much left to run;
+# otherwise recommendations are skipped and buy links are served from cache if possible
+ANALYZE_OPTIONAL_STAGE_MIN_S = float(os.getenv('ANALYZE_OPTIONAL_STAGE_MIN_S', '20'))
+# A running analysis holds its checkpoint (core.checkpoints) this long; retries may take
+# it over afterwards. Keep it above GUNICORN_TIMEOUT so a live run is never resumed twice.
+ANALYSIS_CHECKPOINT_LEASE_S = int(os.getenv('ANALYSIS_CHECKPOINT_LEASE_S', '180'))
+
 # JWT Settings
 from datetime import timedelta
 
@@ -194,6 +369,17 @@ SIMPLE_JWT = {
 }
 
 # Logging Configuration
+# Records are queued and written by a background thread (core.log) as one
+# JSON object per line, each field capped; DEBUG and noisy loggers can be sampled.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'simple' (human-readable)
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'True') == 'True'
+LOG_FIELD_MAX_CHARS = int(os.getenv('LOG_FIELD_MAX_CHARS', '512'))
+LOG_MESSAGE_MAX_CHARS = int(os.getenv('LOG_MESSAGE_MAX_CHARS', '2000'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Fraction of DEBUG records kept, and per-logger fractions for records below WARNING
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+LOG_SAMPLE_RATES = json.loads(os.getenv('LOG_SAMPLE_RATES', '{}') or '{}')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -206,11 +392,25 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'core.log.JSONFormatter',
+            'max_field_chars': LOG_FIELD_MAX_CHARS,
+            'max_message_chars': LOG_MESSAGE_MAX_CHARS,
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'core.log.SamplingFilter',
+            'debug_rate': LOG_DEBUG_SAMPLE_RATE,
+            'rates': LOG_SAMPLE_RATES,
+        },
     },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'simple',
+            **({'class': 'core.log.AsyncQueueHandler', 'maxsize': LOG_QUEUE_SIZE} if LOG_ASYNC
+               else {'class': 'logging.StreamHandler'}),
+            'formatter': LOG_FORMAT,
+            'filters': ['sampling'],
         },
         'file': {
             'class': 'logging.FileHandler',
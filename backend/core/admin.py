@@ -1,6 +1,14 @@
+import statistics
+from datetime import timedelta
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, UploadedImage
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+from .models import PerfRollup, User, UploadedImage
+from .perf import STEPS
 
 
 @admin.register(User)
@@ -28,7 +36,72 @@ class UserAdmin(BaseUserAdmin):
 
 @admin.register(UploadedImage)
 class UploadedImageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'uploaded_at', 'processed', 'processing_time_ms']
-    list_filter = ['processed', 'uploaded_at']
-    search_fields = ['user__email', 'user__username']
-    readonly_fields = ['uploaded_at', 'processing_time_ms', 'cost_incurred']
+    list_display = ['id', 'user', 'product_name', 'brand', 'risk_level', 'status', 'uploaded_at', 'processed', 'processing_time_ms']
+    list_filter = ['processed', 'status', 'risk_level', 'uploaded_at']
+    search_fields = ['user__email', 'user__username', 'product_name', 'brand']
+    readonly_fields = ['uploaded_at', 'processing_time_ms', 'cost_incurred', *UploadedImage.SUMMARY_FIELDS]
+    list_select_related = ['user']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The change list never shows the report JSON; the change form still loads it
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('analysis_report')
+        return queryset
+
+
+@admin.register(PerfRollup)
+class PerfRollupAdmin(admin.ModelAdmin):
+    """Daily rollups (written by `manage.py rollup_perf`) plus a read-only dashboard over them."""
+    list_display = ['day', 'step', 'samples', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate', 'abort_rate',
+                    'cache_hit_rate', 'cost_usd']
+    list_filter = ['step']
+    date_hierarchy = 'day'
+    dashboard_days = 14
+    # Latest p95 this many times the trailing median is flagged as a regression
+    regression_factor = 1.25
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='core_perfrollup_dashboard'),
+        ]
+        return urls + super().get_urls()
+
+    def dashboard_view(self, request):
+        since = timezone.localdate() - timedelta(days=self.dashboard_days - 1)
+        rows = list(PerfRollup.objects.filter(day__gte=since).order_by('day'))
+        by_step = {}
+        for row in rows:
+            by_step.setdefault(row.step, []).append(row)
+
+        steps = []
+        for step in (PerfRollup.PIPELINE, *STEPS):
+            history = by_step.get(step)
+            if not history:
+                continue
+            latest = history[-1]
+            trailing = [r.p95_ms for r in history[:-1] if r.p95_ms is not None]
+            baseline = statistics.median(trailing) if trailing else None
+            steps.append({
+                'step': step,
+                'latest': latest,
+                'baseline_p95_ms': baseline,
+                'regressed': bool(baseline and latest.p95_ms and latest.p95_ms > baseline * self.regression_factor),
+            })
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Pipeline performance',
+            'days': list(reversed(by_step.get(PerfRollup.PIPELINE, []))),
+            'steps': steps,
+            'dashboard_days': self.dashboard_days,
+            'regression_factor': self.regression_factor,
+        }
+        return TemplateResponse(request, 'admin/core/perfrollup/dashboard.html', context)
@@ -0,0 +1,64 @@
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: fall back to a per-process limit
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineSlots:
+    """Global cap on concurrently running analysis pipelines.
+
+    Each slot is a lock file held with a non-blocking `flock`, so the limit is
+    shared by all gunicorn workers on the host and a slot is freed automatically
+    if its worker dies. Acquisition never waits: when every slot is taken the
+    caller should answer 503 immediately instead of queueing until the gunicorn
+    timeout. Views take a slot only once the plan scheduler has granted the job,
+    so jobs still waiting in the plan queue never hold one.
+    """
+
+    def __init__(self, directory: Path, limit: int):
+        self.directory = Path(directory)
+        self.limit = limit
+        self._local = threading.BoundedSemaphore(limit)
+        if fcntl is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def try_acquire(self) -> Optional[object]:
+        """Return a slot handle, or None when the pipeline is saturated."""
+        if fcntl is None:
+            return self._local if self._local.acquire(blocking=False) else None
+
+        # Start at a per-process offset so workers don't all contend on slot 0
+        start = os.getpid() % self.limit
+        for i in range(self.limit):
+            path = self.directory / f"slot-{(start + i) % self.limit}.lock"
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return None
+
+    def release(self, handle):
+        if handle is None:
+            return
+        if handle is self._local:
+            self._local.release()
+            return
+        try:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        finally:
+            os.close(handle)
+
+
+pipeline_slots = PipelineSlots(settings.PIPELINE_SLOT_DIR, settings.PIPELINE_MAX_IN_FLIGHT)
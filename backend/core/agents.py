@@ -1,28 +1,140 @@
 import os
+import io
 import json
+import time
 import base64
 import logging
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 
 from .web_extract import summarize_product_urls
+from .metrics import metrics
+from .report_index import retrieve_report_context, report_cache_key, tokenize
+from .routing import record_call, route_for
+from .clients import get_openai_client
+from .deadline import DeadlineExceeded, capped
+from .json_repair import Field, coerce_to_schema, matches_schema, parse_json_lenient
 
 logger = logging.getLogger(__name__)
 
+_IMAGE_MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+# Runs web-context collection alongside the vision call (VISION_WEB_CONTEXT_MODE=concurrent)
+_WEB_CONTEXT_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="web-context")
+
 
 class BaseAgent:
-    """Base class for all AI agents with OpenAI integration."""
-    
+    """Base class for all AI agents with OpenAI integration.
+
+    Model, token budget, timeout and fallback model come from the agent's route
+    in settings.AGENT_ROUTES (see core.routing); `cost_usd` accumulates the
+    estimated cost of this instance's calls. JSON replies are repaired and
+    coerced to `output_schema` (see core.json_repair). When the orchestrator
+    sets `deadline` (core.deadline), call timeouts are capped at what is left.
+    """
+
+    # Declared output fields: name -> core.json_repair.Field
+    output_schema = {}
+    # Request time budget (core.deadline.Deadline), set per analysis by the orchestrator
+    deadline = None
+
     def __init__(self):
         self.api_key = os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             logger.warning("OPENAI_API_KEY not set. AI agents will not function.")
-        self.client = OpenAI(api_key=self.api_key) if self.api_key else None
-        self.model = os.getenv('GPT_MODEL_NAME', 'gpt-5.1')
+        self.route = route_for(type(self).__name__)
+        self.model = self.route.model
+        self.cost_usd = 0.0
+        self._cost_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # One shared client per process instead of one per agent instance
+        return get_openai_client()
 
     def _get_system_prompt(self):
         raise NotImplementedError("Subclasses must implement _get_system_prompt")
 
+    def _routed(self, create, route=None, **kwargs):
+        """Call `create` on the routed model, retrying once on the fallback model if it fails."""
+        route = route or self.route
+        models = [route.model] + ([route.fallback_model] if route.fallback_model else [])
+        for attempt, model in enumerate(models):
+            try:
+                timeout_s = capped(route.timeout_s, self.deadline, settings.DEADLINE_MIN_CALL_S)
+            except DeadlineExceeded:
+                metrics.incr('llm.deadline_skipped', label=route.agent)
+                raise
+            started = time.monotonic()
+            try:
+                response = create(model=model, timeout=timeout_s, **kwargs)
+            except Exception as e:
+                record_call(route, model, (time.monotonic() - started) * 1000, ok=False, fallback=attempt > 0)
+                if attempt == len(models) - 1:
+                    raise
+                logger.warning("%s: %s failed (%s); retrying on %s", route.agent, model, e, models[attempt + 1])
+                continue
+            cost = record_call(
+                route, model, (time.monotonic() - started) * 1000,
+                usage=getattr(response, 'usage', None), fallback=attempt > 0,
+            )
+            with self._cost_lock:
+                self.cost_usd += cost
+            return response
+
+    def _completion_options(self, route=None):
+        route = route or self.route
+        options = {"max_completion_tokens": route.max_tokens}
+        if route.temperature is not None:
+            options["temperature"] = route.temperature
+        return options
+
+    def _parse_json_output(self, content):
+        """Parse a JSON reply, repairing it locally first and by one model call only if that fails."""
+        try:
+            data, how = parse_json_lenient(content, accept=lambda value: matches_schema(value, self.output_schema))
+            problem = None if matches_schema(data, self.output_schema) else "reply does not match the schema"
+        except ValueError as e:
+            data, how, problem = None, None, str(e)
+
+        if problem:
+            if not settings.LLM_JSON_REPAIR_CALL:
+                metrics.incr('llm.json_output', label='failed')
+                raise ValueError(f"Failed to parse AI response as JSON: {problem}")
+            logger.info("%s: local JSON repair failed (%s); asking the repair model", self.route.agent, problem)
+            try:
+                data, _ = parse_json_lenient(self._repair_json_with_model(content, problem))
+            except ValueError as e:
+                metrics.incr('llm.json_output', label='failed')
+                raise ValueError(f"Failed to parse AI response as JSON: {e}")
+            how = 'model'
+
+        metrics.incr('llm.json_output', label=how)
+        if how != 'clean':
+            logger.info("%s: JSON output repaired (%s)", self.route.agent, how)
+        if not isinstance(data, dict):
+            raise ValueError("AI response is not a JSON object")
+        return coerce_to_schema(data, self.output_schema) if self.output_schema else data
+
+    def _repair_json_with_model(self, content, problem):
+        route = route_for('JsonRepair')
+        fields = ", ".join(f"{name} ({field.kind})" for name, field in self.output_schema.items())
+        response = self._routed(
+            self.client.chat.completions.create,
+            route=route,
+            messages=[
+                {"role": "system", "content": (
+                    "Rewrite the text as ONE valid JSON object. Keep its content; do not add facts. "
+                    + (f"Expected fields: {fields}." if fields else "")
+                )},
+                {"role": "user", "content": f"Problem: {problem}\n\nText:\n{(content or '')[:8000]}"},
+            ],
+            response_format={"type": "json_object"},
+            **self._completion_options(route),
+        )
+        return response.choices[0].message.content
+
     def _call_gpt(self, messages, response_format={"type": "json_object"}):
         """Make a GPT API call with proper error handling."""
         if not self.api_key:
@@ -32,22 +144,18 @@ class BaseAgent:
             raise ValueError("OpenAI client not initialized")
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._routed(
+                self.client.chat.completions.create,
                 messages=messages,
                 response_format=response_format,
-                temperature=0.2,
                 # New OpenAI API uses max_completion_tokens instead of max_tokens
-                max_completion_tokens=800,
+                **self._completion_options(),
             )
             content = response.choices[0].message.content
-            return json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {e}")
-            raise ValueError(f"Failed to parse AI response as JSON: {e}")
         except Exception as e:
-            logger.error(f"OpenAI API error: {e}")
+            logger.error("OpenAI API error: %s", e)
             raise
+        return self._parse_json_output(content)
 
     def _call_gpt_text(self, messages):
         """Make a GPT API call that returns plain text."""
@@ -57,17 +165,25 @@ class BaseAgent:
             raise ValueError("OpenAI client not initialized")
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._routed(
+                self.client.chat.completions.create,
                 messages=messages,
-                temperature=0.2,
-                max_completion_tokens=600,
+                **self._completion_options(),
             )
             return (response.choices[0].message.content or '').strip()
         except Exception as e:
-            logger.error(f"OpenAI API error (text): {e}")
+            logger.error("OpenAI API error (text): %s", e)
             raise
 
+    def _call_web_search(self, input_messages):
+        """Responses API call with the web_search tool; returns the output text."""
+        response = self._routed(
+            self.client.responses.create,
+            tools=[{"type": "web_search"}],
+            input=input_messages,
+        )
+        return response.output_text
+
 
 class ProductChatAgent(BaseAgent):
     """Chat agent: answer user questions using the current report context."""
@@ -81,17 +197,60 @@ class ProductChatAgent(BaseAgent):
             "If info is missing, say what you don't know and suggest what to verify."
         )
 
-    def run(self, message: str, report_context):
+    def _relevant_context(self, message, report_context, history, report_id):
+        """Only the report sections relevant to this question (plus the product identity)."""
+        # Fold the previous user turn into the query so follow-ups ("and the price?") still match
+        previous = next((m['content'] for m in reversed(history or []) if m.get('role') == 'user'), '')
+        sections = retrieve_report_context(
+            report_context,
+            f"{previous} {message}",
+            cache_key=report_cache_key(report_context, report_id),
+            top_k=settings.CHAT_RETRIEVAL_TOP_K,
+        )
+        return "\n".join(f"[{s['title']}] {s['text']}" for s in sections)
+
+    def run(self, message: str, report_context, history=None, report_id=None):
+        """Answer `message`; `history` is the bounded prior conversation from ChatMemory."""
+        context = self._relevant_context(message, report_context, history, report_id)
         messages = [
             {"role": "system", "content": self._get_system_prompt()},
-            {"role": "user", "content": f"Report context (JSON): {json.dumps(report_context)[:12000]}"},
+            {"role": "user", "content": f"Relevant report sections:\n{context[:settings.CHAT_CONTEXT_MAX_CHARS]}"},
+            *(history or []),
             {"role": "user", "content": message},
         ]
         return self._call_gpt_text(messages)
 
 
+class ChatSummaryAgent(BaseAgent):
+    """Folds evicted chat turns into the rolling conversation summary."""
+
+    def _get_system_prompt(self):
+        return (
+            "You maintain a running summary of a conversation about a product report. "
+            "Merge the new turns into the existing summary. "
+            "Keep facts the user asked about, answers given, and user preferences. "
+            "Drop pleasantries. Reply with the updated summary only, at most 120 words."
+        )
+
+    def run(self, previous_summary: str, turns):
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+        messages = [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": f"Existing summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}"},
+        ]
+        return self._call_gpt_text(messages)
+
+
 class VisualIdentificationAgent(BaseAgent):
     """Agent 1: Identify product from image."""
+
+    output_schema = {
+        "product_name": Field('str', default="Unknown"),
+        "category": Field('str', default="General"),
+        "brand": Field('str', nullable=True),
+        "confidence": Field('float', default=0.0, bounds=(0.0, 1.0)),
+        "visual_clues": Field('list', default=[]),
+    }
     
     def _get_system_prompt(self):
                 return """
@@ -121,25 +280,21 @@ class VisualIdentificationAgent(BaseAgent):
         # Preferred path: OpenAI web_search tool (same pattern as BuyLinkAgent)
         if self.client and self.api_key:
             try:
-                response = self.client.responses.create(
-                    model=self.model,
-                    tools=[{"type": "web_search"}],
-                    input=[
-                        {
-                            "role": "system",
-                            "content": (
-                                "You are a web research helper. Extract factual product signals from the given URLs. "
-                                "Return a short, non-marketing summary including: likely product name, brand (if visible), and any price you can find. "
-                                "If the URLs do not contain product details, say so."
-                            ),
-                        },
-                        {
-                            "role": "user",
-                            "content": "URLs:\n" + "\n".join(product_urls),
-                        },
-                    ],
-                )
-                text = (response.output_text or '').strip()
+                output_text = self._call_web_search([
+                    {
+                        "role": "system",
+                        "content": (
+                            "You are a web research helper. Extract factual product signals from the given URLs. "
+                            "Return a short, non-marketing summary including: likely product name, brand (if visible), and any price you can find. "
+                            "If the URLs do not contain product details, say so."
+                        ),
+                    },
+                    {
+                        "role": "user",
+                        "content": "URLs:\n" + "\n".join(product_urls),
+                    },
+                ])
+                text = (output_text or '').strip()
                 if text:
                     return {"method": "openai_web_search", "text": text, "urls": list(product_urls)}
             except Exception as e:
@@ -147,16 +302,199 @@ class VisualIdentificationAgent(BaseAgent):
 
         # Fallback: lightweight local extraction
         try:
-            summary = summarize_product_urls(product_urls)
+            summary = summarize_product_urls(product_urls, deadline=self.deadline)
             return {"method": "requests_extract", **summary}
         except Exception as e:
             logger.info("Agent1 requests_extract failed: %s", e)
             # Fallback: at least pass through URLs so downstream can attempt inference
             return {"method": "urls_only", "text": "Requests extract failed; using URLs only", "urls": list(product_urls)}
 
-    def run(self, image_path_or_url, product_urls=None):
-        """Identify product from image, URLs, or both. Combines all available data sources."""
+    def _image_data_url(self, image_path_or_url, image_bytes=None, image_format=None):
+        if image_bytes is not None:
+            mime = _IMAGE_MIME_TYPES.get(image_format, 'image/jpeg')
+            return f"data:{mime};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+        if os.path.isfile(image_path_or_url):
+            with open(image_path_or_url, "rb") as image_file:
+                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+                return f"data:image/jpeg;base64,{base64_image}"
+        return image_path_or_url
+
+    def _low_detail_data_url(self, image_path_or_url, image_bytes=None, image_format=None):
+        """Downscaled JPEG for the low-detail tier; remote URLs are passed through as-is."""
+        if image_bytes is None:
+            if not (image_path_or_url and os.path.isfile(image_path_or_url)):
+                return image_path_or_url
+            with open(image_path_or_url, "rb") as image_file:
+                image_bytes = image_file.read()
+        try:
+            from PIL import Image
+
+            with Image.open(io.BytesIO(image_bytes)) as img:
+                img.thumbnail((settings.VISION_LOW_DETAIL_MAX_PX,) * 2)
+                out = io.BytesIO()
+                img.convert('RGB').save(out, format='JPEG', quality=85)
+            return f"data:image/jpeg;base64,{base64.b64encode(out.getvalue()).decode('ascii')}"
+        except Exception as e:
+            logger.info("Agent1 downscale failed; sending original at low detail: %s", e)
+            return self._image_data_url(image_path_or_url, image_bytes, image_format)
+
+    def _identify_image(self, image_url, text_prompt, detail="high"):
+        messages = [
+            {"role": "system", "content": self._get_system_prompt()},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": text_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_url, "detail": detail},
+                    },
+                ],
+            },
+        ]
+        started = time.monotonic()
+        try:
+            return self._call_gpt(messages)
+        finally:
+            metrics.observe('vision.tier_ms', (time.monotonic() - started) * 1000, label=detail)
+
+    def _identify(self, image_path_or_url, image_bytes, image_format, text_prompt):
+        """Identify from the image, cascading low -> high detail when enabled.
+
+        The low-detail call on a downscaled copy is accepted when its confidence
+        reaches VISION_CASCADE_ACCEPT_CONFIDENCE; otherwise, or when it fails, the
+        image is re-sent at high detail. Tier/latency info is attached under `_vision`.
+        """
+        if not settings.VISION_CASCADE:
+            started = time.monotonic()
+            result = self._identify_image(self._image_data_url(image_path_or_url, image_bytes, image_format), text_prompt)
+            vision = {"mode": "high_only", "tier": "high", "high_ms": int((time.monotonic() - started) * 1000)}
+        else:
+            started = time.monotonic()
+            try:
+                low_url = self._low_detail_data_url(image_path_or_url, image_bytes, image_format)
+                low_result = self._identify_image(low_url, text_prompt, detail="low")
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                # The high-detail pass is still worth trying (e.g. a downscaling or transient API error)
+                logger.warning("Agent1 low-detail pass failed: %s", e)
+                low_result = {"error": str(e)}
+            low_ms = int((time.monotonic() - started) * 1000)
+            try:
+                low_confidence = float(low_result.get("confidence", 0)) if isinstance(low_result, dict) else 0.0
+            except (TypeError, ValueError):
+                low_confidence = 0.0
+            vision = {"mode": "cascade", "low_ms": low_ms, "low_confidence": low_confidence}
+
+            if isinstance(low_result, dict) and "error" not in low_result \
+                    and low_confidence >= settings.VISION_CASCADE_ACCEPT_CONFIDENCE:
+                metrics.incr('vision.cascade', label='accepted_low')
+                result = low_result
+                vision["tier"] = "low"
+            elif (self.deadline is not None and isinstance(low_result, dict) and "error" not in low_result
+                    and not self.deadline.allows(self.route.timeout_s / 2)):
+                # No time for a high-detail pass: keep the low-detail answer (the orchestrator's
+                # confidence rule still applies to it)
+                metrics.incr('vision.cascade', label='deadline_low')
+                result = low_result
+                vision["tier"] = "low"
+                vision["deadline"] = True
+            else:
+                low_failed = not isinstance(low_result, dict) or "error" in low_result
+                metrics.incr('vision.cascade', label='low_failed' if low_failed else 'escalated')
+                started = time.monotonic()
+                result = self._identify_image(
+                    self._image_data_url(image_path_or_url, image_bytes, image_format), text_prompt,
+                )
+                vision["tier"] = "high"
+                vision["high_ms"] = int((time.monotonic() - started) * 1000)
+                logger.info("Agent1 escalated to high detail (low-detail confidence %.2f)", low_confidence)
+
+        if isinstance(result, dict):
+            result["_vision"] = vision
+        return result
+
+    def _web_agrees(self, result, web_context):
+        """Cheap check: do the identified name/brand show up in the gathered web text?"""
+        if web_context.get("method") == "urls_only":
+            return True  # nothing to contradict the image with
+        web_terms = set(tokenize(json.dumps(web_context)))
+        name_terms = [t for t in tokenize(result.get("product_name") or '') if len(t) > 2]
+        if not name_terms:
+            return True
+        overlap = sum(1 for t in name_terms if t in web_terms) / len(name_terms)
+        brand = (result.get("brand") or '').lower()
+        brand_seen = bool(brand) and all(t in web_terms for t in tokenize(brand))
+        return overlap >= 0.5 or brand_seen
+
+    def _reconcile(self, result, web_context):
+        """Merge image-only identification with web context gathered in parallel."""
+        if not isinstance(result, dict):
+            return result
+        if self._web_agrees(result, web_context):
+            if web_context.get("method") != "urls_only":
+                result["visual_clues"] = result.get("visual_clues", []) + ["Consistent with user-provided product pages"]
+            return result
+
+        # Disagreement: a short text-only call (no image re-upload) settles it
+        logger.info("Agent1 image/web disagreement for %r; reconciling", result.get("product_name"))
+        messages = [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": (
+                "An image-based identification and web data from user-provided URLs disagree.\n\n"
+                f"Image-based result:\n{json.dumps(result)}\n\n"
+                f"Web context:\n{json.dumps(web_context)[:5000]}\n\n"
+                "Return the corrected identification in the same schema. Prioritize the image evidence, "
+                "use the web data to fill in brand/model details only when compatible, lower confidence "
+                "if they genuinely conflict, and mention the discrepancy in visual_clues."
+            )},
+        ]
+        try:
+            reconciled = self._call_gpt(messages)
+            if isinstance(reconciled, dict) and reconciled.get("product_name"):
+                return reconciled
+        except Exception as e:
+            logger.info("Agent1 reconciliation failed; keeping image result: %s", e)
+        return result
+
+    def _run_concurrent(self, image_path_or_url, image_bytes, image_format, product_urls):
+        """Start the vision call immediately while web context is gathered in parallel."""
+        web_future = _WEB_CONTEXT_EXECUTOR.submit(self._web_context_from_urls, product_urls)
+        text_prompt = (
+            "Identify this product from the image.\n\n"
+            "User also provided these product URLs (for reference):\n" + "\n".join(product_urls)
+        )
+        try:
+            result = self._identify(image_path_or_url, image_bytes, image_format, text_prompt)
+        finally:
+            try:
+                web_context = web_future.result()
+            except Exception as e:
+                logger.info("Agent1 concurrent web context failed: %s", e)
+                web_context = None
+        if not web_context:
+            web_context = {"method": "urls_only", "text": "Using raw URLs as context; page fetch/web_search unavailable", "urls": list(product_urls)}
+
+        vision = result.pop("_vision", None) if isinstance(result, dict) else None
+        result = self._reconcile(result, web_context)
+        if isinstance(result, dict):
+            result["_web_context"] = web_context
+            if vision:
+                result["_vision"] = vision
+        return result
+
+    def run(self, image_path_or_url, product_urls=None, image_bytes=None, image_format=None):
+        """Identify product from image, URLs, or both. Combines all available data sources.
+
+        `image_bytes` (bytes or memoryview) is sent as-is, skipping the disk read.
+        """
         product_urls = product_urls or []
+        has_image = bool(image_path_or_url) or image_bytes is not None
+
+        if has_image and product_urls and settings.VISION_WEB_CONTEXT_MODE == 'concurrent':
+            return self._run_concurrent(image_path_or_url, image_bytes, image_format, product_urls)
+
         web_context = self._web_context_from_urls(product_urls)
 
         # Ensure we always have some web_context when URLs are provided, even if fetch/search fails
@@ -164,7 +502,7 @@ class VisualIdentificationAgent(BaseAgent):
             web_context = {"method": "urls_only", "text": "Using raw URLs as context; page fetch/web_search unavailable", "urls": list(product_urls)}
 
         # Case 1: Only URLs provided (no image)
-        if not image_path_or_url:
+        if not has_image:
             # URL-only flow: always attempt identification from web_context (never fall back to "no image")
             messages = [
                 {"role": "system", "content": self._get_system_prompt()},
@@ -177,13 +515,6 @@ class VisualIdentificationAgent(BaseAgent):
             return result
 
         # Case 2: Image provided (with or without URLs)
-        if os.path.isfile(image_path_or_url):
-            with open(image_path_or_url, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                image_url = f"data:image/jpeg;base64,{base64_image}"
-        else:
-            image_url = image_path_or_url
-
         # Build prompt that combines image + URLs when both available
         text_prompt = "Identify this product from the image."
         
@@ -192,20 +523,7 @@ class VisualIdentificationAgent(BaseAgent):
         elif product_urls:
             text_prompt += f"\n\nUser also provided these product URLs (for reference):\n" + "\n".join(product_urls)
 
-        messages = [
-            {"role": "system", "content": self._get_system_prompt()},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": text_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": image_url, "detail": "high"},
-                    },
-                ],
-            },
-        ]
-        result = self._call_gpt(messages)
+        result = self._identify(image_path_or_url, image_bytes, image_format, text_prompt)
         if isinstance(result, dict) and web_context:
             result["_web_context"] = web_context
         return result
@@ -213,6 +531,13 @@ class VisualIdentificationAgent(BaseAgent):
 
 class KnowledgeEnrichmentAgent(BaseAgent):
     """Agent 2: Provide general factual info."""
+
+    output_schema = {
+        "overview": Field('str', default=""),
+        "key_features": Field('list', default=[]),
+        "common_variants": Field('list', default=[]),
+        "uncertainties": Field('list', default=[]),
+    }
     
     def _get_system_prompt(self):
                 return """
@@ -247,6 +572,13 @@ class KnowledgeEnrichmentAgent(BaseAgent):
 
 class UseCaseAgent(BaseAgent):
     """Agent 3: Explain usage & users."""
+
+    output_schema = {
+        "intended_users": Field('list', default=[]),
+        "common_use_cases": Field('list', default=[]),
+        "usage_frequency": Field('str', default=""),
+        "misuse_warnings": Field('list', default=[]),
+    }
     
     def _get_system_prompt(self):
                 return """
@@ -277,6 +609,16 @@ class UseCaseAgent(BaseAgent):
 
 class ImpactAnalysisAgent(BaseAgent):
     """Agent 4: Health & environmental impact."""
+
+    output_schema = {
+        "health_impact": Field('str', default=""),
+        "environmental_impact": Field('str', default=""),
+        "risk_level": Field('str', default="medium", choices={
+            "low": "low", "medium": "medium", "moderate": "medium", "high": "high",
+        }),
+        "impact_score": Field('float', nullable=True, bounds=(0.0, 100.0)),
+        "limitations": Field('list', default=[]),
+    }
     
     def _get_system_prompt(self):
                 return """
@@ -309,6 +651,14 @@ class ImpactAnalysisAgent(BaseAgent):
 
 class RecommendationAgent(BaseAgent):
     """Agent 5: Suggest safer/better alternatives."""
+
+    output_schema = {
+        "recommendation_summary": Field('str', default=""),
+        "alternatives": Field('objects', default=[], required=("alternative_type",), item={
+            "alternative_type": Field('str', default=""),
+            "reason": Field('str', default=""),
+        }),
+    }
     
     def _get_system_prompt(self):
                 return """
@@ -343,6 +693,16 @@ class RecommendationAgent(BaseAgent):
 
 class BuyLinkAgent(BaseAgent):
     """Agent 6: Purchase links provider."""
+
+    output_schema = {
+        "purchase_recommended": Field('bool', default=False),
+        "purchase_reason": Field('str', default=""),
+        "buy_links": Field('objects', default=[], required=("link",), item={
+            "platform": Field('str', default=""),
+            "link": Field('str', default=""),
+            "description": Field('str', default=""),
+        }),
+    }
     
     def _get_system_prompt(self):
                 return """
@@ -427,19 +787,12 @@ class BuyLinkAgent(BaseAgent):
             raise ValueError("OpenAI client not initialized")
 
         try:
-            response = self.client.responses.create(
-                model=self.model,
-                tools=[{"type": "web_search"}],
-                input=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": f"Purchase Context: {json.dumps(purchase_context)}"},
-                ],
-            )
-            content = response.output_text
-            return json.loads(content)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error (buy links): {e}")
-            raise ValueError(f"Failed to parse buy link response as JSON: {e}")
+            content = self._call_web_search([
+                {"role": "system", "content": self._get_system_prompt()},
+                {"role": "user", "content": f"Purchase Context: {json.dumps(purchase_context)}"},
+            ])
         except Exception as e:
-            logger.error(f"OpenAI web_search error: {e}")
+            logger.error("OpenAI web_search error: %s", e)
             raise
+        # Web-search replies often wrap the JSON in code fences or trailing prose
+        return self._parse_json_output(content)
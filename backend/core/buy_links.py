@@ -0,0 +1,210 @@
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import CacheNamespace
+from .metrics import metrics
+from .prices import apply_known_prices, register_links
+
+logger = logging.getLogger(__name__)
+
+_REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="buy-link-refresh")
+
+# ImpactAnalysisAgent calibrates high risk as an impact_score below this
+HIGH_RISK_IMPACT_SCORE = 35
+
+
+def _norm(value) -> str:
+    return " ".join(str(value or '').lower().split())
+
+
+def _risk_level(buy_request: Dict[str, Any]) -> str:
+    impact = buy_request.get('impact') or {}
+    return _norm(impact.get('risk_level')) or 'medium'
+
+
+def _product_key(buy_request: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return (
+        _norm(buy_request.get('product_name')),
+        _norm(buy_request.get('brand')),
+        _norm(buy_request.get('product_category')),
+        _risk_level(buy_request),
+    )
+
+
+def purchase_guidance(buy_request: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+    """buy_guidance for one analysis: the agent's own verdict on the cached links.
+
+    Only this analysis's risk overrides it: a high risk withholds the links
+    whatever the cached entry says. Prices are layered on by with_known_prices().
+    """
+    impact = buy_request.get('impact') or {}
+    score = impact.get('impact_score')
+    if _risk_level(buy_request) == 'high' or (isinstance(score, (int, float)) and score < HIGH_RISK_IMPACT_SCORE):
+        return {
+            "purchase_recommended": False,
+            "purchase_reason": "This analysis flags a high health or environmental risk. Purchase links are withheld.",
+            "buy_links": [],
+        }
+    buy_links = copy.deepcopy(entry.get("buy_links") or [])
+    reason = entry.get("purchase_reason") or (
+        "Direct product pages from trusted sellers." if buy_links
+        else "Could not find direct product pages from trusted sellers."
+    )
+    return {
+        "purchase_recommended": bool(entry.get("purchase_recommended", bool(buy_links))),
+        "purchase_reason": reason,
+        "buy_links": buy_links,
+    }
+
+
+def with_known_prices(buy_request: Dict[str, Any], buy_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in known prices; only when some were found does the recommendation change.
+
+    A current price confirms a link points at a live product page, so the links
+    are recommended, with the price-based reason followed by the agent's own.
+    """
+    apply_known_prices(buy_data)
+    priced = [link for link in buy_data.get('buy_links') or [] if link.get('price_checked_at')]
+    if not priced:
+        return buy_data
+    reasons = [f"Current prices were found on {len(priced)} direct seller page{'s' if len(priced) != 1 else ''}."]
+    if _risk_level(buy_request) != 'low':
+        reasons.append("Moderate risk: review the health and environmental notes before buying.")
+    agent_reason = buy_data.get('purchase_reason')
+    if agent_reason:
+        reasons.append(agent_reason)
+    buy_data['purchase_recommended'] = True
+    buy_data['purchase_reason'] = " ".join(reasons)
+    return buy_data
+
+
+class BuyLinkCache:
+    """Stale-while-revalidate cache of the links BuyLinkAgent finds for a product.
+
+    Entries are keyed by (product_name, brand, category, risk_level). Within
+    `fresh_s` an entry is served as-is; until `stale_s` it is still served
+    immediately while one background refresh per key (across workers) replaces
+    it. Concurrent misses for the same product share a single web-search call.
+    Only results with links are cached, together with the agent's verdict on
+    them; purchase_guidance() applies each analysis's own risk on top, and
+    prices are read from the BuyLinkPrice table on every call.
+    """
+
+    def __init__(self, fresh_s: int, stale_s: int):
+        self.fresh_s = fresh_s
+        self.stale_s = stale_s
+        self._store = CacheNamespace('buy-links', version=4, timeout=stale_s, lock_timeout=120)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _fetch(self, agent, buy_request) -> Dict[str, Any]:
+        buy_data = agent.run(buy_request)
+        if not isinstance(buy_data, dict) or "error" in buy_data:
+            error = buy_data.get('error') if isinstance(buy_data, dict) else "Invalid buy link response"
+            return {"error": error, "fetched_at": time.time()}
+        buy_links = [link for link in buy_data.get('buy_links') or [] if isinstance(link, dict)]
+        try:
+            register_links(buy_links)
+        except Exception as e:
+            logger.info("Could not register buy links for price refresh: %s", e)
+        return {
+            "buy_links": buy_links,
+            "purchase_recommended": bool(buy_data.get('purchase_recommended')),
+            "purchase_reason": str(buy_data.get('purchase_reason') or ''),
+            "fetched_at": time.time(),
+        }
+
+    @staticmethod
+    def _cacheable(entry) -> bool:
+        # "No links found" is not worth serving for the whole stale window
+        return "error" not in entry and bool(entry.get("buy_links"))
+
+    @staticmethod
+    def _buy_data(entry, buy_request) -> Dict[str, Any]:
+        if "error" in entry:
+            return {"error": entry["error"]}
+        return purchase_guidance(buy_request, entry)
+
+    def _refresh(self, agent, buy_request, key):
+        try:
+            entry = self._fetch(agent, buy_request)
+            if self._cacheable(entry):
+                self._store.set(entry, *key)
+                metrics.incr('buy_links.refreshed')
+        except Exception as e:
+            metrics.incr('buy_links.refresh_failed')
+            logger.warning("Buy link refresh failed for %s: %s", key[0], e)
+        finally:
+            self._store.delete('refresh', *key)
+            with self._lock:
+                self._refreshing.discard(key)
+            connection.close()
+
+    def _schedule_refresh(self, agent, buy_request, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        # The L2 marker keeps other workers from refreshing the same key concurrently
+        try:
+            claimed = self._store.backend.add(self._store.key('refresh', *key), 1, 300)
+        except Exception:
+            claimed = True
+        if not claimed:
+            with self._lock:
+                self._refreshing.discard(key)
+            return
+        # A fresh agent instance: the refresh outlives the request (and its deadline)
+        _REFRESH_EXECUTOR.submit(self._refresh, type(agent)(), buy_request, key)
+
+    def get(self, agent, buy_request, deadline=None) -> Tuple[Dict[str, Any], str]:
+        """Return (buy_data, 'fresh' | 'stale' | 'miss') with the latest known prices.
+
+        The links are a copy: cached objects are shared through the in-process L1.
+        With a `deadline`, waiting for another worker's fetch is capped at what is left.
+        """
+        entry, status = self._get(agent, buy_request, deadline)
+        buy_data = self._buy_data(entry, buy_request)
+        if "error" not in buy_data:
+            with_known_prices(buy_request, buy_data)
+        return buy_data, status
+
+    def cached(self, buy_request) -> Optional[Dict[str, Any]]:
+        """Cached buy data (fresh or stale) with known prices, without any search; None on a miss."""
+        key = _product_key(buy_request)
+        entry = self._store.get(*key) if key[0] else None
+        if entry is None:
+            return None
+        return with_known_prices(buy_request, self._buy_data(entry, buy_request))
+
+    def _get(self, agent, buy_request, deadline=None) -> Tuple[Dict[str, Any], str]:
+        key = _product_key(buy_request)
+        if not key[0]:
+            return self._fetch(agent, buy_request), 'miss'
+
+        entry = self._store.get(*key)
+        if entry is not None:
+            if time.time() - entry["fetched_at"] < self.fresh_s:
+                return entry, 'fresh'
+            metrics.incr('buy_links.stale_served')
+            self._schedule_refresh(agent, buy_request, key)
+            return entry, 'stale'
+
+        wait_s = min(60, deadline.remaining()) if deadline is not None else 60
+        entry = self._store.get_or_set(
+            key, lambda: self._fetch(agent, buy_request), wait_s=wait_s, should_cache=self._cacheable,
+        )
+        return entry, 'miss'
+
+
+buy_link_cache = BuyLinkCache(
+    fresh_s=settings.BUY_LINK_CACHE_FRESH_S,
+    stale_s=settings.BUY_LINK_CACHE_STALE_S,
+)
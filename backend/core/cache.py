@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from django.core.cache import caches
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _digest(parts) -> str:
+    raw = "\x1f".join(str(p) for p in parts)
+    if len(raw) <= 64 and raw.isprintable() and ' ' not in raw:
+        return raw
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class CacheNamespace:
+    """Namespaced, versioned view of a Django cache alias with hit/miss stats.
+
+    Keys are "<namespace>:v<version>:<parts>"; bumping `version` invalidates
+    everything in the namespace at once. `get_or_set()` lets a single caller
+    compute a missing value while concurrent callers (threads in this process,
+    and other workers via an L2 `add()` lock) wait for it instead of stampeding.
+    """
+
+    def __init__(self, name: str, version: int = 1, timeout: Optional[float] = 300,
+                 alias: str = 'default', lock_timeout: float = 30):
+        self.name = name
+        self.version = version
+        self.timeout = timeout
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def key(self, *parts) -> str:
+        return f"{self.name}:v{self.version}:{_digest(parts)}"
+
+    def get(self, *parts, default=None):
+        try:
+            value = self.backend.get(self.key(*parts), _MISSING)
+        except Exception as e:
+            logger.warning("Cache get failed in %s: %s", self.name, e)
+            value = _MISSING
+        if value is _MISSING:
+            metrics.incr('cache.miss', label=self.name)
+            return default
+        metrics.incr('cache.hit', label=self.name)
+        return value
+
+    def set(self, value, *parts, timeout=_MISSING):
+        try:
+            self.backend.set(self.key(*parts), value, self.timeout if timeout is _MISSING else timeout)
+        except Exception as e:
+            logger.warning("Cache set failed in %s: %s", self.name, e)
+
+    def delete(self, *parts):
+        try:
+            self.backend.delete(self.key(*parts))
+        except Exception as e:
+            logger.warning("Cache delete failed in %s: %s", self.name, e)
+
+    @contextmanager
+    def _local_lock(self, key):
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+        with self._locks_guard:
+            if not lock.locked():
+                self._locks.pop(key, None)
+
+    def get_or_set(self, parts, compute: Callable[[], Any], timeout=_MISSING, wait_s: float = 10,
+                   should_cache: Optional[Callable[[Any], bool]] = None):
+        """Return the cached value for `parts`, computing it at most once across callers.
+
+        Results rejected by `should_cache` (e.g. error payloads) are returned but not stored.
+        """
+        value = self.get(*parts, default=_MISSING)
+        if value is not _MISSING:
+            return value
+
+        key = self.key(*parts)
+        with self._local_lock(key):
+            value = self.backend.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            lock_key = f"{key}:lock"
+            try:
+                owner = self.backend.add(lock_key, 1, self.lock_timeout)
+            except Exception:
+                owner = True
+            if not owner:
+                # Another worker is computing it: wait briefly, then compute anyway
+                deadline = time.monotonic() + wait_s
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    value = self.backend.get(key, _MISSING)
+                    if value is not _MISSING:
+                        return value
+                metrics.incr('cache.lock_timeout', label=self.name)
+
+            try:
+                value = compute()
+                if should_cache is None or should_cache(value):
+                    self.set(value, *parts, timeout=timeout)
+                return value
+            finally:
+                if owner:
+                    try:
+                        self.backend.delete(lock_key)
+                    except Exception:
+                        pass
+
+
+def cache_stats() -> Dict[str, Dict]:
+    """Per-namespace hit/miss counts and hit ratio for this process."""
+    snapshot = metrics.snapshot('cache.')
+    hits = snapshot.get('cache.hit', {})
+    misses = snapshot.get('cache.miss', {})
+    out = {}
+    for name in sorted(set(hits) | set(misses)):
+        h, m = hits.get(name, 0), misses.get(name, 0)
+        out[name] = {"hits": h, "misses": m, "hit_ratio": round(h / (h + m), 3) if h + m else 0.0}
+    return out
@@ -0,0 +1,213 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    """Persistent cache in a local SQLite file in WAL mode.
+
+    Shared by every worker process on the host and survives restarts; WAL lets
+    readers proceed while one writer commits. Used as L2 when no Redis-compatible
+    server is configured.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = str(location)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def reset_after_fork(self):
+        # SQLite handles must not cross fork(); the child opens its own on next use
+        self._local = threading.local()
+
+    def _expiry(self, timeout):
+        # BaseCache.get_backend_timeout() returns an absolute epoch expiry (or None)
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connect().execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout)),
+        )
+        self._maybe_cull(conn)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires IS NOT NULL AND expires <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connect().execute(
+            "UPDATE cache SET expires = ? WHERE key = ?", (self._expiry(timeout), key)
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connect().execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def _maybe_cull(self, conn):
+        # Amortized: purge expired rows, then trim the oldest-expiring when over capacity
+        if int.from_bytes(os.urandom(1), 'little') >= 8:
+            return
+        conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self._max_entries:
+            excess = count - self._max_entries + self._max_entries // max(1, self._cull_frequency)
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)",
+                (excess,),
+            )
+
+
+class LayeredCache(BaseCache):
+    """Two-tier cache: a small in-process LRU (L1) in front of a shared backend (L2).
+
+    L2 is another cache alias (SQLite/Redis). L1 entries live for at most
+    `L1_TTL` seconds so values changed by other workers are picked up quickly.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1024))
+        self.l1_ttl = float(options.get('L1_TTL', 30))
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _seconds(self, timeout):
+        """Relative timeout in seconds (None = forever), as passed to the L2 backend."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        elif timeout == 0:
+            return -1
+        return timeout
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._l1[key]
+                return _MISSING
+            self._l1.move_to_end(key)
+            return value
+
+    def _l1_set(self, key, value, timeout):
+        ttl = self.l1_ttl
+        seconds = self._seconds(timeout)
+        if seconds is not None:
+            ttl = min(ttl, seconds)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._l1[key] = (value, time.monotonic() + ttl)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        value = self._l1_get(full_key)
+        if value is not _MISSING:
+            return value
+        value = self.l2.get(full_key, _MISSING)
+        if value is _MISSING:
+            return default
+        self._l1_set(full_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self.l2.set(full_key, value, timeout=self._seconds(timeout))
+        self._l1_set(full_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        added = self.l2.add(full_key, value, timeout=self._seconds(timeout))
+        if added:
+            self._l1_set(full_key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        return self.l2.touch(full_key, timeout=self._seconds(timeout))
+
+    def delete(self, key, version=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(full_key)
+        return self.l2.delete(full_key)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.l2.clear()
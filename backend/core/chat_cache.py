@@ -0,0 +1,130 @@
+import hashlib
+import re
+import time
+from typing import FrozenSet, List, Optional, Tuple
+
+from django.conf import settings
+
+from .cache import CacheNamespace
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CONTRACTIONS = (("won't", "will not"), ("can't", "can not"), ("n't", " not"))
+# Only words that never change what is being asked; interrogatives (who/what/when/why/how,
+# can/does/will), negations and numbers are kept, unlike the BM25 stopwords in core.report_index
+_FILLER = frozenset({
+    'a', 'an', 'the', 'it', 'its', 'this', 'that', 'is', 'are', 'am', 'be',
+    'please', 'i', 'me', 'my', 'you', 'your', 'hey', 'hi', 'hello', 'thanks',
+})
+_NEGATIONS = frozenset({'not', 'no', 'never'})
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and filler words: "Is it safe for kids?" -> "safe for kids"."""
+    text = (question or '').lower().replace('’', "'")
+    for contraction, expanded in _CONTRACTIONS:
+        text = text.replace(contraction, expanded)
+    return " ".join(word for word in _WORD.findall(text) if word not in _FILLER)
+
+
+def guard_tokens(normalized: str) -> Tuple[str, ...]:
+    """Numbers and negations: two questions differing in any of these ask different things."""
+    return tuple(sorted(w for w in normalized.split() if w in _NEGATIONS or w[0].isdigit()))
+
+
+def char_ngrams(text: str, n: int = 3) -> FrozenSet[str]:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return frozenset([padded])
+    return frozenset(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def ngram_similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _question_id(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:20]
+
+
+class ChatAnswerCache:
+    """Chat answers keyed by report and normalized question, in the shared cache.
+
+    Each answer is its own cache entry, so concurrent workers never overwrite
+    each other's answers. A small per-report index (question, last used) serves
+    the fuzzy lookup - the closest character-trigram match above `similarity` -
+    and least-recently-used eviction beyond `per_report`. A fuzzy match must have
+    exactly the same numbers and negations ("under 3" never matches "under 8",
+    "safe" never matches "not safe"). Losing an index update
+    to a concurrent writer only hides that answer from fuzzy matching.
+    Questions with fewer than `min_tokens` words are neither cached nor looked up.
+    """
+
+    def __init__(self, per_report: int, ttl_s: int, similarity: float, min_tokens: int = 2):
+        self.per_report = per_report
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self.min_tokens = min_tokens
+        self._store = CacheNamespace('chat-answers', version=2, timeout=ttl_s)
+
+    def _normalized(self, question: str) -> Optional[str]:
+        normalized = normalize_question(question)
+        return normalized if len(normalized.split()) >= self.min_tokens else None
+
+    def _index(self, report_key: str) -> List[Tuple[str, float]]:
+        return self._store.get(report_key, 'index') or []
+
+    def _touch(self, report_key: str, normalized: str):
+        """Move `normalized` to the most recently used end of the index, evicting the oldest."""
+        index = [(q, used) for q, used in self._index(report_key) if q != normalized]
+        index.append((normalized, time.time()))
+        while len(index) > self.per_report:
+            evicted, _ = index.pop(0)
+            self._store.delete(report_key, 'q', _question_id(evicted))
+        self._store.set(index, report_key, 'index')
+
+    def get(self, report_key: str, question: str) -> Optional[str]:
+        normalized = self._normalized(question)
+        if normalized is None:
+            return None
+        answer = self._store.get(report_key, 'q', _question_id(normalized))
+        if answer is None:
+            grams = char_ngrams(normalized)
+            guards = guard_tokens(normalized)
+            best, best_score = None, self.similarity
+            for candidate, _ in self._index(report_key):
+                if guard_tokens(candidate) != guards:
+                    continue
+                score = ngram_similarity(grams, char_ngrams(candidate))
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is None:
+                return None
+            answer = self._store.get(report_key, 'q', _question_id(best))
+            if answer is None:
+                return None
+            normalized = best
+        self._touch(report_key, normalized)
+        return answer
+
+    def set(self, report_key: str, question: str, answer: str):
+        normalized = self._normalized(question)
+        if normalized is None or not answer:
+            return
+        self._store.set(answer, report_key, 'q', _question_id(normalized))
+        self._touch(report_key, normalized)
+
+    def invalidate(self, report_key: str):
+        """Forget every indexed answer for a report, e.g. after its analysis was rewritten."""
+        for normalized, _ in self._index(report_key):
+            self._store.delete(report_key, 'q', _question_id(normalized))
+        self._store.delete(report_key, 'index')
+
+
+chat_answer_cache = ChatAnswerCache(
+    per_report=settings.CHAT_ANSWER_CACHE_PER_REPORT,
+    ttl_s=settings.CHAT_ANSWER_CACHE_TTL,
+    similarity=settings.CHAT_ANSWER_CACHE_SIMILARITY,
+    min_tokens=settings.CHAT_ANSWER_CACHE_MIN_TOKENS,
+)
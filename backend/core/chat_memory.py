@@ -0,0 +1,124 @@
+import logging
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import ChatSession, ChatTurn
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+class ChatMemory:
+    """Bounded conversation memory for a ChatSession.
+
+    The prompt always consists of the rolling summary plus the unsummarized
+    tail of the conversation. After each exchange, turns that no longer fit in
+    the token budget are folded into the summary. Only the previous summary and
+    the newly evicted turns are sent to the summarizer, so the cost of keeping
+    memory is flat regardless of conversation length.
+    """
+
+    def __init__(self, session: ChatSession, summarizer=None, token_budget: Optional[int] = None):
+        self.session = session
+        self.summarizer = summarizer
+        self.token_budget = token_budget or settings.CHAT_HISTORY_TOKEN_BUDGET
+        self.summary_max_chars = settings.CHAT_SUMMARY_MAX_CHARS
+
+    def _recent_turns(self) -> List[ChatTurn]:
+        return list(
+            self.session.turns
+            .filter(seq__gt=self.session.summarized_until)
+            .only('seq', 'role', 'content', 'token_estimate')
+            .order_by('seq')
+        )
+
+    def context_messages(self) -> List[Dict[str, str]]:
+        """Chat messages (summary + recent turns) to place before the new question."""
+        messages = []
+        if self.session.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation: {self.session.summary}",
+            })
+        for turn in self._recent_turns():
+            role = "user" if turn.role == ChatTurn.ROLE_USER else "assistant"
+            messages.append({"role": role, "content": turn.content})
+        return messages
+
+    def record(self, question: str, answer: str):
+        """Persist one user/assistant exchange and compact the history if needed."""
+        with transaction.atomic():
+            session = ChatSession.objects.select_for_update().get(pk=self.session.pk)
+            next_seq = session.turn_count
+            ChatTurn.objects.bulk_create([
+                ChatTurn(session=session, seq=next_seq + 1, role=ChatTurn.ROLE_USER,
+                         content=question, token_estimate=estimate_tokens(question)),
+                ChatTurn(session=session, seq=next_seq + 2, role=ChatTurn.ROLE_ASSISTANT,
+                         content=answer, token_estimate=estimate_tokens(answer)),
+            ])
+            ChatSession.objects.filter(pk=session.pk).update(turn_count=F('turn_count') + 2)
+        self.session.refresh_from_db(fields=['turn_count', 'summary', 'summarized_until'])
+        self.compact()
+
+    def compact(self):
+        """Fold the oldest unsummarized turns into the summary until the tail fits the budget."""
+        turns = self._recent_turns()
+        total = sum(t.token_estimate for t in turns)
+        if total <= self.token_budget:
+            return
+
+        evicted = []
+        for turn in turns:
+            if total <= self.token_budget:
+                break
+            evicted.append(turn)
+            total -= turn.token_estimate
+        # Never split an exchange: keep evicting until the tail starts with a user turn
+        remaining = turns[len(evicted):]
+        while remaining and remaining[0].role != ChatTurn.ROLE_USER:
+            evicted.append(remaining.pop(0))
+
+        if not evicted:
+            return
+
+        new_summary = self._summarize(self.session.summary, evicted)
+        last_seq = evicted[-1].seq
+        updated = ChatSession.objects.filter(
+            pk=self.session.pk,
+            summarized_until=self.session.summarized_until,
+        ).update(summary=new_summary, summarized_until=last_seq)
+        if updated:
+            self.session.summary = new_summary
+            self.session.summarized_until = last_seq
+        else:
+            # A concurrent request compacted first; its summary wins
+            self.session.refresh_from_db(fields=['summary', 'summarized_until'])
+
+    def _summarize(self, previous_summary: str, turns: List[ChatTurn]) -> str:
+        transcript = [
+            {"role": "user" if t.role == ChatTurn.ROLE_USER else "assistant", "content": t.content}
+            for t in turns
+        ]
+        if self.summarizer:
+            try:
+                summary = self.summarizer.run(previous_summary, transcript)
+                if summary:
+                    return summary[:self.summary_max_chars]
+            except Exception as e:
+                logger.info("Chat summarization failed; using extractive fallback: %s", e)
+
+        # Extractive fallback keeps the most recent facts when the model is unavailable
+        lines = [previous_summary] if previous_summary else []
+        for item in transcript:
+            prefix = "User asked" if item["role"] == "user" else "Assistant said"
+            lines.append(f"{prefix}: {item['content'][:200]}")
+        return " ".join(lines)[-self.summary_max_chars:]
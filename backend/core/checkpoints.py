@@ -0,0 +1,89 @@
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AnalysisCheckpoint, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+# Pipeline steps in order, as run by core.orchestrator
+STEPS = ('visual_id', 'knowledge', 'usage', 'impact', 'recommendations', 'buy_link')
+# steps_completed markers meaning the step's output is in the report (default: the step name)
+STEP_DONE_MARKERS = {
+    'visual_id': ('visual_id', 'visual_id_cached'),
+    'buy_link': ('buy_link', 'buy_link_skipped_safety', 'buy_link_cached_deadline'),
+}
+
+
+def completed_steps(report: Any) -> List[str]:
+    """Steps whose output is already in `report`; a resume runs only the others."""
+    if not isinstance(report, dict):
+        return []
+    markers = set(report.get('steps_completed') or ())
+    if report.get('status') == 'failed':
+        return []
+    return [step for step in STEPS if markers.intersection(STEP_DONE_MARKERS.get(step, (step,)))]
+
+
+def is_resumable(report: Any) -> bool:
+    """Would a retry run anything? Low-confidence aborts are final."""
+    if isinstance(report, dict) and report.get('status') == 'aborted':
+        return False
+    return len(completed_steps(report)) < len(STEPS)
+
+
+def _lease_until():
+    return timezone.now() + timedelta(seconds=settings.ANALYSIS_CHECKPOINT_LEASE_S)
+
+
+def start_checkpoint(upload: UploadedImage, inputs: Dict[str, Any]) -> AnalysisCheckpoint:
+    """Create the checkpoint of a new analysis, leased to the run that creates it."""
+    return AnalysisCheckpoint.objects.create(upload=upload, inputs=inputs, lease_until=_lease_until())
+
+
+def claim_checkpoint(upload: UploadedImage) -> Optional[AnalysisCheckpoint]:
+    """Atomically lease the checkpoint for a retry; None if another run holds it (or none exists)."""
+    now = timezone.now()
+    claimed = (
+        AnalysisCheckpoint.objects
+        .filter(upload=upload)
+        .filter(Q(lease_until__isnull=True) | Q(lease_until__lt=now))
+        .update(lease_until=_lease_until(), attempts=F('attempts') + 1, updated_at=now)
+    )
+    if not claimed:
+        return None
+    return AnalysisCheckpoint.objects.filter(upload=upload).first()
+
+
+class CheckpointWriter:
+    """`checkpoint(report, step)` callback for Orchestrator.process/resume: one UPDATE per step."""
+
+    def __init__(self, checkpoint: AnalysisCheckpoint):
+        self.pk = checkpoint.pk
+
+    def __call__(self, report: Dict[str, Any], step: str):
+        AnalysisCheckpoint.objects.filter(pk=self.pk).update(
+            report=report, last_step=step, updated_at=timezone.now(),
+        )
+
+
+def finish_checkpoint(checkpoint: AnalysisCheckpoint, report: Any):
+    """After the final report is saved: drop the checkpoint, or keep it (unleased) for a retry."""
+    if not is_resumable(report):
+        AnalysisCheckpoint.objects.filter(pk=checkpoint.pk).delete()
+        return
+    updates = {'lease_until': None, 'updated_at': timezone.now()}
+    if isinstance(report, dict) and 'steps_completed' in report:
+        updates['report'] = report
+    # else the orchestrator raised: the last per-step checkpoint is what there is to resume from
+    AnalysisCheckpoint.objects.filter(pk=checkpoint.pk).update(**updates)
+    logger.info("Analysis %s kept resumable", checkpoint.upload_id, extra={"done": completed_steps(report)})
+
+
+def release_checkpoint(checkpoint: AnalysisCheckpoint):
+    """Give up a lease without running (e.g. the retry was shed by admission control)."""
+    AnalysisCheckpoint.objects.filter(pk=checkpoint.pk).update(lease_until=None)
@@ -0,0 +1,42 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_openai_client = None
+_openai_pid = None
+
+
+def get_openai_client():
+    """Process-wide OpenAI client (thread-safe), created on first use; None without an API key.
+
+    The `openai` package is imported here rather than at module import, and a
+    client inherited across fork() is never reused: its connection pool belongs
+    to the parent. The SDK's own retries are off: each one would restart the
+    deadline-capped timeout, and BaseAgent._routed already retries once on the
+    fallback model.
+    """
+    global _openai_client, _openai_pid
+    client = _openai_client
+    if client is not None and _openai_pid == os.getpid():
+        return client
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    with _lock:
+        if _openai_client is None or _openai_pid != os.getpid():
+            from openai import OpenAI
+
+            _openai_client = OpenAI(api_key=api_key, max_retries=0)
+            _openai_pid = os.getpid()
+        return _openai_client
+
+
+def reset_clients():
+    """Drop shared clients (call in a freshly forked worker)."""
+    global _openai_client, _openai_pid
+    with _lock:
+        _openai_client = None
+        _openai_pid = None
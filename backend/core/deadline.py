@@ -0,0 +1,46 @@
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when there is not enough of the request's time budget left to start a call."""
+
+
+class Deadline:
+    """Wall-clock budget of one analysis request.
+
+    Created in AnalyzeImageView and passed down through the orchestrator to the
+    agents and fetchers; each step caps its own timeout at what is left, so the
+    report is saved before the gunicorn worker timeout kills the request.
+    """
+
+    __slots__ = ('budget_s', 'expires_at')
+
+    def __init__(self, budget_s: float, started: Optional[float] = None):
+        self.budget_s = budget_s
+        self.expires_at = (time.monotonic() if started is None else started) + budget_s
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, needed_s: float) -> bool:
+        """Is there at least `needed_s` left?"""
+        return self.remaining() >= needed_s
+
+    def cap(self, timeout_s: float, min_s: float = 0.0) -> float:
+        """`timeout_s` shortened to the remaining budget; DeadlineExceeded if below `min_s`."""
+        remaining = self.remaining()
+        if remaining <= 0 or remaining < min_s:
+            raise DeadlineExceeded(f"{remaining:.1f}s of the {self.budget_s:.0f}s request budget left")
+        return min(timeout_s, remaining)
+
+    def elapsed_ms(self) -> int:
+        return int((self.budget_s - (self.expires_at - time.monotonic())) * 1000)
+
+
+def capped(timeout_s: float, deadline: Optional[Deadline], min_s: float = 0.0) -> float:
+    """`timeout_s` capped by `deadline` when there is one."""
+    return deadline.cap(timeout_s, min_s) if deadline is not None else timeout_s
@@ -0,0 +1,159 @@
+import re
+from typing import Dict, Optional, Pattern, Sequence, Tuple
+from urllib.parse import urlsplit
+
+# Case-sensitive on purpose: it keeps the literal-prefix fast path of the regex engine
+_FLAGS = re.DOTALL
+
+
+class ExtractionProfile:
+    """Precompiled price/image extraction rules for one marketplace or brand store.
+
+    `price_patterns` are tried in order and must capture the selling price in a
+    group named `amount` (optionally `currency`); they are anchored on the
+    site's buy-box markup so strike-through MRP/list prices are never matched.
+    `use_jsonld` says whether the site's JSON-LD Product offers are reliable.
+    """
+
+    __slots__ = ('name', 'price_patterns', 'image_patterns', 'currency', 'use_jsonld')
+
+    def __init__(self, name: str, price_patterns: Sequence[str] = (), image_patterns: Sequence[str] = (),
+                 currency: Optional[str] = None, use_jsonld: bool = True):
+        self.name = name
+        self.price_patterns: Tuple[Pattern, ...] = tuple(re.compile(p, _FLAGS) for p in price_patterns)
+        self.image_patterns: Tuple[Pattern, ...] = tuple(re.compile(p, _FLAGS) for p in image_patterns)
+        self.currency = currency
+        self.use_jsonld = use_jsonld
+
+    def with_currency(self, currency: str) -> 'ExtractionProfile':
+        clone = ExtractionProfile(self.name, use_jsonld=self.use_jsonld, currency=currency)
+        clone.price_patterns = self.price_patterns
+        clone.image_patterns = self.image_patterns
+        return clone
+
+
+_OG_IMAGE = r'<meta[^>]+property="og:image"[^>]+content="(?P<url>[^"]+)"'
+_ITEMPROP_PRICE = r'itemprop="price"[^>]*content="(?P<amount>[0-9][0-9.,]*)"'
+
+_AMAZON = ExtractionProfile(
+    'amazon',
+    price_patterns=(
+        # Buy box: the first a-offscreen inside the core price block is the deal price;
+        # the MRP sits in a separate a-text-price span marked data-a-strike
+        r'id="corePrice(?:Display_desktop)?_feature_div".{0,3000}?'
+        r'<span class="a-price(?![^"]*a-text-price)[^"]*"[^>]*>\s*<span class="a-offscreen">\s*'
+        r'(?P<currency>[^\d<\s]*)\s*(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+        r'"priceAmount"\s*:\s*(?P<amount>[0-9]+(?:\.[0-9]+)?)',
+        r'id="priceblock_(?:deal|our)price"[^>]*>\s*(?P<currency>[^\d<\s]*)\s*(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+    ),
+    image_patterns=(
+        r'id="landingImage"[^>]+data-old-hires="(?P<url>https?://[^"]+)"',
+        r'"hiRes"\s*:\s*"(?P<url>https?://[^"]+)"',
+        _OG_IMAGE,
+    ),
+    use_jsonld=False,
+)
+
+_FLIPKART = ExtractionProfile(
+    'flipkart',
+    price_patterns=(
+        # Selling price div; MRP uses a different (strike-through) class
+        r'<div class="(?:Nx9bqj|_30jeq3)[^"]*">\s*₹\s*(?P<amount>[0-9][0-9,]*)',
+        r'"finalPrice"\s*:\s*\{[^{}]*?"value"\s*:\s*(?P<amount>[0-9]+)',
+    ),
+    image_patterns=(_OG_IMAGE,),
+    currency='INR',
+)
+
+_EBAY = ExtractionProfile(
+    'ebay',
+    price_patterns=(
+        r'class="x-price-primary"[^>]*>.{0,400}?<span class="ux-textspans">\s*'
+        r'(?P<currency>[A-Z]{0,3}\s?[$£€]?)\s*(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+        _ITEMPROP_PRICE,
+    ),
+    image_patterns=(r'<div class="ux-image-carousel-item[^"]*"[^>]*>\s*<img[^>]+src="(?P<url>https?://[^"]+)"', _OG_IMAGE),
+)
+
+_WALMART = ExtractionProfile(
+    'walmart',
+    price_patterns=(
+        r'"currentPrice"\s*:\s*\{[^{}]*?"price"\s*:\s*(?P<amount>[0-9]+(?:\.[0-9]+)?)',
+        _ITEMPROP_PRICE,
+    ),
+    image_patterns=(_OG_IMAGE,),
+    currency='USD',
+)
+
+_BESTBUY = ExtractionProfile(
+    'bestbuy',
+    price_patterns=(
+        r'class="priceView-hero-price priceView-customer-price"[^>]*>\s*<span[^>]*>\s*\$(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+        r'"customerPrice"\s*:\s*(?P<amount>[0-9]+(?:\.[0-9]+)?)',
+    ),
+    image_patterns=(_OG_IMAGE,),
+    currency='USD',
+)
+
+_APPLE = ExtractionProfile(
+    'apple',
+    price_patterns=(
+        r'class="rc-prices-fullprice"[^>]*>\s*(?P<currency>[^\d<\s]*)\s*(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+        r'"dimensionPriceFrom"\s*:\s*"(?P<currency>[^\d"]*)(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+    ),
+    image_patterns=(_OG_IMAGE,),
+)
+
+_MYNTRA = ExtractionProfile(
+    'myntra',
+    price_patterns=(r'"discounted"\s*:\s*(?P<amount>[0-9]+)',),
+    image_patterns=(_OG_IMAGE,),
+    currency='INR',
+)
+
+_NIKE = ExtractionProfile(
+    'nike',
+    price_patterns=(
+        r'data-testid?="(?:currentPrice-container|product-price)"[^>]*>\s*(?P<currency>[^\d<\s]*)\s*(?P<amount>[0-9][0-9,]*(?:\.[0-9]{1,2})?)',
+    ),
+    image_patterns=(_OG_IMAGE,),
+)
+
+# Stores whose JSON-LD / meta tags are reliable: no custom patterns needed
+_JSONLD_STORE = ExtractionProfile('jsonld-store', image_patterns=(_OG_IMAGE,))
+
+_AMAZON_CURRENCIES = {
+    'amazon.in': 'INR', 'amazon.com': 'USD', 'amazon.co.uk': 'GBP', 'amazon.de': 'EUR',
+    'amazon.fr': 'EUR', 'amazon.it': 'EUR', 'amazon.es': 'EUR', 'amazon.ca': 'CAD',
+    'amazon.com.au': 'AUD', 'amazon.ae': 'AED', 'amazon.co.jp': 'JPY',
+}
+
+PROFILES: Dict[str, ExtractionProfile] = {
+    **{host: _AMAZON.with_currency(cur) for host, cur in _AMAZON_CURRENCIES.items()},
+    'flipkart.com': _FLIPKART,
+    'ebay.com': _EBAY, 'ebay.co.uk': _EBAY, 'ebay.de': _EBAY,
+    'walmart.com': _WALMART,
+    'bestbuy.com': _BESTBUY,
+    'apple.com': _APPLE,
+    'myntra.com': _MYNTRA,
+    'nike.com': _NIKE,
+    'samsung.com': _JSONLD_STORE,
+    'adidas.com': _JSONLD_STORE, 'adidas.co.in': _JSONLD_STORE,
+    'croma.com': _JSONLD_STORE,
+    'reliancedigital.in': _JSONLD_STORE,
+    'target.com': _JSONLD_STORE,
+}
+
+
+def profile_for_url(url: Optional[str]) -> Optional[ExtractionProfile]:
+    """Profile for the URL's host (ignoring www./m. and similar subdomains), or None."""
+    if not url:
+        return None
+    host = (urlsplit(url).hostname or '').lower()
+    # At most three dict lookups: full host, then drop leading labels (www.amazon.co.uk -> amazon.co.uk)
+    for _ in range(3):
+        profile = PROFILES.get(host)
+        if profile is not None or '.' not in host:
+            return profile
+        host = host.split('.', 1)[1]
+    return None
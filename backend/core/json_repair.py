@@ -0,0 +1,276 @@
+import json
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+
+
+def code_fence_blocks(text: str) -> List[str]:
+    """Contents of the ```json fenced blocks, largest first."""
+    return sorted(_FENCE.findall(text), key=len, reverse=True)
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """Top-level balanced {...} spans in `text` (string-aware), largest first.
+
+    An unterminated tail (output cut off by the token limit) is included as-is,
+    for the fixer to close.
+    """
+    spans = []
+    depth = 0
+    start = None
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = start is not None
+        elif ch == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                spans.append(text[start:i + 1])
+                start = None
+    if start is not None:
+        spans.append(text[start:])
+    yield from sorted(spans, key=len, reverse=True)
+
+
+def _outside_strings(text: str, fn) -> str:
+    """Apply `fn` to the parts of `text` that are not inside double-quoted strings."""
+    out, chunk = [], []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            out.append(fn(''.join(chunk)))
+            chunk = []
+            out.append(ch)
+            in_string = True
+        else:
+            chunk.append(ch)
+    out.append(fn(''.join(chunk)))
+    return ''.join(out)
+
+
+def _fix_bare(segment: str) -> str:
+    segment = re.sub(r"//[^\n]*", "", segment)
+    segment = re.sub(r"\b(True|False|None)\b", lambda m: _PY_LITERALS[m.group(1)], segment)
+    return _TRAILING_COMMA.sub(r"\1", segment)
+
+
+def _single_to_double_quotes(text: str) -> str:
+    """Rewrite 'single-quoted' strings (Python-style dicts) as JSON strings."""
+    out = []
+    i, n = 0, len(text)
+    in_string = escaped = False
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            out.append(ch)
+            in_string = True
+        elif ch == "'":
+            end = i + 1
+            while end < n and not (text[end] == "'" and text[end - 1] != '\\'):
+                end += 1
+            body = text[i + 1:end].replace("\\'", "'").replace('"', '\\"')
+            out.append(f'"{body}"')
+            i = end
+        else:
+            out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+def _close_truncated(text: str) -> str:
+    """Close an unterminated string and any open brackets (output hit the token limit)."""
+    stack = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]' and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r'[,:]\s*$', '', text.rstrip())
+    return text + ''.join(reversed(stack))
+
+
+def fix_common_errors(text: str) -> str:
+    text = text.translate(_SMART_QUOTES).strip()
+    if "'" in text:
+        text = _single_to_double_quotes(text)
+    text = _close_truncated(text)
+    return _outside_strings(text, _fix_bare)
+
+
+def _candidates(text: str) -> Iterator[str]:
+    seen = set()
+    for source in code_fence_blocks(text) + [text]:
+        for candidate in iter_json_objects(source):
+            if candidate not in seen:
+                seen.add(candidate)
+                yield candidate
+
+
+def parse_json_lenient(text: str, accept: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, str]:
+    """Parse model output that should be a JSON object.
+
+    Returns (value, how) where `how` is 'clean' when the text was valid JSON and
+    'local' when it needed fence stripping / extraction / syntax fixes. Every
+    {...} candidate (fenced blocks first, largest first) is tried until one parses
+    and passes `accept`; failing that, the first one that parsed is returned.
+    Raises ValueError when nothing parseable is found.
+    """
+    if text is None:
+        raise ValueError("Empty model output")
+    parsed = []
+    try:
+        parsed.append((json.loads(text), 'clean'))
+    except (json.JSONDecodeError, TypeError):
+        pass
+    else:
+        if accept is None or accept(parsed[0][0]):
+            return parsed[0]
+
+    error = None
+    for candidate in _candidates(text):
+        for attempt in (candidate, fix_common_errors(candidate)):
+            try:
+                value = json.loads(attempt)
+            except json.JSONDecodeError as e:
+                error = error or e
+                continue
+            if accept is None or accept(value):
+                return value, 'local'
+            parsed.append((value, 'local'))
+            break
+    if parsed:
+        return parsed[0]
+    if error is None:
+        raise ValueError("No JSON object found in model output")
+    raise ValueError(f"Could not repair JSON: {error}")
+
+
+class Field:
+    """Expected type of one output field, with coercion and a default for missing/invalid values.
+
+    kind: 'str', 'float', 'bool', 'list' (of strings) or 'objects' (list of dicts
+    described by `item`). `choices` maps synonyms onto allowed values for enums.
+    """
+
+    __slots__ = ('kind', 'default', 'nullable', 'choices', 'bounds', 'item', 'required')
+
+    def __init__(self, kind: str, default: Any = None, nullable: bool = False,
+                 choices: Optional[Dict[str, str]] = None, bounds: Optional[Tuple[float, float]] = None,
+                 item: Optional[Dict[str, 'Field']] = None, required: Sequence[str] = ()):
+        self.kind = kind
+        self.default = default
+        self.nullable = nullable
+        self.choices = choices
+        self.bounds = bounds
+        self.item = item
+        # For 'objects': entries missing any of these keys are dropped
+        self.required = tuple(required)
+
+    def fallback(self):
+        return list(self.default) if isinstance(self.default, list) else self.default
+
+    def coerce(self, value):
+        if value is None:
+            return None if self.nullable else self.fallback()
+        try:
+            if self.kind == 'str':
+                value = value if isinstance(value, str) else (json.dumps(value) if isinstance(value, (dict, list)) else str(value))
+                value = value.strip()
+                if self.choices is not None:
+                    return self.choices.get(value.lower(), self.fallback())
+                return value
+            if self.kind == 'float':
+                if isinstance(value, str):
+                    pct = value.strip().endswith('%')
+                    value = float(value.strip().rstrip('%'))
+                    value = value / 100 if pct and self.bounds == (0.0, 1.0) else value
+                value = float(value)
+                if self.bounds:
+                    value = min(max(value, self.bounds[0]), self.bounds[1])
+                return value
+            if self.kind == 'bool':
+                if isinstance(value, str):
+                    return value.strip().lower() in ('true', 'yes', '1', 'y')
+                return bool(value)
+            if self.kind == 'list':
+                if isinstance(value, str):
+                    value = [value] if value.strip() else []
+                return [v if isinstance(v, str) else json.dumps(v) if isinstance(v, (dict, list)) else str(v)
+                        for v in value if v is not None]
+            if self.kind == 'objects':
+                if isinstance(value, dict):
+                    value = [value]
+                items = []
+                for entry in value:
+                    if not isinstance(entry, dict):
+                        continue
+                    coerced = coerce_to_schema(entry, self.item or {})
+                    if all(coerced.get(key) for key in self.required):
+                        items.append(coerced)
+                return items
+        except (TypeError, ValueError):
+            return self.fallback()
+        return value
+
+
+def coerce_to_schema(data: Dict[str, Any], schema: Dict[str, Field]) -> Dict[str, Any]:
+    """Coerce declared fields (filling defaults for missing ones); undeclared keys pass through."""
+    out = dict(data)
+    for key, field in schema.items():
+        out[key] = field.coerce(data.get(key))
+    return out
+
+
+def matches_schema(data: Any, schema: Dict[str, Field]) -> bool:
+    """Loose shape check: a dict carrying at least half of the declared fields (or an error)."""
+    if not isinstance(data, dict):
+        return False
+    if not schema or 'error' in data:
+        return True
+    present = sum(1 for key in schema if key in data)
+    return present * 2 >= len(schema)
@@ -0,0 +1,184 @@
+import atexit
+import json
+import logging
+import numbers
+import os
+import queue
+import random
+import reprlib
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from .metrics import metrics
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+
+def _truncate(text: str, limit: int) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}...[+{len(text) - limit} chars]"
+    return text
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any `extra=` fields and exc.
+
+    Every field is capped at `max_field_chars` (the message at `max_message_chars`),
+    so a stray dict or page body cannot blow up a log line.
+    """
+
+    def __init__(self, max_field_chars: int = 512, max_message_chars: int = 2000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_field_chars = int(max_field_chars)
+        self.max_message_chars = int(max_message_chars)
+
+    def _field(self, value):
+        if isinstance(value, (bool, int, float, type(None))):
+            return value
+        if isinstance(value, (dict, list, tuple)):
+            text = json.dumps(value, default=str, ensure_ascii=False)
+            if len(text) <= self.max_field_chars:
+                return value
+        else:
+            text = str(value)
+        return _truncate(text, self.max_field_chars)
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': _truncate(record.getMessage(), self.max_message_chars),
+            'pid': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = self._field(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = _truncate(record.exc_text, self.max_message_chars * 2)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of high-volume records; WARNING and above always pass.
+
+    `debug_rate` applies to DEBUG records; `rates` maps logger-name prefixes to the
+    fraction kept of their records below WARNING (longest prefix wins).
+    """
+
+    def __init__(self, debug_rate: float = 1.0, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.debug_rate = float(debug_rate)
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _rate(self, record: logging.LogRecord) -> float:
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return float(rate)
+        return self.debug_rate if record.levelno <= logging.DEBUG else 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        metrics.incr('log.sampled_out', label=record.name)
+        return False
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to a background writer thread that formats and writes them.
+
+    The calling thread only snapshots the record and enqueues it (never blocks:
+    when the queue is full the record is dropped and counted in `log.dropped`).
+    Message interpolation and JSON encoding happen on the writer thread. The
+    writer is started lazily per process, so it survives gunicorn's preload/fork.
+    """
+
+    _repr = reprlib.Repr()
+    _repr.maxstring = 400
+    _repr.maxother = 400
+    _repr.maxdict = _repr.maxlist = 20
+    _repr.maxlevel = 3
+
+    def __init__(self, stream: str = 'stderr', maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize=int(maxsize)))
+        self.target = logging.StreamHandler(sys.stdout if stream == 'stdout' else sys.stderr)
+        self._listener: Optional[QueueListener] = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting is done by the writer thread's handler
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            # A listener inherited across fork() has no thread behind it: start a fresh one
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+            atexit.register(self.flush_and_stop)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep formatting lazy, but snapshot mutable args now (bounded repr) since the
+        # caller may change them before the writer runs; tracebacks must be rendered here.
+        record = logging.makeLogRecord(record.__dict__)
+        if isinstance(record.args, dict) and '%(' in str(record.msg):
+            record.args = {k: self._snapshot(v) for k, v in record.args.items()}
+        elif isinstance(record.args, dict):
+            # LogRecord unwraps a lone dict argument; it is a plain %s value here
+            record.args = (self._snapshot(record.args),)
+        elif record.args:
+            record.args = tuple(self._snapshot(a) for a in record.args)
+        for key, value in record.__dict__.items():
+            # `extra=` containers are copied so later mutation by the caller cannot leak in
+            if key not in _RECORD_ATTRS and isinstance(value, (dict, list)):
+                record.__dict__[key] = value.copy()
+        if record.exc_info:
+            formatter = self.target.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    @classmethod
+    def _snapshot(cls, value):
+        if isinstance(value, _PRIMITIVES) or isinstance(value, numbers.Number):
+            return value
+        if isinstance(value, (dict, list, tuple, set, frozenset)):
+            return cls._repr.repr(value)
+        return _truncate(str(value), cls._repr.maxother * 5)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr('log.dropped', label=record.name)
+
+    def emit(self, record: logging.LogRecord):
+        self._ensure_listener()
+        super().emit(record)
+
+    def flush_and_stop(self):
+        listener = self._listener
+        if listener is not None and self._listener_pid == os.getpid():
+            self._listener_pid = None
+            listener.stop()
+            self.target.flush()
+
+    def close(self):
+        self.flush_and_stop()
+        super().close()
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.prices import build_refresher
+
+
+class Command(BaseCommand):
+    help = "Refresh recently shown buy-link prices, oldest first, within a fetch budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help="Max page fetches per run")
+        parser.add_argument('--host-interval', type=float, help="Min seconds between fetches to one host")
+        parser.add_argument('--max-per-host', type=int, help="Max fetches per host per run")
+        parser.add_argument(
+            '--loop', type=float, default=0,
+            help="Keep running, sleeping this many seconds between runs (0 = run once)",
+        )
+
+    def handle(self, *args, **options):
+        refresher = build_refresher(
+            budget=options['budget'],
+            host_interval_s=options['host_interval'],
+            max_per_host=options['max_per_host'],
+        )
+        while True:
+            stats = refresher.run()
+            self.stdout.write(
+                f"Fetched {stats['fetched']} pages across {stats['hosts']} hosts: "
+                f"{stats['priced']} priced, {stats['failed']} failed; pruned {stats['pruned']} unused links"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
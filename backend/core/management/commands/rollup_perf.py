@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core.perf import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Refresh daily pipeline performance rollups (incremental by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Recompute the last N days instead of only changed days")
+        parser.add_argument('--day', action='append', type=date.fromisoformat, help="Recompute this day (YYYY-MM-DD); repeatable")
+
+    def handle(self, *args, **options):
+        results = refresh_rollups(days=options['day'], last_days=options['days'])
+        for day, analyses in results.items():
+            self.stdout.write(f"{day}: {analyses} analyses")
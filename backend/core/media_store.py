@@ -0,0 +1,172 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.urls import reverse
+
+from .models import MediaObject
+
+logger = logging.getLogger(__name__)
+
+_STORE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="media-store")
+
+_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+_CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+
+def _object_name(digest: str, ext: str) -> str:
+    # Two levels of fan-out keep directories small
+    return f"cas/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def _thumbnail_name(digest: str, size: int) -> str:
+    return f"cas/thumbs/{digest[:2]}/{digest}_{size}.webp"
+
+
+def acquire(digest: str) -> Optional[MediaObject]:
+    """Take a reference on the MediaObject already stored for `digest`; None if there is none."""
+    with transaction.atomic():
+        # Blocks while release() of this digest holds the row; 0 rows once it has committed
+        if MediaObject.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1):
+            return MediaObject.objects.get(digest=digest)
+    return None
+
+
+def store_image(data: bytes, image_format: str, digest: Optional[str] = None) -> MediaObject:
+    """Store image bytes once per digest and take a reference on the MediaObject."""
+    digest = digest or hashlib.sha256(data).hexdigest()
+    for _ in range(2):
+        media = acquire(digest)
+        if media is not None:
+            return media
+
+        # Always written afresh: a file left under this name may belong to a release() whose
+        # deletion is still pending, so storage picks a free name rather than reusing it
+        name = default_storage.save(_object_name(digest, _EXTENSIONS.get(image_format, 'bin')), ContentFile(bytes(data)))
+        try:
+            with transaction.atomic():
+                media = MediaObject.objects.create(
+                    digest=digest,
+                    file=name,
+                    content_type=_CONTENT_TYPES.get(image_format, ''),
+                    size=len(data),
+                    ref_count=1,
+                )
+            schedule_thumbnails(media)
+            return media
+        except IntegrityError:
+            # Another request stored the same image first; take a reference on theirs
+            _delete_files([name])
+            continue
+    raise RuntimeError(f"Could not store media object {digest}")
+
+
+def store_image_async(data, image_format: str, digest: Optional[str] = None) -> Future:
+    """Run store_image on a worker thread so the disk write overlaps the model calls."""
+    def run():
+        try:
+            return store_image(data, image_format, digest=digest)
+        finally:
+            connection.close()
+    return _STORE_EXECUTOR.submit(run)
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.info("Could not delete media file %s: %s", name, e)
+
+
+def release(media_id: int):
+    """Drop one reference; the file and its thumbnails are deleted with the last one.
+
+    The files are deleted only once the caller's transaction commits, so a rollback
+    keeps both the row and its files. A concurrent store_image of the same digest
+    waits on its ref_count UPDATE until then, finds no row and writes a new file
+    under a free name; it never picks up one of the files about to be deleted.
+    """
+    with transaction.atomic():
+        media = MediaObject.objects.select_for_update().filter(pk=media_id).first()
+        if media is None:
+            return
+        if media.ref_count > 1:
+            MediaObject.objects.filter(pk=media_id).update(ref_count=F('ref_count') - 1)
+            return
+        names = [media.file.name, *media.thumbnails.values()]
+        media.delete()
+        transaction.on_commit(lambda: _delete_files(names))
+
+
+def ensure_thumbnail(media: MediaObject, size: int) -> Optional[str]:
+    """Return the storage name of the WebP thumbnail, rendering it on first use."""
+    key = str(size)
+    if key in media.thumbnails:
+        return media.thumbnails[key]
+    if size not in settings.MEDIA_THUMBNAIL_SIZES:
+        return None
+
+    from PIL import Image
+
+    with default_storage.open(media.file.name, 'rb') as source:
+        img = Image.open(source)
+        img.thumbnail((size, size))
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='WEBP', quality=80, method=4)
+    # Like the original, never reuse a leftover file that a pending release() may delete
+    name = default_storage.save(_thumbnail_name(media.digest, size), ContentFile(buffer.getvalue()))
+
+    with transaction.atomic():
+        locked = MediaObject.objects.select_for_update().get(pk=media.pk)
+        if key in locked.thumbnails:
+            # Rendered concurrently; keep the recorded one
+            _delete_files([name])
+            name = locked.thumbnails[key]
+        else:
+            locked.thumbnails[key] = name
+            locked.save(update_fields=['thumbnails'])
+    media.thumbnails[key] = name
+    return name
+
+
+def _render_all(media_id: int):
+    try:
+        media = MediaObject.objects.filter(pk=media_id).first()
+        if media is None:
+            return
+        for size in settings.MEDIA_THUMBNAIL_SIZES:
+            try:
+                ensure_thumbnail(media, size)
+            except Exception as e:
+                logger.info("Thumbnail %s for %s failed: %s", size, media.digest[:12], e)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnails(media: MediaObject):
+    """Render thumbnails off the request thread once the row is committed."""
+    def start():
+        threading.Thread(target=_render_all, args=(media.pk,), daemon=True, name="thumbnails").start()
+    transaction.on_commit(start)
+
+
+def thumbnail_urls(media: Optional[MediaObject], request=None) -> Dict[str, str]:
+    """Thumbnail URLs by size. Missing renditions are produced lazily by the thumbnail view."""
+    if media is None:
+        return {}
+    urls = {}
+    for size in settings.MEDIA_THUMBNAIL_SIZES:
+        path = reverse('media_thumbnail', kwargs={'digest': media.digest, 'size': size})
+        urls[str(size)] = request.build_absolute_uri(path) if request else path
+    return urls
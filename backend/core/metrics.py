@@ -0,0 +1,66 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+
+class RollingStats:
+    """Count/total/max plus percentiles over the most recent samples."""
+
+    def __init__(self, window: int = 512):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self._samples)
+
+        def pct(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "avg": (self.total / self.count) if self.count else 0.0,
+            "max": self.max,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+        }
+
+
+class MetricsRegistry:
+    """Process-local counters and latency stats, grouped by name and label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._stats = defaultdict(RollingStats)
+
+    def incr(self, name: str, label: str = '', amount: int = 1):
+        with self._lock:
+            self._counters[(name, label)] += amount
+
+    def observe(self, name: str, value: float, label: str = ''):
+        with self._lock:
+            self._stats[(name, label)].add(value)
+
+    def snapshot(self, prefix: str = '') -> Dict[str, Dict]:
+        with self._lock:
+            out: Dict[str, Dict] = defaultdict(dict)
+            for (name, label), value in self._counters.items():
+                if name.startswith(prefix):
+                    out[name][label or '_'] = value
+            for (name, label), stats in self._stats.items():
+                if name.startswith(prefix):
+                    out[name][label or '_'] = stats.snapshot()
+            return dict(out)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,62 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only when brotli is not installed
+    brotli = None
+
+_ACCEPTS_BR = re.compile(r'\bbr\b')
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+_COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript')
+
+
+class CompressionMiddleware:
+    """Brotli/gzip-compress API responses above RESPONSE_COMPRESS_MIN_BYTES.
+
+    Brotli is preferred when the client accepts it and the package is installed.
+    Streaming and already-encoded responses (WhiteNoise serves pre-compressed
+    static files) are left alone, as are paths in RESPONSE_COMPRESS_EXCLUDE
+    (auth endpoints return tokens; compressing them next to reflected input
+    invites BREACH-style attacks).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not settings.RESPONSE_COMPRESSION or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESS_MIN_BYTES:
+            return response
+        if not response.get('Content-Type', '').startswith(_COMPRESSIBLE_TYPES):
+            return response
+        if request.path.startswith(tuple(settings.RESPONSE_COMPRESS_EXCLUDE)):
+            return response
+
+        # Whatever is chosen, caches must key on Accept-Encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and _ACCEPTS_BR.search(accepted):
+            encoding = 'br'
+            body = brotli.compress(response.content, quality=settings.RESPONSE_BROTLI_QUALITY)
+        elif _ACCEPTS_GZIP.search(accepted):
+            encoding = 'gzip'
+            body = gzip.compress(response.content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+        else:
+            return response
+        if len(body) >= len(response.content):
+            return response
+
+        response.content = body
+        response['Content-Length'] = str(len(body))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # The representation changed, so a strong validator no longer holds
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_remove_uploadedimage_user_email_delete_chathistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('summary', models.TextField(blank=True, default='')),
+                ('summarized_until', models.PositiveIntegerField(default=0)),
+                ('turn_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_sessions', to='core.uploadedimage')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChatTurn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField()),
+                ('role', models.CharField(choices=[('u', 'User'), ('a', 'Assistant')], max_length=1)),
+                ('content', models.TextField()),
+                ('token_estimate', models.PositiveIntegerField(default=0)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turns', to='core.chatsession')),
+            ],
+            options={
+                'ordering': ['seq'],
+                'constraints': [models.UniqueConstraint(fields=('session', 'seq'), name='uniq_chat_turn_seq')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_chatsession_chatturn'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='status',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=models.Index(fields=['user', '-uploaded_at', '-id'], name='upload_user_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_uploadedimage_history_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='brand',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='category',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='impact_score',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='risk_level',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='uploadedimage',
+            name='product_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,114 @@
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+FIELDS = ['status', 'product_name', 'category', 'brand', 'risk_level', 'impact_score', 'confidence']
+
+
+def _as_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_product_fields(apps, schema_editor):
+    # Frozen copy of core.models.summary_fields_from_report; also fills 0006's status/product_name
+    UploadedImage = apps.get_model('core', 'UploadedImage')
+    batch = []
+    for upload in UploadedImage.objects.only('id', 'analysis_report').iterator(chunk_size=BATCH_SIZE):
+        report = upload.analysis_report if isinstance(upload.analysis_report, dict) else {}
+        data = report.get('data') or {}
+        summary = data.get('product_summary') or {}
+        impact = data.get('impact') or {}
+        upload.status = str(report.get('status') or '')[:20]
+        upload.product_name = str(summary.get('product_name') or '')[:255]
+        upload.category = str(summary.get('category') or '')[:255]
+        upload.brand = str(summary.get('brand') or '')[:255]
+        upload.risk_level = str(impact.get('risk_level') or '')[:10].lower()
+        upload.impact_score = _as_float(impact.get('impact_score'))
+        upload.confidence = _as_float(summary.get('confidence'))
+        batch.append(upload)
+        if len(batch) >= BATCH_SIZE:
+            UploadedImage.objects.bulk_update(batch, FIELDS)
+            batch = []
+    if batch:
+        UploadedImage.objects.bulk_update(batch, FIELDS)
+
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS core_uploadedimage_fts USING fts5(
+        product_name, category, brand,
+        content='core_uploadedimage', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS core_uploadedimage_fts_ai AFTER INSERT ON core_uploadedimage BEGIN
+        INSERT INTO core_uploadedimage_fts(rowid, product_name, category, brand)
+        VALUES (new.id, new.product_name, new.category, new.brand);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_uploadedimage_fts_ad AFTER DELETE ON core_uploadedimage BEGIN
+        INSERT INTO core_uploadedimage_fts(core_uploadedimage_fts, rowid, product_name, category, brand)
+        VALUES ('delete', old.id, old.product_name, old.category, old.brand);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_uploadedimage_fts_au AFTER UPDATE OF product_name, category, brand
+        ON core_uploadedimage BEGIN
+        INSERT INTO core_uploadedimage_fts(core_uploadedimage_fts, rowid, product_name, category, brand)
+        VALUES ('delete', old.id, old.product_name, old.category, old.brand);
+        INSERT INTO core_uploadedimage_fts(rowid, product_name, category, brand)
+        VALUES (new.id, new.product_name, new.category, new.brand);
+    END""",
+    "INSERT INTO core_uploadedimage_fts(core_uploadedimage_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS core_uploadedimage_fts_au",
+    "DROP TRIGGER IF EXISTS core_uploadedimage_fts_ad",
+    "DROP TRIGGER IF EXISTS core_uploadedimage_fts_ai",
+    "DROP TABLE IF EXISTS core_uploadedimage_fts",
+]
+
+# Must match the expression used by core.search exactly for the planner to use it
+POSTGRES_FTS = [
+    """CREATE INDEX IF NOT EXISTS core_uploadedimage_search_gin ON core_uploadedimage USING GIN (
+        to_tsvector('simple', coalesce(product_name, '') || ' ' || coalesce(category, '') || ' ' || coalesce(brand, ''))
+    )""",
+]
+
+POSTGRES_FTS_DROP = ["DROP INDEX IF EXISTS core_uploadedimage_search_gin"]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FTS)
+    elif vendor == 'sqlite':
+        try:
+            _run(schema_editor, SQLITE_FTS)
+        except Exception:
+            # SQLite built without FTS5: core.search falls back to LIKE matching
+            _run(schema_editor, SQLITE_FTS_DROP)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FTS_DROP)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FTS_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_uploadedimage_product_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_fields, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:51
+
+import json
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 200
+
+
+def detach_web_context(apps, schema_editor):
+    """Move web_context out of existing reports into compressed ReportBlob rows."""
+    UploadedImage = apps.get_model('core', 'UploadedImage')
+    ReportBlob = apps.get_model('core', 'ReportBlob')
+    uploads, blobs = [], []
+
+    def flush():
+        ReportBlob.objects.bulk_create(blobs, ignore_conflicts=True)
+        UploadedImage.objects.bulk_update(uploads, ['analysis_report'])
+        uploads.clear()
+        blobs.clear()
+
+    for upload in UploadedImage.objects.only('id', 'analysis_report').iterator(chunk_size=BATCH_SIZE):
+        report = upload.analysis_report
+        if not isinstance(report, dict) or not isinstance(report.get('data'), dict):
+            continue
+        web_context = report['data'].pop('web_context', None)
+        if not web_context:
+            continue
+        raw = json.dumps(web_context, separators=(',', ':'), default=str).encode('utf-8')
+        blobs.append(ReportBlob(upload_id=upload.id, kind='web_context', codec='zlib',
+                                raw_size=len(raw), payload=zlib.compress(raw, 6)))
+        report['detached_sections'] = ['web_context']
+        uploads.append(upload)
+        if len(uploads) >= BATCH_SIZE:
+            flush()
+    if uploads:
+        flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_backfill_product_fields_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32)),
+                ('codec', models.CharField(max_length=8)),
+                ('raw_size', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_blobs', to='core.uploadedimage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('upload', 'kind'), name='uniq_report_blob_kind')],
+            },
+        ),
+        migrations.RunPython(detach_web_context, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_reportblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='cas/')),
+                ('content_type', models.CharField(blank=True, max_length=32)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('thumbnails', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='media',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='core.mediaobject'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_mediaobject'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=191, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.FloatField()),
+            ],
+        ),
+    ]
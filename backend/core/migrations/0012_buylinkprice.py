@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuyLinkPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField()),
+                ('url_hash', models.CharField(max_length=40, unique=True)),
+                ('host', models.CharField(db_index=True, max_length=255)),
+                ('price_display', models.CharField(blank=True, default='', max_length=64)),
+                ('price_amount', models.CharField(blank=True, default='', max_length=64)),
+                ('price_currency', models.CharField(blank=True, default='', max_length=16)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('priced_at', models.DateTimeField(blank=True, null=True)),
+                ('next_check_at', models.DateTimeField(blank=True, null=True)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_check_at'], name='buylinkprice_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_buylinkprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('canonical_id', models.CharField(max_length=191, unique=True)),
+                ('canonical_url', models.TextField()),
+                ('product_summary', models.JSONField(default=dict)),
+                ('image_url', models.TextField(blank=True, default='')),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_productidentity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('step', models.CharField(max_length=32)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('aborted', models.PositiveIntegerField(default=0)),
+                ('cache_hits', models.PositiveIntegerField(default=0)),
+                ('p50_ms', models.FloatField(blank=True, null=True)),
+                ('p90_ms', models.FloatField(blank=True, null=True)),
+                ('p95_ms', models.FloatField(blank=True, null=True)),
+                ('p99_ms', models.FloatField(blank=True, null=True)),
+                ('mean_ms', models.FloatField(blank=True, null=True)),
+                ('max_ms', models.FloatField(blank=True, null=True)),
+                ('cost_usd', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('last_upload_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day', 'step'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=models.Index(fields=['uploaded_at'], name='upload_uploaded_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='perfrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'step'), name='perfrollup_day_step_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_perfrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.JSONField(default=dict)),
+                ('inputs', models.JSONField(default=dict)),
+                ('last_step', models.CharField(blank=True, default='', max_length=32)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoint', to='core.uploadedimage')),
+            ],
+        ),
+    ]
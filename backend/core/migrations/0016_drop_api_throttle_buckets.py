@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def drop_api_buckets(apps, schema_editor):
+    # The general 'api' budget moved to the shared cache; only 'analyze' buckets stay in the table
+    RateLimitBucket = apps.get_model('core', 'RateLimitBucket')
+    RateLimitBucket.objects.filter(key__startswith='api:').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_analysischeckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_api_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:43
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_requested_at(apps, schema_editor):
+    # Existing links count as requested when they were found
+    BuyLinkPrice = apps.get_model('core', 'BuyLinkPrice')
+    BuyLinkPrice.objects.filter(last_requested_at__isnull=True).update(last_requested_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_drop_api_throttle_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buylinkprice',
+            name='last_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='buylinkprice',
+            index=models.Index(fields=['last_requested_at'], name='buylinkprice_requested_idx'),
+        ),
+        migrations.RunPython(backfill_last_requested_at, migrations.RunPython.noop),
+    ]
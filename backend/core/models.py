@@ -24,9 +24,53 @@ class User(AbstractUser):
         return self.email
 
 
+def _as_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def summary_fields_from_report(report):
+    """Denormalized column values for an analysis report, set whenever the report is saved.
+
+    Migration 0008 backfills existing rows with its own frozen copy of these rules.
+    """
+    report = report if isinstance(report, dict) else {}
+    data = report.get('data') or {}
+    summary = data.get('product_summary') or {}
+    impact = data.get('impact') or {}
+    return {
+        'status': str(report.get('status') or '')[:20],
+        'product_name': str(summary.get('product_name') or '')[:255],
+        'category': str(summary.get('category') or '')[:255],
+        'brand': str(summary.get('brand') or '')[:255],
+        'risk_level': str(impact.get('risk_level') or '')[:10].lower(),
+        'impact_score': _as_float(impact.get('impact_score')),
+        'confidence': _as_float(summary.get('confidence')),
+    }
+
+
+class MediaObject(models.Model):
+    """An uploaded image stored once under its SHA-256 digest and shared by reference."""
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='cas/', max_length=255)
+    content_type = models.CharField(max_length=32, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Thumbnail size (as string) -> storage name of the WebP rendition
+    thumbnails = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.ref_count} refs)"
+
+
 class UploadedImage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='images', null=True, blank=True)
     image = models.ImageField(upload_to='uploads/%Y/%m/%d/', null=True, blank=True)
+    # New uploads point `image` at the shared content-addressed file
+    media = models.ForeignKey(MediaObject, on_delete=models.SET_NULL, related_name='uploads', null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     
@@ -37,5 +81,222 @@ class UploadedImage(models.Model):
     cost_incurred = models.DecimalField(max_digits=10, decimal_places=4, default=0.0000)
     processing_time_ms = models.IntegerField(default=0)
 
+    # Denormalized from analysis_report so history listings and search never load the JSON
+    status = models.CharField(max_length=20, blank=True, default='')
+    product_name = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    category = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    brand = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    risk_level = models.CharField(max_length=10, blank=True, default='', db_index=True)
+    impact_score = models.FloatField(null=True, blank=True, db_index=True)
+    confidence = models.FloatField(null=True, blank=True)
+
+    SUMMARY_FIELDS = ('status', 'product_name', 'category', 'brand', 'risk_level', 'impact_score', 'confidence')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-uploaded_at', '-id'], name='upload_user_recent_idx'),
+            # Day-range scans by the perf rollup job (core.perf)
+            models.Index(fields=['uploaded_at'], name='upload_uploaded_at_idx'),
+        ]
+
+    def refresh_summary_fields(self):
+        """Copy list-view and search fields out of analysis_report."""
+        for field, value in summary_fields_from_report(self.analysis_report).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        if 'analysis_report' in self.__dict__:
+            self.refresh_summary_fields()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'analysis_report' in update_fields:
+                kwargs['update_fields'] = {*update_fields, *self.SUMMARY_FIELDS}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Image {self.id} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class ChatSession(models.Model):
+    """Server-side chat conversation about a single analysis report."""
+    report = models.ForeignKey(UploadedImage, on_delete=models.CASCADE, related_name='chat_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_sessions', null=True, blank=True)
+
+    # Rolling summary of every turn up to and including `summarized_until`
+    summary = models.TextField(blank=True, default='')
+    summarized_until = models.PositiveIntegerField(default=0)
+    turn_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chat {self.id} on Image {self.report_id}"
+
+
+class ChatTurn(models.Model):
+    ROLE_USER = 'u'
+    ROLE_ASSISTANT = 'a'
+
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='turns')
+    seq = models.PositiveIntegerField()
+    role = models.CharField(max_length=1, choices=[
+        (ROLE_USER, 'User'),
+        (ROLE_ASSISTANT, 'Assistant')
+    ])
+    content = models.TextField()
+    # Cached so the prompt window can be sized without re-measuring every turn
+    token_estimate = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['seq']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'seq'], name='uniq_chat_turn_seq'),
+        ]
+
+    def __str__(self):
+        return f"Turn {self.seq} ({self.role}) in Chat {self.session_id}"
+
+
+class ReportBlob(models.Model):
+    """Heavy report section (e.g. web_context) stored compressed outside analysis_report."""
+    upload = models.ForeignKey(UploadedImage, on_delete=models.CASCADE, related_name='report_blobs')
+    kind = models.CharField(max_length=32)
+    codec = models.CharField(max_length=8)
+    raw_size = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'kind'], name='uniq_report_blob_kind'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for Image {self.upload_id} ({self.codec}, {self.raw_size} bytes)"
+
+
+class AnalysisCheckpoint(models.Model):
+    """Partial report of an analysis that has not finished every step (see core.checkpoints).
+
+    Written after each pipeline step, so a killed worker or a failed step loses only
+    the step in flight; `POST history/<id>/retry/` resumes from it. Deleted once
+    every step has produced output.
+    """
+    upload = models.OneToOneField(UploadedImage, on_delete=models.CASCADE, related_name='checkpoint')
+    report = models.JSONField(default=dict)
+    # What identification needs if it has to run again: product_urls, image_path, image digest/format
+    inputs = models.JSONField(default=dict)
+    last_step = models.CharField(max_length=32, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=1)
+    # The run holding the checkpoint; a retry may claim it once this has passed
+    lease_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Checkpoint for Image {self.upload_id} after {self.last_step or 'start'} (attempt {self.attempts})"
+
+
+class RateLimitBucket(models.Model):
+    """/analyze/ token bucket shared by every worker process (see core.throttling.AnalyzeThrottle)."""
+    key = models.CharField(max_length=191, unique=True)
+    tokens = models.FloatField()
+    # Wall-clock seconds of the last refill; comparable across processes
+    updated_at = models.FloatField()
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
+
+
+class BuyLinkPrice(models.Model):
+    """Latest known price for a buy-link URL, kept current by `manage.py refresh_prices`."""
+    url = models.TextField()
+    url_hash = models.CharField(max_length=40, unique=True)
+    host = models.CharField(max_length=255, db_index=True)
+    price_display = models.CharField(max_length=64, blank=True, default='')
+    price_amount = models.CharField(max_length=64, blank=True, default='')
+    price_currency = models.CharField(max_length=16, blank=True, default='')
+    checked_at = models.DateTimeField(null=True, blank=True)
+    priced_at = models.DateTimeField(null=True, blank=True)
+    # Refresh queue position: new links (NULL) first, then the longest-due
+    next_check_at = models.DateTimeField(null=True, blank=True)
+    failures = models.PositiveIntegerField(default=0)
+    # Last time an analysis showed this link; only recently shown links are refreshed
+    last_requested_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_check_at'], name='buylinkprice_due_idx'),
+            models.Index(fields=['last_requested_at'], name='buylinkprice_requested_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.host}: {self.price_display or 'unknown'}"
+
+
+class ProductIdentity(models.Model):
+    """Prior identification result for a marketplace product id (see core.product_ids).
+
+    URL-only analyses of an already-identified product reuse this summary instead
+    of calling the vision/identification agent again.
+    """
+    canonical_id = models.CharField(max_length=191, unique=True)
+    canonical_url = models.TextField()
+    product_summary = models.JSONField(default=dict)
+    image_url = models.TextField(blank=True, default='')
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.canonical_id}: {self.product_summary.get('product_name', '')}"
+
+
+class PerfRollup(models.Model):
+    """One day's latency, error, abort, cache and cost aggregates for a pipeline step.
+
+    Built from UploadedImage rows by `manage.py rollup_perf` (core.perf); step
+    'pipeline' covers whole analyses. The admin dashboard reads only this table.
+    """
+    PIPELINE = 'pipeline'
+
+    day = models.DateField()
+    step = models.CharField(max_length=32)
+    samples = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    aborted = models.PositiveIntegerField(default=0)
+    cache_hits = models.PositiveIntegerField(default=0)
+    p50_ms = models.FloatField(null=True, blank=True)
+    p90_ms = models.FloatField(null=True, blank=True)
+    p95_ms = models.FloatField(null=True, blank=True)
+    p99_ms = models.FloatField(null=True, blank=True)
+    mean_ms = models.FloatField(null=True, blank=True)
+    max_ms = models.FloatField(null=True, blank=True)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    # Highest UploadedImage id included: the incremental refresh starts after it
+    last_upload_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day', 'step']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'step'], name='perfrollup_day_step_uniq'),
+        ]
+
+    def _rate(self, count):
+        return round(count / self.samples, 4) if self.samples else None
+
+    @property
+    def error_rate(self):
+        return self._rate(self.errors)
+
+    @property
+    def abort_rate(self):
+        return self._rate(self.aborted)
+
+    @property
+    def cache_hit_rate(self):
+        return self._rate(self.cache_hits)
+
+    def __str__(self):
+        return f"{self.day} {self.step}: p95 {self.p95_ms} ms over {self.samples}"
@@ -1,6 +1,10 @@
+import copy
 import logging
 import json
 import os
+import time
+from django.conf import settings
+
 from .agents import (
     VisualIdentificationAgent,
     KnowledgeEnrichmentAgent,
@@ -10,14 +14,39 @@ from .agents import (
     BuyLinkAgent
 )
 
-from .web_extract import fetch_url_html, extract_price_from_html
+from .buy_links import buy_link_cache
+from .checkpoints import STEPS, completed_steps
+from .deadline import DeadlineExceeded
+from .product_ids import remember_identity
 
 logger = logging.getLogger(__name__)
 
+# Only confident URL-based identifications are reused for later analyses
+PRODUCT_IDENTITY_MIN_CONFIDENCE = 0.6
+
+_BUY_LINKS_SKIPPED = {
+    "purchase_recommended": False,
+    "purchase_reason": "Purchase links were skipped to return the analysis in time. Try again for links.",
+    "buy_links": [],
+}
+
+
+class _StepClock:
+    """Records each step's wall time (ms) in report['meta']['timings_ms'] (read by core.perf rollups)."""
+
+    def __init__(self, report):
+        self.timings = report['meta'].setdefault('timings_ms', {})
+        self.started = time.monotonic()
+
+    def lap(self, step):
+        now = time.monotonic()
+        self.timings[step] = round((now - self.started) * 1000, 1)
+        self.started = now
+
 
 class Orchestrator:
     """Central orchestrator that controls the AI agent pipeline."""
-    
+
     def __init__(self):
         self.visual_agent = VisualIdentificationAgent()
         self.knowledge_agent = KnowledgeEnrichmentAgent()
@@ -26,68 +55,223 @@ class Orchestrator:
         self.recommendation_agent = RecommendationAgent()
         self.buy_agent = BuyLinkAgent()
 
-    def process(self, image_path, product_urls=None):
+    @property
+    def agents(self):
+        return (self.visual_agent, self.knowledge_agent, self.use_case_agent,
+                self.impact_agent, self.recommendation_agent, self.buy_agent)
+
+    def llm_cost_usd(self):
+        """Estimated model spend of this orchestrator's agents so far."""
+        return round(sum(getattr(agent, 'cost_usd', 0.0) for agent in self.agents), 6)
+
+    @staticmethod
+    def _skip_for_deadline(report, step, error_label=None):
+        """Record a stage dropped because the request's time budget ran out."""
+        report['steps_completed'].append(f"{step}_skipped_deadline")
+        if error_label:
+            report['errors'].append(f"{error_label}: skipped, request time budget exhausted")
+        logger.warning("Skipping %s: request time budget exhausted", step)
+
+    def _finish_meta(self, report, deadline, prior_cost=0.0):
+        report['meta']['llm_cost_usd'] = round(prior_cost + self.llm_cost_usd(), 6)
+        if deadline is not None:
+            report['meta']['deadline'] = {
+                "budget_s": deadline.budget_s,
+                "remaining_s": round(deadline.remaining(), 1),
+            }
+
+    @staticmethod
+    def _checkpoint(checkpoint, report, step):
+        # A failed checkpoint write must never fail the analysis itself
+        if checkpoint is None:
+            return
+        try:
+            checkpoint(report, step)
+        except Exception as e:
+            logger.warning("Checkpoint after %s failed: %s", step, e)
+
+    def process(self, image_path, product_urls=None, image_bytes=None, image_format=None, known_identity=None,
+                deadline=None, checkpoint=None):
         """
         Main execution flow.
+        `image_bytes` (already-validated upload bytes) takes precedence over `image_path`.
+        `known_identity` (a ProductIdentity matching `product_urls`) replaces visual
+        identification when there is no uploaded image.
+        `deadline` (core.deadline.Deadline) bounds every model call and page fetch;
+        when it runs short, recommendations are skipped and buy links come from cache
+        (recorded as `<step>_skipped_deadline` / `buy_link_cached_deadline`).
+        `checkpoint(report, step)` is called after every step (see core.checkpoints).
         Returns: Final structured JSON report.
         """
-        logger.info(f"Starting analysis for image: {image_path}, URLs: {product_urls}")
+        logger.info(
+            "Starting analysis",
+            extra={"image": image_path or None, "url_count": len(product_urls or [])},
+        )
+        logger.debug("Analysis input URLs", extra={"urls": list(product_urls or [])})
 
         if not os.getenv("OPENAI_API_KEY"):
             raise ValueError("OPENAI_API_KEY is missing. Set it in environment or .env.")
-        
+
         report = {
             "status": "processing",
             "steps_completed": [],
             "data": {},
-            "errors": []
+            "errors": [],
+            "meta": {}
         }
 
         if product_urls:
             report['data']['input_urls'] = list(product_urls)
+        return self._run(report, image_path, product_urls, image_bytes, image_format, known_identity,
+                         deadline, checkpoint)
 
-        # Step 1: Visual Identification
+    def resume(self, report, image_path=None, product_urls=None, image_bytes=None, image_format=None,
+               deadline=None, checkpoint=None):
+        """Continue a checkpointed (or finished but incomplete) report.
+
+        Steps whose output is already in the report are kept; only the others run,
+        in order. The image inputs are needed only when identification has not
+        succeeded yet. Model cost accumulates across attempts.
+        """
+        if not isinstance(report, dict) or not report.get('steps_completed'):
+            return self.process(image_path, product_urls=product_urls, image_bytes=image_bytes,
+                                image_format=image_format, deadline=deadline, checkpoint=checkpoint)
+        if not os.getenv("OPENAI_API_KEY"):
+            raise ValueError("OPENAI_API_KEY is missing. Set it in environment or .env.")
+
+        done = completed_steps(report)
+        report = copy.deepcopy(report)
+        report['status'] = "processing"
+        # Errors and deadline skips belong to the steps that are about to run again
+        report['errors'] = []
+        report['steps_completed'] = [m for m in report['steps_completed'] if not m.endswith('_skipped_deadline')]
+        report.pop('disclaimer', None)
+        meta = report.setdefault('meta', {})
+        meta['resumed'] = meta.get('resumed', 0) + 1
+        if 'visual_id' not in done:
+            # Identification runs again from scratch
+            report['data'].pop('product_summary', None)
+            report['data'].pop('web_context', None)
+            report['steps_completed'] = [m for m in report['steps_completed'] if m != 'web_context']
+        if product_urls and 'input_urls' not in report['data']:
+            report['data']['input_urls'] = list(product_urls)
+
+        logger.info("Resuming analysis", extra={"done": done, "attempt": meta['resumed'] + 1})
+        return self._run(report, image_path, product_urls, image_bytes, image_format, None,
+                         deadline, checkpoint, done=done, prior_cost=meta.get('llm_cost_usd') or 0.0)
+
+    def _run(self, report, image_path, product_urls, image_bytes, image_format, known_identity,
+             deadline, checkpoint, done=(), prior_cost=0.0):
+        clock = _StepClock(report)
+        for agent in self.agents:
+            agent.deadline = deadline
+
+        if 'visual_id' not in done:
+            proceed = self._visual_id(report, image_path, product_urls, image_bytes, image_format, known_identity)
+            clock.lap('visual_id')
+            if not proceed:
+                self._finish_meta(report, deadline, prior_cost)
+                self._checkpoint(checkpoint, report, 'visual_id')
+                return report
+            self._checkpoint(checkpoint, report, 'visual_id')
+
+        stages = {
+            'knowledge': self._knowledge,
+            'usage': self._usage,
+            'impact': self._impact,
+            'recommendations': self._recommendations,
+            'buy_link': self._buy_link,
+        }
+        for step in STEPS[1:]:
+            if step in done:
+                continue
+            stages[step](report, deadline)
+            clock.lap(step)
+            if step != STEPS[-1]:
+                # The last step's output is saved with the final report
+                self._checkpoint(checkpoint, report, step)
+
+        report['status'] = "complete"
+
+        # Inject mandatory disclaimer
+        report['disclaimer'] = (
+            "IMPORTANT: This report is generated by AI for informational purposes only. "
+            "It does not constitute medical, legal, or financial advice. "
+            "Always verify product safety labels and consult professionals."
+        )
+
+        self._finish_meta(report, deadline, prior_cost)
+        logger.info("Analysis complete", extra={"steps": report['steps_completed'], "status": report['status']})
+        if report['errors']:
+            logger.warning("Errors encountered", extra={"errors": report['errors']})
+
+        return report
+
+    @staticmethod
+    def _product(report):
+        summary = report['data'].get('product_summary', {})
+        return summary.get('product_name', 'Unknown Product'), summary.get('category', 'General')
+
+    def _visual_id(self, report, image_path, product_urls, image_bytes, image_format, known_identity):
+        """Step 1; returns False when the analysis stops here (aborted or failed)."""
         logger.info("Step 1: Running Visual Identification Agent...")
         try:
-            visual_data = self.visual_agent.run(image_path, product_urls=product_urls)
+            # A product already identified from one of these URLs needs no new identification
+            cached_identity = known_identity is not None and image_bytes is None
+            if cached_identity:
+                visual_data = dict(known_identity.product_summary)
+                logger.info("Reusing identification for %s", known_identity.canonical_id)
+            else:
+                visual_data = self.visual_agent.run(
+                    image_path,
+                    product_urls=product_urls,
+                    image_bytes=image_bytes,
+                    image_format=image_format,
+                )
             web_context = None
             if isinstance(visual_data, dict) and '_web_context' in visual_data:
                 web_context = visual_data.pop('_web_context', None)
-            logger.info(f"Visual ID result: {visual_data}")
-            
+            if isinstance(visual_data, dict) and '_vision' in visual_data:
+                # Which detail tier answered, and how long each took (for cascade tuning)
+                report['meta']['vision'] = visual_data.pop('_vision')
+            logger.debug("Visual ID result", extra={"visual_data": visual_data})
+
             # Check for API errors in response
             if "error" in visual_data:
                 raise ValueError(visual_data["error"])
-            
+
             report['data']['product_summary'] = visual_data
-            report['steps_completed'].append("visual_id")
+            report['steps_completed'].append("visual_id_cached" if cached_identity else "visual_id")
 
             if web_context:
                 report['data']['web_context'] = web_context
                 report['steps_completed'].append("web_context")
-            
+
             # Confidence handling: be lenient when running URL-only (no image)
             confidence = visual_data.get('confidence', 0)
-            has_image_input = bool(image_path)
+            has_image_input = bool(image_path) or image_bytes is not None
             if has_image_input and confidence < 0.5:
                 report['status'] = "aborted"
                 report['confidence_notice'] = "Low confidence in identification. Stopping analysis to save cost."
-                logger.warning(f"Aborting due to low confidence with image: {confidence}")
-                return report
+                logger.warning("Aborting due to low confidence with image: %s", confidence)
+                return False
             if (not has_image_input) and confidence < 0.35:
                 # Do not abort for URL-only; just record notice and continue with best-effort downstream
                 report['confidence_notice'] = "Low confidence from URL-only analysis; downstream steps may be less accurate."
-                logger.warning(f"Proceeding despite low confidence (URL-only): {confidence}")
+                logger.warning("Proceeding despite low confidence (URL-only): %s", confidence)
                 # Boost minimal confidence to avoid downstream hard stops
                 visual_data['confidence'] = max(confidence, 0.35)
                 report['data']['product_summary'] = visual_data
-            
-            product_name = visual_data.get('product_name', 'Unknown Product')
-            product_category = visual_data.get('category', 'General')
-            logger.info(f"Identified: {product_name} ({product_category})")
-            
+
+            if (not cached_identity and image_bytes is None and product_urls
+                    and visual_data.get('confidence', 0) >= PRODUCT_IDENTITY_MIN_CONFIDENCE):
+                remember_identity(product_urls, visual_data, image_url=image_path)
+
+            logger.info("Identified: %s (%s)", *self._product(report))
+            return True
+
         except Exception as e:
-            logger.error(f"Visual ID failed: {e}")
+            logger.error("Visual ID failed: %s", e)
             report['errors'].append(f"Visual ID error: {str(e)}")
             report['status'] = "failed"
             report['data']['product_summary'] = {
@@ -96,42 +280,48 @@ class Orchestrator:
                 "confidence": 0,
                 "error": str(e)
             }
-            return report
+            return False
 
-        # Step 2: Knowledge Enrichment
+    def _knowledge(self, report, deadline):
         logger.info("Step 2: Running Knowledge Enrichment Agent...")
+        product_name, product_category = self._product(report)
         try:
             enrichment_data = self.knowledge_agent.run({
-                "product_name": product_name, 
+                "product_name": product_name,
                 "category": product_category
             })
             if "error" not in enrichment_data:
                 report['data']['knowledge'] = enrichment_data
                 report['steps_completed'].append("knowledge")
             else:
-                logger.warning(f"Knowledge enrichment error: {enrichment_data['error']}")
+                logger.warning("Knowledge enrichment error: %s", enrichment_data['error'])
                 report['errors'].append(f"Knowledge: {enrichment_data['error']}")
+        except DeadlineExceeded:
+            self._skip_for_deadline(report, 'knowledge', "Knowledge")
         except Exception as e:
-            logger.error(f"Knowledge error: {e}")
+            logger.error("Knowledge error: %s", e)
             report['errors'].append(f"Knowledge error: {str(e)}")
 
-        # Step 3: Use Case Analysis
+    def _usage(self, report, deadline):
         logger.info("Step 3: Running Use Case Agent...")
+        product_name, _ = self._product(report)
         try:
             use_case_data = self.use_case_agent.run(product_name)
             if "error" not in use_case_data:
                 report['data']['usage'] = use_case_data
                 report['steps_completed'].append("usage")
             else:
-                logger.warning(f"Use case error: {use_case_data['error']}")
+                logger.warning("Use case error: %s", use_case_data['error'])
                 report['errors'].append(f"Usage: {use_case_data['error']}")
+        except DeadlineExceeded:
+            self._skip_for_deadline(report, 'usage', "Usage")
         except Exception as e:
-            logger.error(f"Use case error: {e}")
+            logger.error("Use case error: %s", e)
             report['errors'].append(f"Use case error: {str(e)}")
 
-        # Step 4: Impact Analysis
+    def _impact(self, report, deadline):
         logger.info("Step 4: Running Impact Analysis Agent...")
-        impact_data = {}
+        product_name, product_category = self._product(report)
         try:
             product_details = {
                 "name": product_name,
@@ -143,30 +333,40 @@ class Orchestrator:
                 report['data']['impact'] = impact_data
                 report['steps_completed'].append("impact")
             else:
-                logger.warning(f"Impact error: {impact_data['error']}")
+                logger.warning("Impact error: %s", impact_data['error'])
                 report['errors'].append(f"Impact: {impact_data['error']}")
+        except DeadlineExceeded:
+            self._skip_for_deadline(report, 'impact', "Impact")
         except Exception as e:
-            logger.error(f"Impact error: {e}")
+            logger.error("Impact error: %s", e)
             report['errors'].append(f"Impact error: {str(e)}")
 
-        # Step 5: Recommendations
+    def _recommendations(self, report, deadline):
+        # Optional: dropped when the time budget runs short
         logger.info("Step 5: Running Recommendation Agent...")
-        rec_data = {}
+        if deadline is not None and not deadline.allows(settings.ANALYZE_OPTIONAL_STAGE_MIN_S):
+            self._skip_for_deadline(report, 'recommendations')
+            return
+        product_name, _ = self._product(report)
         try:
-            rec_data = self.recommendation_agent.run(impact_data, product_name)
+            rec_data = self.recommendation_agent.run(report['data'].get('impact', {}), product_name)
             if "error" not in rec_data:
                 report['data']['recommendations'] = rec_data
                 report['steps_completed'].append("recommendations")
             else:
-                logger.warning(f"Recommendation error: {rec_data['error']}")
+                logger.warning("Recommendation error: %s", rec_data['error'])
                 report['errors'].append(f"Recommendations: {rec_data['error']}")
+        except DeadlineExceeded:
+            self._skip_for_deadline(report, 'recommendations')
         except Exception as e:
-            logger.error(f"Recommendation error: {e}")
+            logger.error("Recommendation error: %s", e)
             report['errors'].append(f"Recommendation error: {str(e)}")
 
-        # Step 6: Buy Links (Conditional on risk level)
+    def _buy_link(self, report, deadline):
+        # Conditional on risk level; served from cache when the time budget runs short
         logger.info("Step 6: Running Buy Link Agent...")
-        risk_level = report['data'].get('impact', {}).get('risk_level', 'low')
+        impact_data = report['data'].get('impact', {})
+        risk_level = impact_data.get('risk_level', 'low')
 
         if risk_level == 'high':
             report['data']['buy_guidance'] = {
@@ -176,58 +376,43 @@ class Orchestrator:
             }
             report['steps_completed'].append("buy_link_skipped_safety")
             logger.info("Buy links skipped due to high risk")
-        else:
-            try:
-                buy_request = {
-                    "product_name": product_name,
-                    "product_category": product_category,
-                    "brand": report['data'].get('knowledge', {}).get('brand') or report['data'].get('product_summary', {}).get('brand'),
-                    "recommendations": rec_data,
-                    "impact": impact_data,
-                }
-                buy_data = self.buy_agent.run(buy_request)
-                if "error" not in buy_data:
-                    # Best-effort: enrich each buy link with a price (scraped from the PDP)
-                    try:
-                        links = buy_data.get('buy_links') or []
-                        for link in links:
-                            url = link.get('link')
-                            if not url:
-                                continue
-                            html = fetch_url_html(url)
-                            price = extract_price_from_html(html or '') if html else None
-                            if price:
-                                link['price'] = price.get('display')
-                                link['price_amount'] = price.get('amount')
-                                link['price_currency'] = price.get('currency')
-                    except Exception as e:
-                        logger.info("Price enrichment failed: %s", e)
-
-                    report['data']['buy_guidance'] = buy_data
-                    report['steps_completed'].append("buy_link")
-                else:
-                    logger.warning(f"Buy link error: {buy_data['error']}")
-                    report['errors'].append(f"Buy: {buy_data['error']}")
-                    report['data']['buy_guidance'] = {
-                        "purchase_recommended": False,
-                        "purchase_reason": "Could not generate trustworthy direct purchase links.",
-                        "buy_links": []
-                    }
-            except Exception as e:
-                logger.error(f"Buy link error: {e}")
-                report['errors'].append(f"Buy link error: {str(e)}")
+            return
 
-        report['status'] = "complete"
-        
-        # Inject mandatory disclaimer
-        report['disclaimer'] = (
-            "IMPORTANT: This report is generated by AI for informational purposes only. "
-            "It does not constitute medical, legal, or financial advice. "
-            "Always verify product safety labels and consult professionals."
-        )
-        
-        logger.info(f"Analysis complete. Steps: {report['steps_completed']}")
-        if report['errors']:
-            logger.warning(f"Errors encountered: {report['errors']}")
-        
-        return report
+        product_name, product_category = self._product(report)
+        buy_request = {
+            "product_name": product_name,
+            "product_category": product_category,
+            "brand": report['data'].get('knowledge', {}).get('brand') or report['data'].get('product_summary', {}).get('brand'),
+            "recommendations": report['data'].get('recommendations', {}),
+            "impact": impact_data,
+        }
+        try:
+            if deadline is not None and not deadline.allows(settings.ANALYZE_OPTIONAL_STAGE_MIN_S):
+                raise DeadlineExceeded("not enough time left for a buy-link search")
+            buy_data, cache_status = buy_link_cache.get(self.buy_agent, buy_request, deadline=deadline)
+            if "error" not in buy_data:
+                if cache_status != 'miss':
+                    report['steps_completed'].append(f"buy_link_cache_{cache_status}")
+                report['data']['buy_guidance'] = buy_data
+                report['steps_completed'].append("buy_link")
+            else:
+                logger.warning("Buy link error: %s", buy_data['error'])
+                report['errors'].append(f"Buy: {buy_data['error']}")
+                report['data']['buy_guidance'] = {
+                    "purchase_recommended": False,
+                    "purchase_reason": "Could not generate trustworthy direct purchase links.",
+                    "buy_links": []
+                }
+        except DeadlineExceeded:
+            # Out of time: whatever the cache holds (even stale) beats no links
+            cached = buy_link_cache.cached(buy_request)
+            if cached is not None:
+                report['data']['buy_guidance'] = cached
+                report['steps_completed'].append("buy_link_cached_deadline")
+                logger.info("Buy links served from cache: request time budget exhausted")
+            else:
+                report['data']['buy_guidance'] = {**_BUY_LINKS_SKIPPED, "buy_links": []}
+                self._skip_for_deadline(report, 'buy_link')
+        except Exception as e:
+            logger.error("Buy link error: %s", e)
+            report['errors'].append(f"Buy link error: {str(e)}")
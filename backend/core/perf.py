@@ -0,0 +1,133 @@
+import logging
+import math
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .checkpoints import STEP_DONE_MARKERS, STEPS
+from .models import PerfRollup, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+# steps_completed markers that count as a cache hit for a step
+_CACHE_MARKERS = {
+    'visual_id': ('visual_id_cached',),
+    'buy_link': ('buy_link_cache_fresh', 'buy_link_cache_stale', 'buy_link_cached_deadline'),
+}
+_PIPELINE_CACHE_MARKERS = ('visual_id_cached', 'buy_link_cache_fresh', 'buy_link_cache_stale', 'buy_link_cached_deadline')
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile of an already sorted list."""
+    if not ordered:
+        return None
+    pos = (len(ordered) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return round(ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo), 1)
+
+
+class _Bucket:
+    __slots__ = ('latencies', 'samples', 'errors', 'aborted', 'cache_hits', 'cost')
+
+    def __init__(self):
+        self.latencies = []
+        self.samples = self.errors = self.aborted = self.cache_hits = 0
+        self.cost = Decimal('0')
+
+    def as_fields(self) -> Dict:
+        ordered = sorted(self.latencies)
+        return {
+            'samples': self.samples,
+            'errors': self.errors,
+            'aborted': self.aborted,
+            'cache_hits': self.cache_hits,
+            'p50_ms': percentile(ordered, 0.50),
+            'p90_ms': percentile(ordered, 0.90),
+            'p95_ms': percentile(ordered, 0.95),
+            'p99_ms': percentile(ordered, 0.99),
+            'mean_ms': round(sum(ordered) / len(ordered), 1) if ordered else None,
+            'max_ms': ordered[-1] if ordered else None,
+            'cost_usd': self.cost,
+        }
+
+
+def _day_bounds(day: date):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(day: date) -> int:
+    """Recompute (and replace) every rollup row for `day`; returns the number of analyses seen."""
+    start, end = _day_bounds(day)
+    # JSON key transforms: only meta and steps_completed are read, never the whole report
+    rows = (
+        UploadedImage.objects
+        .filter(uploaded_at__gte=start, uploaded_at__lt=end)
+        .exclude(analysis_report__isnull=True)
+        .values_list('id', 'status', 'processing_time_ms', 'cost_incurred',
+                     'analysis_report__meta__timings_ms', 'analysis_report__steps_completed')
+        .iterator(chunk_size=2000)
+    )
+
+    pipeline = _Bucket()
+    steps = {step: _Bucket() for step in STEPS}
+    last_id = 0
+    for pk, row_status, total_ms, cost, timings, completed in rows:
+        last_id = max(last_id, pk)
+        completed = set(completed or ())
+        pipeline.samples += 1
+        pipeline.latencies.append(float(total_ms or 0))
+        pipeline.cost += cost or 0
+        if row_status == 'failed':
+            pipeline.errors += 1
+        elif row_status == 'aborted':
+            pipeline.aborted += 1
+        if completed.intersection(_PIPELINE_CACHE_MARKERS):
+            pipeline.cache_hits += 1
+
+        for step, elapsed in (timings or {}).items():
+            bucket = steps.get(step)
+            if bucket is None:
+                continue
+            bucket.samples += 1
+            bucket.latencies.append(float(elapsed))
+            if not completed.intersection(STEP_DONE_MARKERS.get(step, (step,))):
+                bucket.errors += 1
+            if completed.intersection(_CACHE_MARKERS.get(step, ())):
+                bucket.cache_hits += 1
+
+    with transaction.atomic():
+        PerfRollup.objects.filter(day=day).delete()
+        PerfRollup.objects.bulk_create(
+            PerfRollup(day=day, step=name, last_upload_id=last_id, **bucket.as_fields())
+            for name, bucket in [(PerfRollup.PIPELINE, pipeline), *steps.items()]
+            if bucket.samples
+        )
+    return pipeline.samples
+
+
+def days_to_refresh(last_days: Optional[int] = None) -> List[date]:
+    """Days with analyses newer than the rollup watermark, plus today and yesterday.
+
+    Today and yesterday are always redone: analyses created before the last run
+    may have finished (and got their report) since.
+    """
+    today = timezone.localdate()
+    if last_days:
+        return [today - timedelta(days=n) for n in range(last_days - 1, -1, -1)]
+    watermark = PerfRollup.objects.aggregate(m=Max('last_upload_id'))['m'] or 0
+    days = set(UploadedImage.objects.filter(id__gt=watermark).dates('uploaded_at', 'day'))
+    days.update({today, today - timedelta(days=1)})
+    return sorted(days)
+
+
+def refresh_rollups(days: Optional[Iterable[date]] = None, last_days: Optional[int] = None) -> Dict[date, int]:
+    results = {}
+    for day in (days or days_to_refresh(last_days)):
+        results[day] = rollup_day(day)
+    logger.info("Perf rollups refreshed", extra={"days": len(results), "analyses": sum(results.values())})
+    return results
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import BuyLinkPrice
+from .web_extract import fetch_url_html, extract_price_from_html
+
+logger = logging.getLogger(__name__)
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha1(url.strip().encode('utf-8')).hexdigest()
+
+
+# last_requested_at is rewritten at most this often per link, not on every analysis
+_REQUESTED_AT_GRANULARITY = timedelta(hours=1)
+
+
+def register_links(links: Iterable[Dict[str, Any]]):
+    """Add buy-link URLs to the refresh table; already-known URLs are left untouched."""
+    rows = {}
+    now = timezone.now()
+    for link in links or []:
+        url = (link.get('link') or '').strip()
+        if url.startswith(('http://', 'https://')):
+            rows[url_hash(url)] = BuyLinkPrice(
+                url=url, url_hash=url_hash(url), host=urlsplit(url).hostname or '', last_requested_at=now,
+            )
+    if rows:
+        BuyLinkPrice.objects.bulk_create(rows.values(), ignore_conflicts=True)
+
+
+def apply_known_prices(buy_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill each buy link's price fields from the latest refreshed price (no network).
+
+    Marks the links as requested, which keeps them in the refresh set. Prices
+    older than PRICE_MAX_AGE_INTERVALS refresh intervals (a link whose refreshes
+    keep failing) are not shown; `price_checked_at` says how old a shown one is.
+    """
+    links = [link for link in buy_data.get('buy_links') or [] if link.get('link')]
+    if not links:
+        return buy_data
+    now = timezone.now()
+    hashes = [url_hash(link['link']) for link in links]
+    max_age = timedelta(seconds=settings.PRICE_REFRESH_INTERVAL_S * settings.PRICE_MAX_AGE_INTERVALS)
+    try:
+        BuyLinkPrice.objects.filter(url_hash__in=hashes).filter(
+            Q(last_requested_at__isnull=True) | Q(last_requested_at__lt=now - _REQUESTED_AT_GRANULARITY)
+        ).update(last_requested_at=now)
+        known = {
+            row.url_hash: row
+            for row in BuyLinkPrice.objects.filter(url_hash__in=hashes, priced_at__gte=now - max_age)
+        }
+    except Exception as e:
+        logger.info("Price lookup failed: %s", e)
+        return buy_data
+    for link in links:
+        row = known.get(url_hash(link['link']))
+        if row is not None:
+            link['price'] = row.price_display
+            link['price_amount'] = row.price_amount
+            link['price_currency'] = row.price_currency or None
+            link['price_checked_at'] = row.priced_at.isoformat()
+    return buy_data
+
+
+class PriceRefresher:
+    """Refreshes due buy-link prices within a fetch budget, politely per host.
+
+    Only links an analysis showed within `active_s` are refreshed; links not
+    shown for `prune_s` are deleted at the start of each run. Due rows are taken
+    in queue order (new links, then longest overdue) and fetched round-robin
+    across hosts, with at least `host_interval_s` between requests to one host
+    and at most `max_per_host` requests per host per run. Failures back off
+    exponentially so dead links stop eating the budget.
+    """
+
+    def __init__(self, budget: int, host_interval_s: float, max_per_host: int,
+                 refresh_interval_s: int, active_s: int, prune_s: int,
+                 fetch: Callable[[str], Optional[str]] = fetch_url_html,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.budget = budget
+        self.host_interval_s = host_interval_s
+        self.max_per_host = max_per_host
+        self.refresh_interval_s = refresh_interval_s
+        self.active_s = active_s
+        self.prune_s = prune_s
+        self.fetch = fetch
+        self.sleep = sleep
+
+    def prune(self) -> int:
+        cutoff = timezone.now() - timedelta(seconds=self.prune_s)
+        deleted, _ = BuyLinkPrice.objects.filter(last_requested_at__lt=cutoff).delete()
+        return deleted
+
+    def _due(self):
+        now = timezone.now()
+        rows = (
+            (BuyLinkPrice.objects.filter(next_check_at__isnull=True)
+             | BuyLinkPrice.objects.filter(next_check_at__lte=now))
+            .filter(last_requested_at__gte=now - timedelta(seconds=self.active_s))
+        ).order_by(F('next_check_at').asc(nulls_first=True), 'id')
+        by_host: "OrderedDict[str, deque]" = OrderedDict()
+        # Over-fetch so per-host caps don't leave budget unused
+        for row in rows[:self.budget * 4]:
+            queue = by_host.setdefault(row.host, deque())
+            if len(queue) < self.max_per_host:
+                queue.append(row)
+        return by_host
+
+    def _refresh_one(self, row: BuyLinkPrice) -> bool:
+        now = timezone.now()
+        price = None
+        try:
+            html = self.fetch(row.url)
+            price = extract_price_from_html(html, url=row.url) if html else None
+        except Exception as e:
+            logger.info("Price fetch failed for %s: %s", row.url, e)
+
+        row.checked_at = now
+        if price:
+            row.price_display = (price.get('display') or '')[:64]
+            row.price_amount = str(price.get('amount') or '')[:64]
+            row.price_currency = (price.get('currency') or '')[:16]
+            row.priced_at = now
+            row.failures = 0
+            row.next_check_at = now + timedelta(seconds=self.refresh_interval_s)
+        else:
+            row.failures += 1
+            backoff = self.refresh_interval_s * min(2 ** row.failures, 32)
+            row.next_check_at = now + timedelta(seconds=backoff)
+        row.save(update_fields=[
+            'price_display', 'price_amount', 'price_currency', 'checked_at',
+            'priced_at', 'failures', 'next_check_at',
+        ])
+        return bool(price)
+
+    def run(self) -> Dict[str, int]:
+        pruned = self.prune()
+        by_host = self._due()
+        next_allowed = {host: 0.0 for host in by_host}
+        stats = {"fetched": 0, "priced": 0, "failed": 0, "hosts": len(by_host), "pruned": pruned}
+
+        while stats["fetched"] < self.budget and by_host:
+            now = time.monotonic()
+            ready = [host for host in by_host if next_allowed[host] <= now]
+            if not ready:
+                self.sleep(min(next_allowed[host] for host in by_host) - now)
+                continue
+            for host in ready:
+                if stats["fetched"] >= self.budget:
+                    break
+                row = by_host[host].popleft()
+                if not by_host[host]:
+                    del by_host[host]
+                stats["fetched"] += 1
+                if self._refresh_one(row):
+                    stats["priced"] += 1
+                else:
+                    stats["failed"] += 1
+                next_allowed[host] = time.monotonic() + self.host_interval_s
+        return stats
+
+
+def build_refresher(**overrides) -> PriceRefresher:
+    options = {
+        "budget": settings.PRICE_REFRESH_BUDGET,
+        "host_interval_s": settings.PRICE_REFRESH_HOST_INTERVAL_S,
+        "max_per_host": settings.PRICE_REFRESH_MAX_PER_HOST,
+        "refresh_interval_s": settings.PRICE_REFRESH_INTERVAL_S,
+        "active_s": settings.PRICE_REFRESH_ACTIVE_S,
+        "prune_s": settings.PRICE_PRUNE_S,
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return PriceRefresher(**options)
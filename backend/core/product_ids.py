@@ -0,0 +1,194 @@
+import logging
+import re
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import CacheNamespace
+from .deadline import Deadline, DeadlineExceeded, capped
+from .models import ProductIdentity
+
+logger = logging.getLogger(__name__)
+
+_AMAZON_HOST = re.compile(r'(?:^|\.)amazon\.(?:com|in|co\.uk|de|fr|it|es|ca|com\.au|ae|co\.jp|sg|nl|se|pl|com\.mx|com\.br)$')
+_ASIN = re.compile(r'/(?:dp|gp/product|gp/aw/d|exec/obidos/ASIN|o/ASIN)/([A-Z0-9]{10})(?:[/?]|$)', re.IGNORECASE)
+_FLIPKART_ITEM = re.compile(r'/p/(itm[0-9a-z]+)', re.IGNORECASE)
+_EBAY_HOST = re.compile(r'(?:^|\.)ebay\.(?:com|co\.uk|de|fr|it|es|ca|com\.au|in)$')
+_EBAY_ITEM = re.compile(r'/itm/(?:[^/]+/)?(\d{9,15})(?:[/?]|$)')
+_WALMART_ITEM = re.compile(r'/ip/(?:[^/]+/)?(\d{5,12})(?:[/?]|$)')
+_BESTBUY_SKU = re.compile(r'/(\d{7})\.p(?:[/?]|$)')
+
+_SHORT_LINK_HOSTS = frozenset({'amzn.in', 'amzn.to', 'amzn.eu', 'amzn.asia', 'a.co', 'dl.flipkart.com', 'fkrt.it', 'ebay.us'})
+# Official stores whose product pages are identified by their path slug
+_BRAND_STORES = frozenset({
+    'apple.com', 'samsung.com', 'nike.com', 'adidas.com', 'adidas.co.in', 'oneplus.com', 'oneplus.in',
+    'mi.com', 'sony.com', 'dyson.com', 'dyson.in', 'lg.com', 'bose.com', 'logitech.com',
+})
+
+_short_links = CacheNamespace('short-links', version=1, timeout=30 * 86400)
+
+
+class ProductRef:
+    """A marketplace product identifier pulled out of a URL, e.g. amazon:B0C7Q3ZK7N."""
+
+    __slots__ = ('marketplace', 'item_id', 'url')
+
+    def __init__(self, marketplace: str, item_id: str, url: str):
+        self.marketplace = marketplace
+        self.item_id = item_id
+        # Canonical product page URL (tracking, slugs and ref paths removed where possible)
+        self.url = url
+
+    @property
+    def canonical_id(self) -> str:
+        return f"{self.marketplace}:{self.item_id}"
+
+    def __repr__(self):
+        return f"ProductRef({self.canonical_id})"
+
+
+def _on_domain(host: str, domain: str) -> bool:
+    """Is `host` the domain itself or one of its subdomains (not e.g. evilflipkart.com)?"""
+    return host == domain or host.endswith('.' + domain)
+
+
+def _base_host(host: str) -> str:
+    for prefix in ('www.', 'm.', 'store.', 'shop.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def parse_product_url(url: str) -> Optional[ProductRef]:
+    """Extract a product identifier from a marketplace or brand-store URL (no network)."""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    host = (parts.hostname or '').lower()
+    path = parts.path or '/'
+
+    if _AMAZON_HOST.search(host):
+        match = _ASIN.search(path)
+        if match:
+            asin = match.group(1).upper()
+            return ProductRef('amazon', asin, f"https://{host}/dp/{asin}")
+        return None
+
+    if _on_domain(host, 'flipkart.com'):
+        match = _FLIPKART_ITEM.search(path)
+        if match:
+            pid = (parse_qs(parts.query).get('pid') or [''])[0]
+            query = f"?pid={pid}" if pid else ''
+            return ProductRef('flipkart', match.group(1).lower(), f"https://www.flipkart.com{path}{query}")
+        return None
+
+    if _EBAY_HOST.search(host):
+        match = _EBAY_ITEM.search(path)
+        if match:
+            return ProductRef('ebay', match.group(1), f"https://{host}/itm/{match.group(1)}")
+        return None
+
+    if _on_domain(host, 'walmart.com'):
+        match = _WALMART_ITEM.search(path)
+        if match:
+            return ProductRef('walmart', match.group(1), f"https://www.walmart.com/ip/{match.group(1)}")
+        return None
+
+    if _on_domain(host, 'bestbuy.com'):
+        match = _BESTBUY_SKU.search(path)
+        if match:
+            return ProductRef('bestbuy', match.group(1), f"https://www.bestbuy.com/site/{match.group(1)}.p")
+        return None
+
+    base = _base_host(host)
+    if base in _BRAND_STORES:
+        slug = path.rstrip('/').lower()
+        if slug.count('/') >= 1 and slug not in ('', '/'):
+            return ProductRef('store', f"{base}{slug}", f"https://{host}{path}")
+    return None
+
+
+def resolve_short_link(url: str, timeout_s: float = 5, deadline: Optional[Deadline] = None) -> str:
+    """Follow a marketplace short link (amzn.in, fkrt.it, ...) to its product URL; cached.
+
+    The request is capped by `deadline`; with under a second left the link is kept as-is.
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    if host not in _SHORT_LINK_HOSTS:
+        return url
+    try:
+        timeout_s = capped(timeout_s, deadline, min_s=1)
+    except DeadlineExceeded:
+        return url
+
+    def resolve():
+        import requests
+
+        try:
+            resp = requests.head(url, allow_redirects=True, timeout=timeout_s)
+            return resp.url or url
+        except Exception as e:
+            logger.info("Short link resolution failed for %s: %s", url, e)
+            return url
+
+    return _short_links.get_or_set(
+        (url,), resolve, wait_s=timeout_s, should_cache=lambda target: target != url,
+    )
+
+
+def canonicalize(url: str, deadline: Optional[Deadline] = None) -> Tuple[str, Optional[ProductRef]]:
+    """(canonical URL, ProductRef or None) for a sanitized product URL."""
+    resolved = resolve_short_link(url, deadline=deadline)
+    ref = parse_product_url(resolved)
+    return (ref.url if ref else resolved), ref
+
+
+def product_refs(urls: Iterable[str]) -> List[ProductRef]:
+    refs = []
+    for url in urls or []:
+        ref = parse_product_url(url)
+        if ref is not None:
+            refs.append(ref)
+    return refs
+
+
+def lookup_identity(urls: Iterable[str]) -> Optional[ProductIdentity]:
+    """Most recent prior identification for any of the URLs' product ids, if still fresh."""
+    ids = [ref.canonical_id for ref in product_refs(urls)]
+    if not ids:
+        return None
+    cutoff = timezone.now() - timedelta(days=settings.PRODUCT_IDENTITY_MAX_AGE_DAYS)
+    try:
+        identity = (
+            ProductIdentity.objects
+            .filter(canonical_id__in=ids, updated_at__gte=cutoff)
+            .order_by('-updated_at')
+            .first()
+        )
+        if identity is not None:
+            ProductIdentity.objects.filter(pk=identity.pk).update(hits=F('hits') + 1)
+        return identity
+    except Exception as e:
+        logger.info("Product identity lookup failed: %s", e)
+        return None
+
+
+def remember_identity(urls: Iterable[str], summary: Dict, image_url: Optional[str] = None):
+    """Index an identification result under every product id found in `urls`."""
+    for ref in product_refs(urls):
+        try:
+            ProductIdentity.objects.update_or_create(
+                canonical_id=ref.canonical_id,
+                defaults={
+                    "canonical_url": ref.url,
+                    "product_summary": summary,
+                    "image_url": image_url or '',
+                },
+            )
+        except Exception as e:
+            logger.info("Could not index product identity %s: %s", ref.canonical_id, e)
@@ -0,0 +1,36 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # falls back to DRF's json-based rendering
+    orjson = None
+
+_ENCODER = JSONEncoder()
+
+
+def _default(obj):
+    # Types orjson does not know natively (Decimal, lazy strings, querysets, ...)
+    return _ENCODER.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """DRF JSONRenderer backed by orjson when it is installed.
+
+    Same output contract as the default renderer (UTF-8, compact, U+2028/2029
+    escaped); requests for indented output go through the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Datetimes go through DRF's encoder so their format matches the serializers'
+        ret = orjson.dumps(data, default=_default,
+                           option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # Keep the JSON safe to embed in <script>, as JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it its me my of on or
+so that the this to was what when where which who why will with you your
+""".split())
+
+# Long free-text blobs (web_context text) are split so one paragraph can be retrieved on its own
+_CHUNK_CHARS = 700
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or '').lower()) if t not in _STOPWORDS]
+
+
+def _flatten(node: Any) -> str:
+    """Render a JSON fragment as compact `key: value` text for indexing and prompting."""
+    if isinstance(node, dict):
+        parts = []
+        for key, value in node.items():
+            if value in (None, '', [], {}):
+                continue
+            parts.append(f"{key}: {_flatten(value)}")
+        return "; ".join(parts)
+    if isinstance(node, list):
+        return ", ".join(_flatten(item) for item in node if item not in (None, '', [], {}))
+    return str(node)
+
+
+def _chunks(text: str) -> List[str]:
+    text = re.sub(r"\s+", " ", text or '').strip()
+    return [text[i:i + _CHUNK_CHARS] for i in range(0, len(text), _CHUNK_CHARS)] if text else []
+
+
+def split_report_sections(report: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Split an analysis report into small, independently retrievable sections."""
+    if not isinstance(report, dict):
+        return [{"id": "report", "title": "Report", "text": _flatten(report)}]
+
+    data = report.get('data') if isinstance(report.get('data'), dict) else report
+    sections = []
+
+    def add(section_id, title, payload):
+        text = payload if isinstance(payload, str) else _flatten(payload)
+        if text:
+            sections.append({"id": section_id, "title": title, "text": text})
+
+    add("product_summary", "Product identification", data.get('product_summary') or {})
+
+    knowledge = data.get('knowledge') or {}
+    add("knowledge.overview", "Overview", {k: knowledge.get(k) for k in ('overview', 'common_variants')})
+    add("knowledge.features", "Key features", knowledge.get('key_features') or [])
+    add("knowledge.uncertainties", "Uncertainties", knowledge.get('uncertainties') or [])
+
+    usage = data.get('usage') or {}
+    add("usage", "Intended users and use cases",
+        {k: usage.get(k) for k in ('intended_users', 'common_use_cases', 'usage_frequency')})
+    add("usage.warnings", "Misuse and safety warnings", usage.get('misuse_warnings') or [])
+
+    impact = data.get('impact') or {}
+    add("impact.health", "Health impact",
+        {k: impact.get(k) for k in ('health_impact', 'risk_level', 'impact_score')})
+    add("impact.environment", "Environmental impact", impact.get('environmental_impact') or '')
+    add("impact.limitations", "Impact limitations", impact.get('limitations') or [])
+
+    recs = data.get('recommendations') or {}
+    add("recommendations", "Recommendation summary", recs.get('recommendation_summary') or '')
+    for i, alt in enumerate(recs.get('alternatives') or []):
+        add(f"recommendations.alternative.{i}", "Alternative", alt)
+
+    buy = data.get('buy_guidance') or {}
+    add("buy_guidance", "Purchase guidance",
+        {k: buy.get(k) for k in ('purchase_recommended', 'purchase_reason')})
+    for i, link in enumerate(buy.get('buy_links') or []):
+        add(f"buy_guidance.link.{i}", "Buy link", link)
+
+    web = data.get('web_context') or {}
+    for i, chunk in enumerate(_chunks(web.get('text') or '')):
+        add(f"web_context.text.{i}", "Web research", chunk)
+    for i, source in enumerate(web.get('sources') or []):
+        add(f"web_context.source.{i}", "Web source", source)
+    if web.get('urls'):
+        add("web_context.urls", "User-provided URLs", web.get('urls'))
+
+    notes = {k: report.get(k) for k in ('confidence_notice', 'errors') if report.get(k)}
+    add("notes", "Analysis notes", notes)
+    return sections
+
+
+class BM25Index:
+    """Okapi BM25 over a handful of report sections (pure Python; corpora are tiny)."""
+
+    def __init__(self, sections: List[Dict[str, str]], k1: float = 1.5, b: float = 0.75):
+        self.sections = sections
+        self.k1 = k1
+        self.b = b
+        self.doc_terms = [Counter(tokenize(f"{s['title']} {s['text']}")) for s in sections]
+        self.doc_lens = [sum(tf.values()) for tf in self.doc_terms]
+        self.avg_len = (sum(self.doc_lens) / len(self.doc_lens)) if self.doc_lens else 0.0
+
+        df = Counter()
+        for tf in self.doc_terms:
+            df.update(tf.keys())
+        n = len(sections)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, str]]:
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        if not terms:
+            return []
+
+        scored = []
+        for i, tf in enumerate(self.doc_terms):
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[i] / (self.avg_len or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [self.sections[i] for _, i in scored[:top_k]]
+
+
+_INDEX_CACHE: "OrderedDict[str, BM25Index]" = OrderedDict()
+_INDEX_CACHE_SIZE = 256
+_INDEX_LOCK = threading.Lock()
+
+
+def report_cache_key(report: Any, report_id: Optional[int] = None) -> str:
+    """Key for a report's index and chat answers: its id (when saved) plus a content digest.
+
+    The digest makes a rewritten report (a resumed analysis, a backfill) a new key,
+    so nothing built from the old content is served for it.
+    """
+    blob = json.dumps(report, sort_keys=True, default=str).encode('utf-8')
+    digest = hashlib.sha1(blob).hexdigest()
+    if report_id is not None:
+        return f"report:{report_id}:{digest[:16]}"
+    return "digest:" + digest
+
+
+def get_report_index(report: Any, cache_key: str) -> BM25Index:
+    """Return the cached BM25 index for a report, building it on first use."""
+    with _INDEX_LOCK:
+        index = _INDEX_CACHE.get(cache_key)
+        if index is not None:
+            _INDEX_CACHE.move_to_end(cache_key)
+            return index
+
+    index = BM25Index(split_report_sections(report))
+    with _INDEX_LOCK:
+        _INDEX_CACHE[cache_key] = index
+        _INDEX_CACHE.move_to_end(cache_key)
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def invalidate_report_index(cache_key: str):
+    """Drop this process's index for `cache_key` (other workers' copies age out of their LRU)."""
+    with _INDEX_LOCK:
+        _INDEX_CACHE.pop(cache_key, None)
+
+
+def retrieve_report_context(report: Any, query: str, cache_key: str, top_k: int = 5) -> List[Dict[str, str]]:
+    """Top-k sections for `query`, always led by the product identification section."""
+    index = get_report_index(report, cache_key)
+    anchor = [s for s in index.sections if s['id'] == 'product_summary']
+    hits = [s for s in index.search(query, top_k=top_k) if s['id'] != 'product_summary']
+    if not hits:
+        # Vague questions ("tell me more") still get the most useful overview sections
+        hits = [s for s in index.sections if s['id'] in ('knowledge.overview', 'impact.health', 'buy_guidance')]
+    return anchor + hits[:top_k]
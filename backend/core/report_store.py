@@ -0,0 +1,88 @@
+import json
+import logging
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+
+from .models import ReportBlob, UploadedImage
+
+try:
+    import zstandard
+except ImportError:  # zlib is always available; zstd is used when installed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Sections of report['data'] that are large, rarely displayed and stored out of row
+DETACHED_SECTIONS = ('web_context',)
+
+
+def compress_section(value: Any) -> Tuple[str, bytes, int]:
+    raw = json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=6).compress(raw), len(raw)
+    return 'zlib', zlib.compress(raw, 6), len(raw)
+
+
+def decompress_section(codec: str, payload: bytes) -> Any:
+    payload = bytes(payload)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Report section was stored with zstd but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raw = zlib.decompress(payload)
+    return json.loads(raw)
+
+
+def split_report(report: Any) -> Tuple[Any, Dict[str, Any]]:
+    """Return (lean_report, detached_sections). The input report is not modified."""
+    if not isinstance(report, dict) or not isinstance(report.get('data'), dict):
+        return report, {}
+
+    data = dict(report['data'])
+    detached = {name: data.pop(name) for name in DETACHED_SECTIONS if data.get(name)}
+    if not detached:
+        return report, {}
+
+    lean = dict(report, data=data)
+    lean['detached_sections'] = sorted(detached)
+    return lean, detached
+
+
+def save_detached_sections(upload: UploadedImage, sections: Dict[str, Any]):
+    """Write (or replace) the compressed side rows for an already-saved upload."""
+    if not sections:
+        return
+    with transaction.atomic():
+        for kind, value in sections.items():
+            codec, payload, raw_size = compress_section(value)
+            ReportBlob.objects.update_or_create(
+                upload=upload,
+                kind=kind,
+                defaults={'codec': codec, 'payload': payload, 'raw_size': raw_size},
+            )
+
+
+def load_report(upload: UploadedImage, include: Optional[Iterable[str]] = DETACHED_SECTIONS) -> Any:
+    """analysis_report with the requested detached sections merged back in."""
+    report = upload.analysis_report
+    if not isinstance(report, dict) or not report.get('detached_sections'):
+        return report
+
+    wanted = [kind for kind in (include or ()) if kind in report['detached_sections']]
+    if not wanted:
+        return report
+
+    data = dict(report.get('data') or {})
+    for blob in ReportBlob.objects.filter(upload=upload, kind__in=wanted):
+        try:
+            data[blob.kind] = decompress_section(blob.codec, blob.payload)
+        except Exception as e:
+            logger.warning("Could not load %s for upload %s: %s", blob.kind, upload.pk, e)
+    full = dict(report, data=data)
+    full['detached_sections'] = [k for k in report['detached_sections'] if k not in data]
+    if not full['detached_sections']:
+        full.pop('detached_sections')
+    return full
@@ -0,0 +1,66 @@
+import logging
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Route:
+    """Model, token budget, timeout and fallback model for one agent class."""
+
+    __slots__ = ('agent', 'model', 'max_tokens', 'timeout_s', 'fallback_model', 'temperature')
+
+    def __init__(self, agent: str, model: str, max_tokens: int = 800, timeout_s: float = 60,
+                 fallback_model: Optional[str] = None, temperature: Optional[float] = 0.2):
+        self.agent = agent
+        self.model = model
+        self.max_tokens = max_tokens
+        self.timeout_s = timeout_s
+        self.fallback_model = fallback_model if fallback_model != model else None
+        self.temperature = temperature
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def route_for(agent_name: str) -> Route:
+    """settings.AGENT_ROUTES['default'] overlaid with the agent's own entry."""
+    routes = settings.AGENT_ROUTES
+    options = {**routes.get('default', {}), **routes.get(agent_name, {})}
+    return Route(agent_name, **options)
+
+
+def estimate_cost_usd(model: str, usage) -> float:
+    """Cost of one call from its token usage and settings.MODEL_PRICING_USD_PER_1M."""
+    if usage is None:
+        return 0.0
+    prices = settings.MODEL_PRICING_USD_PER_1M.get(model)
+    if not prices:
+        return 0.0
+    # chat.completions reports prompt/completion tokens; the responses API input/output tokens
+    tokens_in = getattr(usage, 'prompt_tokens', None) or getattr(usage, 'input_tokens', 0) or 0
+    tokens_out = getattr(usage, 'completion_tokens', None) or getattr(usage, 'output_tokens', 0) or 0
+    return (tokens_in * prices[0] + tokens_out * prices[1]) / 1_000_000
+
+
+def record_call(route: Route, model: str, latency_ms: float, usage=None, ok: bool = True,
+                fallback: bool = False) -> float:
+    """Log one routed call and update per-route metrics; returns its estimated cost."""
+    label = f"{route.agent}:{model}"
+    cost = estimate_cost_usd(model, usage) if ok else 0.0
+    metrics.observe('llm.latency_ms', latency_ms, label=label)
+    metrics.incr('llm.calls', label=label)
+    if cost:
+        metrics.observe('llm.cost_usd', cost, label=label)
+    if not ok:
+        metrics.incr('llm.errors', label=label)
+    if fallback:
+        metrics.incr('llm.fallbacks', label=route.agent)
+    logger.info(
+        "llm route agent=%s model=%s%s ok=%s latency_ms=%.0f cost_usd=%.5f",
+        route.agent, model, " (fallback)" if fallback else "", ok, latency_ms, cost,
+    )
+    return cost
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('enterprise', 'pro', 'free')
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a job waited longer than the queue limit for a slot."""
+
+
+class _Ticket:
+    __slots__ = ('tier', 'enqueued_at', 'granted')
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class PlanScheduler:
+    """Admits analysis jobs to a fixed number of execution slots by plan tier.
+
+    Tiers share slots by stride scheduling (a weighted fair queue): each grant
+    advances the tier's virtual pass by 1/weight and the non-empty tier with the
+    lowest pass goes next. A job that has waited longer than `starvation_s` is
+    served first regardless of tier, so free traffic is slowed, never starved.
+
+    `slot()` blocks the calling request thread until it is granted a slot.
+    """
+
+    def __init__(self, slots: int, weights: Dict[str, int], starvation_s: float, max_wait_s: float):
+        self.slots = slots
+        self.weights = weights
+        self.starvation_s = starvation_s
+        self.max_wait_s = max_wait_s
+        self._cond = threading.Condition()
+        self._free = slots
+        self._queues = {tier: deque() for tier in TIERS}
+        self._pass = {tier: 0.0 for tier in TIERS}
+
+    @staticmethod
+    def tier_for(plan) -> str:
+        return plan if plan in TIERS else 'free'
+
+    def _pick_tier(self, now):
+        heads = {tier: q[0] for tier, q in self._queues.items() if q}
+        starving = [t for t, ticket in heads.items() if now - ticket.enqueued_at >= self.starvation_s]
+        if starving:
+            metrics.incr('scheduler.starvation_promotions')
+            return min(starving, key=lambda t: heads[t].enqueued_at)
+        return min(heads, key=lambda t: (self._pass[t], TIERS.index(t)))
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._free > 0 and any(self._queues.values()):
+            tier = self._pick_tier(now)
+            ticket = self._queues[tier].popleft()
+            ticket.granted = True
+            self._free -= 1
+            self._pass[tier] += 1.0 / max(1, self.weights.get(tier, 1))
+            metrics.observe('scheduler.wait_ms', (now - ticket.enqueued_at) * 1000, label=tier)
+        self._cond.notify_all()
+
+    def _release(self, tier, started):
+        metrics.observe('scheduler.run_ms', (time.monotonic() - started) * 1000, label=tier)
+        with self._cond:
+            self._free += 1
+            self._dispatch()
+
+    def _enqueue(self, tier) -> _Ticket:
+        ticket = _Ticket(tier)
+        if not self._queues[tier]:
+            # A tier returning from idle must not bank credit for the time it was away
+            active = [self._pass[t] for t, q in self._queues.items() if q]
+            if active:
+                self._pass[tier] = max(self._pass[tier], min(active))
+        self._queues[tier].append(ticket)
+        return ticket
+
+    @contextmanager
+    def slot(self, plan, max_wait_s: Optional[float] = None):
+        """Block until the job may run, then hold an execution slot for the `with` body.
+
+        Waits at most `max_wait_s` (capped at the scheduler's own limit), then
+        raises SchedulerTimeout; callers pass what is left of their request deadline.
+        """
+        tier = self.tier_for(plan)
+        wait_s = self.max_wait_s if max_wait_s is None else min(max_wait_s, self.max_wait_s)
+        with self._cond:
+            ticket = self._enqueue(tier)
+            self._dispatch()
+            deadline = ticket.enqueued_at + wait_s
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queues[tier].remove(ticket)
+                    metrics.incr('scheduler.timeouts', label=tier)
+                    raise SchedulerTimeout(f"No analysis slot within {wait_s:.1f}s")
+                self._cond.wait(min(remaining, 1.0))
+                # Periodic re-dispatch lets starvation promotion kick in without new arrivals
+                self._dispatch()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(tier, started)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            depth = {tier: len(q) for tier, q in self._queues.items()}
+            free = self._free
+        snapshot = metrics.snapshot('scheduler.')
+        return {
+            "slots": self.slots,
+            "free_slots": free,
+            "queue_depth": depth,
+            "wait_ms": snapshot.get('scheduler.wait_ms', {}),
+            "run_ms": snapshot.get('scheduler.run_ms', {}),
+            "timeouts": snapshot.get('scheduler.timeouts', {}),
+            "starvation_promotions": snapshot.get('scheduler.starvation_promotions', {}).get('_', 0),
+        }
+
+
+plan_scheduler = PlanScheduler(
+    slots=settings.SCHEDULER_SLOTS,
+    weights=settings.SCHEDULER_TIER_WEIGHTS,
+    starvation_s=settings.SCHEDULER_STARVATION_S,
+    max_wait_s=settings.SCHEDULER_MAX_WAIT_S,
+)
@@ -0,0 +1,100 @@
+import logging
+import re
+from typing import List, Optional
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import UploadedImage
+
+logger = logging.getLogger(__name__)
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Keep in sync with the GIN index created in migration 0008
+_PG_DOCUMENT = (
+    "to_tsvector('simple', coalesce(product_name, '') || ' ' || "
+    "coalesce(category, '') || ' ' || coalesce(brand, ''))"
+)
+
+_sqlite_fts_available: Optional[bool] = None
+
+
+def _terms(query: str) -> List[str]:
+    return _TERM_RE.findall((query or '').lower())[:8]
+
+
+def _sqlite_has_fts() -> bool:
+    global _sqlite_fts_available
+    if _sqlite_fts_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_uploadedimage_fts'")
+            _sqlite_fts_available = cursor.fetchone() is not None
+    return _sqlite_fts_available
+
+
+def _full_text_ids(terms: List[str], user_id: Optional[int], limit: int) -> Optional[List[int]]:
+    """Ranked ids from the vendor's full-text index, or None when there is none."""
+    # Every term is a prefix match so "coca" finds "Coca-Cola Zero"
+    if connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT id FROM core_uploadedimage WHERE {_PG_DOCUMENT} @@ to_tsquery('simple', %s)"
+            + (" AND user_id = %s" if user_id is not None else "")
+            + f" ORDER BY ts_rank({_PG_DOCUMENT}, to_tsquery('simple', %s)) DESC, uploaded_at DESC LIMIT %s"
+        )
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        params = [tsquery] + ([user_id] if user_id is not None else []) + [tsquery, limit]
+    elif connection.vendor == 'sqlite' and _sqlite_has_fts():
+        sql = (
+            "SELECT u.id FROM core_uploadedimage_fts f JOIN core_uploadedimage u ON u.id = f.rowid "
+            "WHERE core_uploadedimage_fts MATCH %s"
+            + (" AND u.user_id = %s" if user_id is not None else "")
+            + " ORDER BY bm25(core_uploadedimage_fts), u.uploaded_at DESC LIMIT %s"
+        )
+        match = " ".join(f'"{t}"*' for t in terms)
+        params = [match] + ([user_id] if user_id is not None else []) + [limit]
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_analyses(query: str, user_id: Optional[int] = None, limit: int = 20) -> List[UploadedImage]:
+    """Find past analyses by product name, category or brand.
+
+    Exact-prefix matches on product_name rank first, then full-text hits
+    (Postgres tsvector / SQLite FTS5). The heavy report JSON is deferred.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    base = UploadedImage.objects.select_related('media').defer('analysis_report')
+    if user_id is not None:
+        base = base.filter(user_id=user_id)
+
+    prefix_ids = list(
+        base.filter(product_name__istartswith=query.strip())
+        .order_by('-uploaded_at', '-id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+    try:
+        text_ids = _full_text_ids(terms, user_id, limit)
+    except Exception as e:
+        logger.info("Full-text search failed; falling back to LIKE: %s", e)
+        text_ids = None
+
+    if text_ids is None:
+        queryset = base
+        for term in terms:
+            queryset = queryset.filter(
+                Q(product_name__icontains=term) | Q(category__icontains=term) | Q(brand__icontains=term)
+            )
+        text_ids = list(queryset.order_by('-uploaded_at', '-id').values_list('id', flat=True)[:limit])
+
+    ordered = list(dict.fromkeys(prefix_ids + text_ids))[:limit]
+    rows = base.in_bulk(ordered)
+    return [rows[pk] for pk in ordered if pk in rows]
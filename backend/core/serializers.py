@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from .models import UploadedImage
+from .media_store import thumbnail_urls
 
 User = get_user_model()
 
@@ -42,3 +44,45 @@ class RegisterSerializer(serializers.ModelSerializer):
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
     password = serializers.CharField(write_only=True, required=True)
+
+
+class AnalysisSummarySerializer(serializers.ModelSerializer):
+    """History/search row; reads only denormalized columns, never analysis_report."""
+    image_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadedImage
+        fields = [
+            'id', 'uploaded_at', 'status', 'product_name', 'category', 'brand',
+            'risk_level', 'impact_score', 'confidence', 'processed', 'processing_time_ms', 'image_url', 'thumbnails',
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?fields= / ?lean=1: unselected columns are dropped before serializing (no thumbnail URLs built for nothing)
+        only = self.context.get('only_fields')
+        drop = self.context.get('drop_fields') or ()
+        for name in list(self.fields):
+            if (only is not None and name not in only) or name in drop:
+                self.fields.pop(name)
+
+    def get_image_url(self, obj):
+        if not obj.image:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(obj.image.url) if request else obj.image.url
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj.media, self.context.get('request'))
+
+
+class AnalysisDetailSerializer(AnalysisSummarySerializer):
+    report = serializers.SerializerMethodField()
+
+    class Meta(AnalysisSummarySerializer.Meta):
+        fields = AnalysisSummarySerializer.Meta.fields + ['report']
+
+    def get_report(self, obj):
+        # Views pass the report with any requested detached sections merged back in
+        return self.context.get('report', obj.analysis_report)
@@ -0,0 +1,56 @@
+from typing import Any, Dict, Iterable, Optional
+
+# `lean=1` drops report sections clients rarely display; they stay available in full responses
+LEAN_REPORT_DROP = ('disclaimer', 'errors', 'meta', 'detached_sections')
+LEAN_DATA_DROP = ('web_context', 'input_urls')
+# ...and, on history rows, columns the list view does not need
+LEAN_SUMMARY_DROP = ('image_url', 'processed', 'processing_time_ms')
+
+_TRUE = ('1', 'true', 'yes')
+
+
+def parse_fields(raw: Optional[str]) -> Optional[Dict[str, dict]]:
+    """'id,report.data.impact.risk_level' -> nested selection tree (None = everything)."""
+    if not raw:
+        return None
+    tree: Dict[str, dict] = {}
+    for path in raw.split(','):
+        parts = [p for p in path.strip().split('.') if p]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            if node.get(part, None) == {}:
+                break  # the parent is already selected whole
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = {}
+    return tree or None
+
+
+def select_fields(value: Any, tree: Optional[Dict[str, dict]]) -> Any:
+    """Keep only the selected paths; lists apply the selection to every element."""
+    if not tree:
+        return value
+    if isinstance(value, dict):
+        return {key: select_fields(value[key], sub) for key, sub in tree.items() if key in value}
+    if isinstance(value, list):
+        return [select_fields(item, tree) for item in value]
+    return value
+
+
+def top_level_fields(tree: Optional[Dict[str, dict]]) -> Optional[Iterable[str]]:
+    return set(tree) if tree else None
+
+
+def wants_lean(request) -> bool:
+    return str(request.query_params.get('lean', '')).lower() in _TRUE
+
+
+def lean_report(report: Any) -> Any:
+    if not isinstance(report, dict):
+        return report
+    lean = {k: v for k, v in report.items() if k not in LEAN_REPORT_DROP}
+    if isinstance(lean.get('data'), dict):
+        lean['data'] = {k: v for k, v in lean['data'].items() if k not in LEAN_DATA_DROP}
+    return lean
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import UploadedImage
+from .media_store import release
+
+
+@receiver(post_delete, sender=UploadedImage)
+def release_uploaded_media(sender, instance, **kwargs):
+    """Deleting an analysis drops its reference on the shared media file."""
+    if instance.media_id:
+        release(instance.media_id)
@@ -0,0 +1,819 @@
+import copy
+import io
+import os
+import shutil
+import socket
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .admission import PipelineSlots
+from .agents import BaseAgent
+from .buy_links import BuyLinkCache
+from .chat_cache import ChatAnswerCache, chat_answer_cache, normalize_question
+from .chat_memory import ChatMemory
+from .checkpoints import (
+    STEPS, claim_checkpoint, completed_steps, is_resumable, release_checkpoint, start_checkpoint,
+)
+from .clients import get_openai_client, reset_clients
+from .deadline import Deadline
+from .json_repair import Field, coerce_to_schema, matches_schema, parse_json_lenient
+from .media_store import release, store_image
+from .models import (
+    AnalysisCheckpoint, BuyLinkPrice, ChatSession, ChatTurn, MediaObject, RateLimitBucket, ReportBlob,
+    UploadedImage,
+)
+from .orchestrator import Orchestrator
+from .prices import url_hash
+from .product_ids import parse_product_url
+from .report_index import (
+    _INDEX_CACHE, BM25Index, get_report_index, invalidate_report_index, report_cache_key,
+    retrieve_report_context, split_report_sections,
+)
+from .report_store import compress_section, decompress_section, load_report, save_detached_sections, split_report
+from .routing import Route
+from .scheduler import PlanScheduler, SchedulerTimeout
+from .throttling import AnalyzeThrottle, PlanTokenBucketThrottle, prune_idle_buckets
+
+_LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+}
+
+
+def _report(*markers, status='complete', **data):
+    return {"status": status, "steps_completed": list(markers), "data": data, "errors": [], "meta": {}}
+
+
+class _Summarizer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def run(self, previous_summary, transcript):
+        self.calls.append((previous_summary, transcript))
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return f"{previous_summary} +{len(transcript)}".strip()
+
+
+class ChatMemoryTests(TestCase):
+    def setUp(self):
+        self.upload = UploadedImage.objects.create(analysis_report=_report('visual_id'))
+        self.session = ChatSession.objects.create(report=self.upload)
+
+    def test_short_conversation_is_kept_verbatim(self):
+        summarizer = _Summarizer()
+        memory = ChatMemory(self.session, summarizer=summarizer, token_budget=1000)
+        memory.record("Is it safe?", "Yes.")
+        self.assertEqual(summarizer.calls, [])
+        self.assertEqual(
+            memory.context_messages(),
+            [{"role": "user", "content": "Is it safe?"}, {"role": "assistant", "content": "Yes."}],
+        )
+
+    def test_old_exchanges_are_folded_into_the_summary(self):
+        summarizer = _Summarizer()
+        memory = ChatMemory(self.session, summarizer=summarizer, token_budget=30)
+        for i in range(3):
+            memory.record(f"Question {i} " + "x" * 40, f"Answer {i} " + "y" * 40)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.turn_count, 6)
+        self.assertTrue(self.session.summary)
+        # Only the previous summary and the newly evicted turns go to the summarizer
+        self.assertTrue(all(len(transcript) <= 4 for _, transcript in summarizer.calls))
+        tail = memory.context_messages()
+        self.assertEqual(tail[0]["role"], "system")
+        # An exchange is never split: the unsummarized tail starts with a question
+        self.assertEqual(tail[1]["role"], "user")
+        self.assertEqual(
+            ChatTurn.objects.get(session=self.session, seq=self.session.summarized_until + 1).role,
+            ChatTurn.ROLE_USER,
+        )
+
+    def test_summarizer_failure_falls_back_to_an_extract(self):
+        memory = ChatMemory(self.session, summarizer=_Summarizer(fail=True), token_budget=5)
+        memory.record("Does it contain BPA?", "No, it is BPA-free.")
+        self.session.refresh_from_db()
+        self.assertIn("User asked: Does it contain BPA?", self.session.summary)
+        self.assertEqual(self.session.summarized_until, 2)
+
+
+@override_settings(CACHES=_LOCAL_CACHES)
+class ChatSessionAccessTests(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user('chatowner', 'chatowner@example.com', 'pw')
+        self.upload = UploadedImage.objects.create(user=self.owner, analysis_report=_report('visual_id'))
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def test_anonymous_clients_cannot_open_saved_reports(self):
+        response = self.client.post('/api/v1/chat/', {"message": "hi there", "report_id": self.upload.pk}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_users_cannot_open_the_report_or_its_sessions(self):
+        session = ChatSession.objects.create(report=self.upload, user=self.owner)
+        self.client.force_authenticate(get_user_model().objects.create_user('stranger', 's@example.com', 'pw'))
+        response = self.client.post('/api/v1/chat/', {"message": "hi there", "report_id": self.upload.pk}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/api/v1/chat/', {"message": "hi there", "session_id": session.pk}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_ownerless_reports_are_not_reachable_by_id(self):
+        upload = UploadedImage.objects.create(analysis_report=_report('visual_id'))
+        self.client.force_authenticate(self.owner)
+        response = self.client.post('/api/v1/chat/', {"message": "hi there", "report_id": upload.pk}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class CompletedStepsTests(SimpleTestCase):
+    def test_markers_map_onto_steps(self):
+        report = _report('visual_id_cached', 'knowledge', 'usage_skipped_deadline', 'buy_link_skipped_safety')
+        self.assertEqual(completed_steps(report), ['visual_id', 'knowledge', 'buy_link'])
+
+    def test_failed_or_missing_report_has_nothing_done(self):
+        self.assertEqual(completed_steps(_report(*STEPS, status='failed')), [])
+        self.assertEqual(completed_steps(None), [])
+
+    def test_resumable_until_every_step_has_output(self):
+        self.assertTrue(is_resumable(_report('visual_id', 'knowledge')))
+        self.assertTrue(is_resumable({"error": "worker killed", "status": "failed"}))
+        self.assertFalse(is_resumable(_report(*STEPS)))
+
+    def test_aborted_analysis_is_final(self):
+        self.assertFalse(is_resumable(_report('visual_id', status='aborted')))
+
+
+@override_settings(CACHES=_LOCAL_CACHES)
+class ClaimCheckpointTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        self.upload = UploadedImage.objects.create(
+            user=self.user, analysis_report=_report('visual_id', 'knowledge'), processing_time_ms=1000,
+        )
+        self.checkpoint = start_checkpoint(self.upload, {"product_urls": []})
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.user)
+
+    def test_running_analysis_cannot_be_claimed(self):
+        self.assertIsNone(claim_checkpoint(self.upload))
+
+    def test_only_one_claim_wins_once_released(self):
+        release_checkpoint(self.checkpoint)
+        claimed = claim_checkpoint(self.upload)
+        self.assertIsNotNone(claimed)
+        self.assertEqual(claimed.attempts, 2)
+        self.assertIsNone(claim_checkpoint(self.upload))
+
+    def test_expired_lease_can_be_claimed(self):
+        AnalysisCheckpoint.objects.filter(pk=self.checkpoint.pk).update(
+            lease_until=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertIsNotNone(claim_checkpoint(self.upload))
+
+    def test_retry_while_running_is_a_conflict(self):
+        response = self.client.post(f'/api/v1/history/{self.upload.pk}/retry/')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_retry_without_checkpoint_returns_the_report(self):
+        self.checkpoint.delete()
+        with mock.patch('core.views.Orchestrator') as orchestrator:
+            response = self.client.post(f'/api/v1/history/{self.upload.pk}/retry/')
+        self.assertEqual(response.status_code, 200)
+        orchestrator.assert_not_called()
+
+    def test_other_users_analysis_is_not_found(self):
+        other = get_user_model().objects.create_user('other', 'other@example.com', 'pw')
+        self.client.force_authenticate(other)
+        response = self.client.post(f'/api/v1/history/{self.upload.pk}/retry/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_resume_drops_answers_and_index_of_the_replaced_report(self):
+        release_checkpoint(self.checkpoint)
+        old_key = report_cache_key(self.upload.analysis_report, self.upload.pk)
+        chat_answer_cache.set(old_key, "is it safe for kids", "Yes.")
+        get_report_index(self.upload.analysis_report, old_key)
+
+        with mock.patch('core.views.Orchestrator') as orchestrator:
+            orchestrator.return_value.resume.return_value = _report(*STEPS)
+            response = self.client.post(f'/api/v1/history/{self.upload.pk}/retry/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(chat_answer_cache.get(old_key, "is it safe for kids"))
+        self.assertNotIn(old_key, _INDEX_CACHE)
+        self.assertFalse(AnalysisCheckpoint.objects.filter(upload=self.upload).exists())
+
+
+@mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"})
+class ResumeTests(SimpleTestCase):
+    def setUp(self):
+        self.orchestrator = Orchestrator()
+        for agent in self.orchestrator.agents:
+            agent.run = mock.Mock(side_effect=AssertionError(f"{type(agent).__name__} ran again"))
+        self.orchestrator.impact_agent.run = mock.Mock(return_value={"risk_level": "low", "impact_score": 80})
+        self.orchestrator.recommendation_agent.run = mock.Mock(return_value={"alternatives": []})
+
+    def test_only_unfinished_steps_run(self):
+        report = _report(
+            'visual_id', 'knowledge', 'usage', 'impact_skipped_deadline', status='partial',
+            product_summary={"product_name": "Kettle", "category": "Kitchen"}, knowledge={}, usage={},
+        )
+        report['meta']['llm_cost_usd'] = 0.01
+        steps = []
+        buy_data = {"purchase_recommended": True, "purchase_reason": "", "buy_links": []}
+        with mock.patch('core.orchestrator.buy_link_cache') as cache:
+            cache.get.return_value = (buy_data, 'miss')
+            resumed = self.orchestrator.resume(report, checkpoint=lambda r, step: steps.append(step))
+
+        self.orchestrator.impact_agent.run.assert_called_once()
+        self.orchestrator.recommendation_agent.run.assert_called_once()
+        self.assertEqual(steps, ['impact', 'recommendations'])
+        self.assertEqual(resumed['status'], 'complete')
+        self.assertEqual(completed_steps(resumed), list(STEPS))
+        self.assertNotIn('impact_skipped_deadline', resumed['steps_completed'])
+        self.assertEqual(resumed['meta']['resumed'], 1)
+        self.assertEqual(resumed['meta']['llm_cost_usd'], 0.01)
+        # The checkpointed report itself is left untouched
+        self.assertEqual(report['status'], 'partial')
+
+
+class ReportIndexTests(SimpleTestCase):
+    report = _report(
+        'visual_id', 'knowledge', 'impact',
+        product_summary={"product_name": "Steel Kettle", "brand": "Acme"},
+        knowledge={"overview": "An electric kettle.", "key_features": ["auto shut-off", "1.7 litre capacity"]},
+        impact={"health_impact": "No BPA in contact with water.", "risk_level": "low", "impact_score": 82},
+        buy_guidance={"purchase_recommended": True, "purchase_reason": "Low risk.", "buy_links": []},
+        web_context={"text": "word " * 400},
+    )
+
+    def test_sections_skip_empty_parts_and_chunk_long_text(self):
+        ids = [s['id'] for s in split_report_sections(self.report)]
+        self.assertIn('knowledge.features', ids)
+        self.assertNotIn('usage.warnings', ids)
+        self.assertEqual(len([i for i in ids if i.startswith('web_context.text.')]), 3)
+
+    def test_bm25_ranks_the_matching_section_first(self):
+        index = BM25Index(split_report_sections(self.report))
+        self.assertEqual(index.search("does it contain bpa", top_k=1)[0]['id'], 'impact.health')
+        self.assertEqual(index.search("zzz unknown"), [])
+
+    def test_retrieval_leads_with_identification_and_falls_back_to_an_overview(self):
+        key = report_cache_key(self.report)
+        hits = retrieve_report_context(self.report, "what capacity", key, top_k=2)
+        self.assertEqual(hits[0]['id'], 'product_summary')
+        self.assertEqual(hits[1]['id'], 'knowledge.features')
+        vague = [s['id'] for s in retrieve_report_context(self.report, "tell me more", key)]
+        self.assertEqual(vague, ['product_summary', 'knowledge.overview', 'impact.health', 'buy_guidance'])
+
+    def test_cache_key_changes_with_content(self):
+        changed = dict(self.report, status='partial')
+        self.assertEqual(report_cache_key(self.report, 7), report_cache_key(dict(self.report), 7))
+        self.assertNotEqual(report_cache_key(self.report, 7), report_cache_key(changed, 7))
+        self.assertTrue(report_cache_key(self.report, 7).startswith('report:7:'))
+
+    def test_index_is_built_once_per_key_until_invalidated(self):
+        key = report_cache_key(self.report, 8)
+        index = get_report_index(self.report, key)
+        self.assertIs(get_report_index(self.report, key), index)
+        invalidate_report_index(key)
+        self.assertIsNot(get_report_index(self.report, key), index)
+
+
+@override_settings(CACHES=_LOCAL_CACHES)
+class ChatAnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = ChatAnswerCache(per_report=3, ttl_s=60, similarity=0.8, min_tokens=2)
+        self.report_key = f"report:{id(self)}"
+
+    def test_normalization_keeps_interrogatives_numbers_and_negations(self):
+        self.assertEqual(normalize_question("Is it safe for kids?"), "safe for kids")
+        self.assertEqual(normalize_question("Why can't I use it under 3.5 bar?"), "why can not use under 3.5 bar")
+
+    def test_near_duplicate_question_is_served(self):
+        self.cache.set(self.report_key, "Is it safe for children?", "Yes.")
+        self.assertEqual(self.cache.get(self.report_key, "is it safe for childrens"), "Yes.")
+        self.assertEqual(self.cache.get(self.report_key, "IS IT SAFE FOR CHILDREN!"), "Yes.")
+
+    def test_different_number_or_negation_is_a_miss(self):
+        self.cache.set(self.report_key, "Is it safe for children under 8?", "Yes, from 8 years.")
+        self.cache.set(self.report_key, "Can it be used with a filter cartridge installed?", "Yes.")
+        # Both pairs score above the similarity threshold on character trigrams alone
+        self.assertIsNone(self.cache.get(self.report_key, "is it safe for children under 3"))
+        self.assertIsNone(self.cache.get(self.report_key, "Can it be used with no filter cartridge installed?"))
+
+    def test_different_interrogatives_do_not_collide(self):
+        self.cache.set(self.report_key, "Who should use it?", "Adults.")
+        self.assertIsNone(self.cache.get(self.report_key, "When should use it?"))
+
+    def test_too_short_questions_are_not_cached(self):
+        self.cache.set(self.report_key, "What is it?", "A kettle.")
+        self.assertIsNone(self.cache.get(self.report_key, "What is it?"))
+
+    def test_least_recently_used_answer_is_evicted(self):
+        for question in ("safe for kids", "made of steel", "uses batteries"):
+            self.cache.set(self.report_key, question, question.upper())
+        self.cache.get(self.report_key, "safe for kids")
+        self.cache.set(self.report_key, "works in india", "Yes.")
+        self.assertEqual(self.cache.get(self.report_key, "safe for kids"), "SAFE FOR KIDS")
+        self.assertIsNone(self.cache.get(self.report_key, "made of steel"))
+
+    def test_invalidate_forgets_every_answer(self):
+        self.cache.set(self.report_key, "safe for kids", "Yes.")
+        self.cache.invalidate(self.report_key)
+        self.assertIsNone(self.cache.get(self.report_key, "safe for kids"))
+
+
+class ReportStoreTests(TestCase):
+    report = _report('visual_id', product_summary={"product_name": "Kettle"}, web_context={"text": "long " * 500})
+
+    def test_split_detaches_heavy_sections_without_touching_the_input(self):
+        lean, detached = split_report(self.report)
+        self.assertNotIn('web_context', lean['data'])
+        self.assertEqual(lean['detached_sections'], ['web_context'])
+        self.assertEqual(detached['web_context'], self.report['data']['web_context'])
+        self.assertIn('web_context', self.report['data'])
+
+    def test_reports_without_heavy_sections_are_kept_as_is(self):
+        report = _report('visual_id', product_summary={"product_name": "Kettle"})
+        self.assertEqual(split_report(report), (report, {}))
+        self.assertEqual(split_report({"error": "x", "status": "failed"}), ({"error": "x", "status": "failed"}, {}))
+
+    def test_compression_round_trips(self):
+        codec, payload, raw_size = compress_section(self.report['data']['web_context'])
+        self.assertLess(len(payload), raw_size)
+        self.assertEqual(decompress_section(codec, payload), self.report['data']['web_context'])
+
+    def test_load_merges_requested_sections_back(self):
+        lean, detached = split_report(self.report)
+        upload = UploadedImage.objects.create(analysis_report=lean)
+        save_detached_sections(upload, detached)
+        save_detached_sections(upload, detached)
+        self.assertEqual(ReportBlob.objects.filter(upload=upload).count(), 1)
+
+        self.assertEqual(load_report(upload), self.report)
+        self.assertEqual(load_report(upload, include=()), lean)
+
+
+def _png_bytes(color=(200, 30, 30)):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@mock.patch('core.media_store.schedule_thumbnails')
+class MediaStoreTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.data = _png_bytes()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_identical_uploads_share_one_file(self, _thumbnails):
+        first = store_image(self.data, 'PNG')
+        second = store_image(self.data, 'PNG')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(MediaObject.objects.get(pk=first.pk).ref_count, 2)
+        self.assertEqual(MediaObject.objects.count(), 1)
+
+    def test_file_is_deleted_with_the_last_reference_after_commit(self, _thumbnails):
+        media = store_image(self.data, 'PNG')
+        store_image(self.data, 'PNG')
+        release(media.pk)
+        self.assertTrue(default_storage.exists(media.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release(media.pk)
+            # Still on disk until the transaction commits
+            self.assertTrue(default_storage.exists(media.file.name))
+        self.assertFalse(MediaObject.objects.filter(pk=media.pk).exists())
+        self.assertFalse(default_storage.exists(media.file.name))
+
+    def test_rolled_back_release_keeps_row_and_file(self, _thumbnails):
+        media = store_image(self.data, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    release(media.pk)
+                    raise RuntimeError("caller failed")
+            except RuntimeError:
+                pass
+        self.assertTrue(MediaObject.objects.filter(pk=media.pk).exists())
+        self.assertTrue(default_storage.exists(media.file.name))
+
+    def test_store_during_a_pending_release_gets_its_own_file(self, _thumbnails):
+        media = store_image(self.data, 'PNG')
+        with self.captureOnCommitCallbacks() as callbacks:
+            release(media.pk)
+        stored_again = store_image(self.data, 'PNG')
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(stored_again.file.name, media.file.name)
+        self.assertTrue(default_storage.exists(stored_again.file.name))
+
+    def test_deleting_an_analysis_releases_its_media(self, _thumbnails):
+        media = store_image(self.data, 'PNG')
+        upload = UploadedImage.objects.create(media=media)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload.delete()
+        self.assertFalse(MediaObject.objects.filter(pk=media.pk).exists())
+
+    @override_settings(CACHES=_LOCAL_CACHES)
+    def test_retry_takes_a_reference_when_relinking_media(self, _thumbnails):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        media = store_image(self.data, 'PNG')
+        original = UploadedImage.objects.create(user=user, media=media)
+        # A run killed before it linked its stored upload: same digest, no media
+        upload = UploadedImage.objects.create(user=user, analysis_report=_report('visual_id', status='partial'))
+        release_checkpoint(start_checkpoint(upload, {"image_digest": media.digest, "product_urls": []}))
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+        with mock.patch('core.views.Orchestrator') as orchestrator:
+            orchestrator.return_value.resume.return_value = _report(*STEPS)
+            response = client.post(f'/api/v1/history/{upload.pk}/retry/')
+        self.assertEqual(response.status_code, 200)
+        upload.refresh_from_db()
+        self.assertEqual(upload.media_id, media.pk)
+        self.assertEqual(MediaObject.objects.get(pk=media.pk).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+        self.assertTrue(default_storage.exists(upload.media.file.name))
+
+
+_TEST_RATES = {
+    'api': {'anon': '2/hour', 'free': '2/hour'},
+    'analyze': {'anon': '3/hour', 'free': '3/hour', 'pro': '6/hour'},
+}
+
+
+@override_settings(CACHES=_LOCAL_CACHES, PLAN_THROTTLE_RATES=_TEST_RATES)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.free = get_user_model().objects.create_user(username='free-user', email='free@example.com', password='x', plan='free')
+        self.pro = get_user_model().objects.create_user(username='pro-user', email='pro@example.com', password='x', plan='pro')
+
+    def _request(self, user=None):
+        request = RequestFactory().post('/api/analyze/', REMOTE_ADDR='10.0.0.1')
+        if user is not None:
+            request.user = user
+        return request
+
+    def _admitted(self, throttle_class, user=None, times=10):
+        results = []
+        for _ in range(times):
+            throttle = throttle_class()
+            results.append(throttle.allow_request(self._request(user), None))
+        return results, throttle
+
+    def test_analyze_budget_is_enforced_and_reports_a_wait(self):
+        results, throttle = self._admitted(AnalyzeThrottle, self.free, times=5)
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertGreater(throttle.wait(), 0)
+        self.assertEqual(RateLimitBucket.objects.count(), 1)
+
+    def test_analyze_budget_follows_the_plan(self):
+        results, _ = self._admitted(AnalyzeThrottle, self.pro, times=8)
+        self.assertEqual(results.count(True), 6)
+
+    def test_clients_have_separate_buckets(self):
+        self._admitted(AnalyzeThrottle, self.free, times=3)
+        results, _ = self._admitted(AnalyzeThrottle, None, times=1)
+        self.assertEqual(results, [True])
+
+    def test_analyze_bucket_refills_over_time(self):
+        start = 1_000_000.0
+        with mock.patch('core.throttling.time.time', return_value=start):
+            self._admitted(AnalyzeThrottle, self.free, times=3)
+            self.assertFalse(AnalyzeThrottle().allow_request(self._request(self.free), None))
+        # 3/hour refills one token every 1200 s
+        with mock.patch('core.throttling.time.time', return_value=start + 1200):
+            results, _ = self._admitted(AnalyzeThrottle, self.free, times=2)
+        self.assertEqual(results, [True, False])
+
+    def test_prune_drops_only_buckets_that_have_refilled(self):
+        now = 1_000_000.0
+        RateLimitBucket.objects.create(key='analyze:user:1', tokens=0, updated_at=now - 3601)
+        RateLimitBucket.objects.create(key='analyze:user:2', tokens=0, updated_at=now - 60)
+        self.assertEqual(prune_idle_buckets('analyze', now), 1)
+        self.assertEqual(list(RateLimitBucket.objects.values_list('key', flat=True)), ['analyze:user:2'])
+
+    def test_cache_throttle_enforces_the_api_budget(self):
+        results, throttle = self._admitted(PlanTokenBucketThrottle, self.free, times=3)
+        self.assertEqual(results, [True, True, False])
+        self.assertGreater(throttle.wait(), 0)
+        self.assertEqual(RateLimitBucket.objects.count(), 0)
+
+
+class PipelineSlotsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.slots = PipelineSlots(self.directory, 2)
+
+    def test_saturated_slots_refuse_without_waiting(self):
+        first, second = self.slots.try_acquire(), self.slots.try_acquire()
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(self.slots.try_acquire())
+        self.slots.release(first)
+        self.slots.release(second)
+
+    def test_release_frees_a_slot(self):
+        first, second = self.slots.try_acquire(), self.slots.try_acquire()
+        self.slots.release(first)
+        third = self.slots.try_acquire()
+        self.assertIsNotNone(third)
+        self.slots.release(second)
+        self.slots.release(third)
+
+    def test_release_of_none_is_a_no_op(self):
+        self.slots.release(None)
+
+
+class PlanSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = PlanScheduler(
+            slots=1, weights={'enterprise': 4, 'pro': 2, 'free': 1}, starvation_s=30, max_wait_s=10,
+        )
+
+    def _grant_order(self, tickets):
+        """Free the single slot repeatedly and record which queued ticket runs next."""
+        order = []
+        while any(not t.granted for t in tickets):
+            with self.scheduler._cond:
+                self.scheduler._free += 1
+                self.scheduler._dispatch()
+            granted = [t for t in tickets if t.granted and t not in order]
+            order.extend(granted)
+        return [t.tier for t in order]
+
+    def test_tiers_share_slots_by_weight(self):
+        self.scheduler._free = 0
+        tickets = [self.scheduler._enqueue(tier) for tier in ('free', 'pro', 'enterprise') for _ in range(7)]
+        order = self._grant_order(tickets)
+        first = order[:7]
+        self.assertEqual(first.count('enterprise'), 4)
+        self.assertEqual(first.count('pro'), 2)
+        self.assertEqual(first.count('free'), 1)
+        self.assertEqual(order[0], 'enterprise')
+
+    def test_starving_job_is_served_first(self):
+        self.scheduler._free = 0
+        starving = self.scheduler._enqueue('free')
+        starving.enqueued_at -= 31
+        tickets = [starving] + [self.scheduler._enqueue('enterprise') for _ in range(3)]
+        self.assertEqual(self._grant_order(tickets)[0], 'free')
+
+    def test_free_slot_is_granted_immediately(self):
+        with self.scheduler.slot('free', max_wait_s=0):
+            self.assertEqual(self.scheduler.stats()['free_slots'], 0)
+        self.assertEqual(self.scheduler.stats()['free_slots'], 1)
+
+    def test_wait_is_bounded_by_max_wait(self):
+        with self.scheduler.slot('enterprise'):
+            with self.assertRaises(SchedulerTimeout):
+                with self.scheduler.slot('pro', max_wait_s=0.05):
+                    self.fail("granted a slot that was taken")
+            self.assertEqual(self.scheduler.stats()['queue_depth']['pro'], 0)
+        self.assertEqual(self.scheduler.stats()['free_slots'], 1)
+
+
+class _BuyAgent:
+    def __init__(self, result=None):
+        self.result = result if result is not None else {
+            "purchase_recommended": False,
+            "purchase_reason": "Only grey-market sellers were found.",
+            "buy_links": [{"platform": "Amazon", "link": "https://www.amazon.com/dp/B000000001", "description": ""}],
+        }
+        self.calls = 0
+
+    def run(self, buy_request):
+        self.calls += 1
+        return copy.deepcopy(self.result)
+
+
+@override_settings(CACHES=_LOCAL_CACHES)
+class BuyLinkCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.cache = BuyLinkCache(fresh_s=60, stale_s=600)
+        self.request = {"product_name": "Trail Runner 2", "brand": "Acme", "product_category": "shoes",
+                        "impact": {"risk_level": "low", "impact_score": 80}}
+
+    def test_miss_then_fresh_hit_calls_the_agent_once(self):
+        agent = _BuyAgent()
+        first, first_status = self.cache.get(agent, self.request)
+        second, second_status = self.cache.get(agent, self.request)
+        self.assertEqual((first_status, second_status), ('miss', 'fresh'))
+        self.assertEqual(agent.calls, 1)
+        self.assertEqual(second, first)
+
+    def test_stale_entry_is_served_and_refreshed_in_the_background(self):
+        agent = _BuyAgent()
+        self.cache.get(agent, self.request)
+        with mock.patch('core.buy_links.time.time', return_value=time.time() + 120), \
+                mock.patch.object(self.cache, '_schedule_refresh') as schedule:
+            buy_data, status = self.cache.get(agent, self.request)
+        self.assertEqual(status, 'stale')
+        self.assertEqual(len(buy_data['buy_links']), 1)
+        schedule.assert_called_once()
+        self.assertEqual(agent.calls, 1)
+
+    def test_results_without_links_are_not_cached(self):
+        agent = _BuyAgent({"purchase_recommended": False, "purchase_reason": "No product pages.", "buy_links": []})
+        self.cache.get(agent, self.request)
+        _, status = self.cache.get(agent, self.request)
+        self.assertEqual(status, 'miss')
+        self.assertEqual(agent.calls, 2)
+        self.assertIsNone(self.cache.cached(self.request))
+
+    def test_agent_verdict_is_kept_without_a_known_price(self):
+        buy_data, _ = self.cache.get(_BuyAgent(), self.request)
+        self.assertFalse(buy_data['purchase_recommended'])
+        self.assertEqual(buy_data['purchase_reason'], "Only grey-market sellers were found.")
+
+    def test_known_price_overrides_and_keeps_the_agent_reason(self):
+        link = "https://www.amazon.com/dp/B000000001"
+        BuyLinkPrice.objects.create(url=link, url_hash=url_hash(link), host='www.amazon.com',
+                                    price_display='$59.99', priced_at=timezone.now())
+        buy_data, _ = self.cache.get(_BuyAgent(), self.request)
+        self.assertTrue(buy_data['purchase_recommended'])
+        self.assertIn("Current prices were found", buy_data['purchase_reason'])
+        self.assertIn("Only grey-market sellers were found.", buy_data['purchase_reason'])
+        self.assertEqual(buy_data['buy_links'][0]['price'], '$59.99')
+
+    def test_high_risk_analysis_withholds_cached_links(self):
+        self.cache.get(_BuyAgent(), self.request)
+        risky = {**self.request, "impact": {"risk_level": "low", "impact_score": 10}}
+        buy_data, status = self.cache.get(_BuyAgent(), risky)
+        self.assertEqual(status, 'fresh')
+        self.assertEqual(buy_data['buy_links'], [])
+        self.assertFalse(buy_data['purchase_recommended'])
+
+
+class ParseProductUrlTests(SimpleTestCase):
+    def test_amazon_asin_from_any_product_path(self):
+        for url in (
+            "https://www.amazon.com/Acme-Trail-Runner/dp/b0c7q3zk7n/ref=sr_1_1?tag=x",
+            "https://amazon.in/gp/product/B0C7Q3ZK7N",
+            "https://www.amazon.co.uk/gp/aw/d/B0C7Q3ZK7N?th=1",
+        ):
+            ref = parse_product_url(url)
+            self.assertEqual(ref.canonical_id, "amazon:B0C7Q3ZK7N", url)
+        self.assertEqual(parse_product_url("https://www.amazon.in/dp/B0C7Q3ZK7N").url,
+                         "https://www.amazon.in/dp/B0C7Q3ZK7N")
+
+    def test_amazon_search_page_is_not_a_product(self):
+        self.assertIsNone(parse_product_url("https://www.amazon.com/s?k=trail+runner"))
+
+    def test_ebay_item(self):
+        ref = parse_product_url("https://www.ebay.com/itm/acme-trail-runner/123456789012?hash=abc")
+        self.assertEqual(ref.canonical_id, "ebay:123456789012")
+        self.assertEqual(ref.url, "https://www.ebay.com/itm/123456789012")
+
+    def test_walmart_item(self):
+        ref = parse_product_url("https://www.walmart.com/ip/Acme-Trail-Runner/543210987?athbdg=L1600")
+        self.assertEqual(ref.canonical_id, "walmart:543210987")
+        self.assertEqual(ref.url, "https://www.walmart.com/ip/543210987")
+
+    def test_best_buy_sku(self):
+        ref = parse_product_url("https://www.bestbuy.com/site/acme-trail-runner/6501234.p?skuId=6501234")
+        self.assertEqual(ref.canonical_id, "bestbuy:6501234")
+        self.assertEqual(ref.url, "https://www.bestbuy.com/site/6501234.p")
+
+    def test_flipkart_item_keeps_pid(self):
+        ref = parse_product_url("https://www.flipkart.com/acme-runner/p/ITM123abc?pid=SHOE123&lid=x")
+        self.assertEqual(ref.canonical_id, "flipkart:itm123abc")
+        self.assertTrue(ref.url.endswith("?pid=SHOE123"))
+
+    def test_lookalike_hosts_are_rejected(self):
+        for url in (
+            "https://evilflipkart.com/acme/p/itm123abc",
+            "https://notwalmart.com/ip/Acme/543210987",
+            "https://bestbuy.com.example.net/site/x/6501234.p",
+            "https://www.amazon.com.evil.io/dp/B0C7Q3ZK7N",
+            "https://fakeebay.com/itm/123456789012",
+        ):
+            self.assertIsNone(parse_product_url(url), url)
+
+    def test_brand_store_slug(self):
+        ref = parse_product_url("https://www.apple.com/iphone-15/")
+        self.assertEqual(ref.canonical_id, "store:apple.com/iphone-15")
+        self.assertIsNone(parse_product_url("https://www.apple.com/"))
+
+
+class JsonRepairTests(SimpleTestCase):
+    def test_clean_json(self):
+        self.assertEqual(parse_json_lenient('{"a": 1}'), ({"a": 1}, 'clean'))
+
+    def test_fenced_json_with_prose(self):
+        text = 'Here you go:\n```json\n{"a": 1, "b": [2]}\n```\nLet me know if you need more.'
+        self.assertEqual(parse_json_lenient(text), ({"a": 1, "b": [2]}, 'local'))
+
+    def test_trailing_commas_and_python_literals(self):
+        value, how = parse_json_lenient("{'ok': True, 'missing': None, 'items': [1, 2,],}")
+        self.assertEqual(value, {"ok": True, "missing": None, "items": [1, 2]})
+        self.assertEqual(how, 'local')
+
+    def test_literals_inside_strings_are_left_alone(self):
+        value, _ = parse_json_lenient('{"note": "True story, None the wiser",}')
+        self.assertEqual(value, {"note": "True story, None the wiser"})
+
+    def test_truncated_output_is_closed(self):
+        value, _ = parse_json_lenient('{"name": "Trail Runner", "tags": ["shoe", "run')
+        self.assertEqual(value["name"], "Trail Runner")
+        self.assertEqual(value["tags"][0], "shoe")
+
+    def test_accept_chooses_a_later_candidate(self):
+        text = 'Example: {"example": true}\nAnswer: {"product_name": "Trail Runner"}'
+        # Candidates are tried largest first
+        value, _ = parse_json_lenient(text, accept=lambda v: "example" in v)
+        self.assertEqual(value, {"example": True})
+        # Nothing accepted: the first object that parsed is still returned
+        value, _ = parse_json_lenient(text, accept=lambda v: False)
+        self.assertEqual(value, {"product_name": "Trail Runner"})
+
+    def test_no_json_raises(self):
+        with self.assertRaises(ValueError):
+            parse_json_lenient("I could not identify the product.")
+        with self.assertRaises(ValueError):
+            parse_json_lenient(None)
+
+    def test_matches_schema(self):
+        schema = {"a": Field('str'), "b": Field('float'), "c": Field('bool'), "d": Field('list')}
+        self.assertTrue(matches_schema({"a": "x", "b": 1}, schema))
+        self.assertFalse(matches_schema({"a": "x"}, schema))
+        self.assertTrue(matches_schema({"error": "refused"}, schema))
+        self.assertFalse(matches_schema(["a", "b"], schema))
+
+    def test_coerce_to_schema_fills_defaults_and_bounds(self):
+        schema = {
+            "score": Field('float', default=0.0, bounds=(0.0, 1.0)),
+            "ok": Field('bool', default=False),
+            "links": Field('objects', default=[], required=("link",), item={"link": Field('str', default="")}),
+        }
+        out = coerce_to_schema({"score": "85%", "ok": "yes", "links": [{"link": ""}, {"link": "https://x"}]}, schema)
+        self.assertEqual(out, {"score": 0.85, "ok": True, "links": [{"link": "https://x"}]})
+        self.assertEqual(coerce_to_schema({}, schema)["links"], [])
+
+
+@override_settings(DEADLINE_MIN_CALL_S=0.1)
+class ModelCallDeadlineTests(SimpleTestCase):
+    def setUp(self):
+        # Accepts connections but never answers, so every call ends in a read timeout
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.addCleanup(self.server.close)
+        port = self.server.getsockname()[1]
+        env = mock.patch.dict(os.environ, {
+            "OPENAI_API_KEY": "test", "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def _agent(self, deadline_s, timeout_s, fallback_model=None):
+        agent = BaseAgent()
+        agent.route = Route('TestAgent', 'model-a', timeout_s=timeout_s, fallback_model=fallback_model)
+        agent.deadline = Deadline(deadline_s)
+        return agent
+
+    def _call(self, agent):
+        create = mock.Mock(wraps=agent.client.chat.completions.create)
+        started = time.monotonic()
+        with self.assertRaises(Exception):
+            agent._routed(create, messages=[{"role": "user", "content": "hi"}])
+        return time.monotonic() - started, create.call_count
+
+    def test_client_does_not_retry_on_its_own(self):
+        self.assertEqual(get_openai_client().max_retries, 0)
+
+    def test_timed_out_call_returns_within_the_deadline(self):
+        elapsed, calls = self._call(self._agent(deadline_s=1.0, timeout_s=30))
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual(calls, 1)
+
+    def test_fallback_is_the_only_retry(self):
+        elapsed, calls = self._call(self._agent(deadline_s=30, timeout_s=0.5, fallback_model='model-b'))
+        self.assertEqual(calls, 2)
+        self.assertLess(elapsed, 1.5)
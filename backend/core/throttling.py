@@ -0,0 +1,145 @@
+import logging
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from rest_framework.throttling import BaseThrottle
+
+from .models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Idle RateLimitBucket rows are deleted at most this often per process
+_PRUNE_EVERY_S = 600
+_last_prune = 0.0
+
+
+def parse_rate(rate: str) -> Tuple[float, float]:
+    """'30/hour' -> (capacity 30, refill 30/3600 tokens per second)."""
+    num, period = rate.split('/')
+    capacity = float(num)
+    return capacity, capacity / _PERIODS[period.strip()[0].lower()]
+
+
+def prune_idle_buckets(scope: str = 'analyze', now: Optional[float] = None) -> int:
+    """Delete RateLimitBucket rows idle long enough to have refilled completely.
+
+    A full bucket behaves exactly like a missing one, so this never changes a
+    throttling decision; it only keeps the table at the recently active clients.
+    """
+    rates = (settings.PLAN_THROTTLE_RATES.get(scope) or {}).values()
+    refill_s = max((capacity / per_s for capacity, per_s in map(parse_rate, rates) if per_s), default=0)
+    cutoff = (time.time() if now is None else now) - refill_s
+    deleted, _ = RateLimitBucket.objects.filter(key__startswith=f"{scope}:", updated_at__lt=cutoff).delete()
+    return deleted
+
+
+class PlanTokenBucketThrottle(BaseThrottle):
+    """Token-bucket throttle with budgets per `User.plan`, kept in the shared cache.
+
+    Unlike DRF's cache-based throttles (local memory per gunicorn worker), every
+    worker draws from the same bucket. The limit is approximate: the cache
+    read-modify-write is not atomic, so concurrent requests can both spend the
+    same token. That is fine for the general 'api' budget, which every request
+    pays. Idle buckets expire once they would have refilled.
+    Rates come from settings.PLAN_THROTTLE_RATES[scope][plan]; anonymous
+    requests use the 'anon' entry and are keyed by client IP.
+    """
+    scope = 'api'
+
+    def __init__(self):
+        self._wait: Optional[float] = None
+
+    def get_plan_and_ident(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return getattr(user, 'plan', 'free') or 'free', f"user:{user.pk}"
+        return 'anon', f"ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        plan, ident = self.get_plan_and_ident(request)
+        rates = settings.PLAN_THROTTLE_RATES.get(self.scope) or {}
+        rate = rates.get(plan) or rates.get('free')
+        if not rate:
+            return True
+        capacity, refill_per_s = parse_rate(rate)
+        key = f"{self.scope}:{ident}"
+
+        try:
+            allowed, tokens = self._take(key, capacity, refill_per_s)
+        except Exception as e:
+            # Never turn a throttle-store hiccup into an outage
+            logger.warning("Throttle store unavailable for %s: %s", key, e)
+            return True
+
+        if not allowed:
+            self._wait = (1 - tokens) / refill_per_s if refill_per_s else None
+        return allowed
+
+    def _take(self, key, capacity, refill_per_s):
+        store = caches['shared']
+        now = time.time()
+        tokens, updated_at = store.get(f"throttle:{key}") or (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_per_s)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        refill_s = (capacity - tokens) / refill_per_s if refill_per_s else None
+        store.set(f"throttle:{key}", (tokens, now), timeout=max(1, int(refill_s) + 1) if refill_s is not None else None)
+        return allowed, tokens
+
+    def wait(self):
+        return self._wait
+
+
+class AnalyzeThrottle(PlanTokenBucketThrottle):
+    """The /analyze/ budget: exact, with one RateLimitBucket row per client.
+
+    A token is taken by a single conditional UPDATE (refill, check and spend in
+    SQL), so concurrent workers can never both spend the last token, on SQLite
+    as on Postgres. Only this scope pays for a database write per request,
+    because an over-admitted analysis costs model calls. Rows idle long enough
+    to be full again are pruned opportunistically (see prune_idle_buckets).
+    """
+    scope = 'analyze'
+
+    def _take(self, key, capacity, refill_per_s):
+        now = time.time()
+        self._maybe_prune(now)
+        available = Least(
+            Value(float(capacity)),
+            F('tokens') + Greatest(Value(0.0), Value(now) - F('updated_at')) * Value(refill_per_s),
+        )
+        for _ in range(2):
+            taken = RateLimitBucket.objects.filter(GreaterThanOrEqual(available, Value(1.0)), key=key).update(
+                tokens=available - Value(1.0), updated_at=Greatest(F('updated_at'), Value(now)),
+            )
+            if taken:
+                return True, None
+            bucket = RateLimitBucket.objects.filter(key=key).values_list('tokens', 'updated_at').first()
+            if bucket is not None:
+                tokens, updated_at = bucket
+                return False, min(capacity, tokens + max(0.0, now - updated_at) * refill_per_s)
+            try:
+                with transaction.atomic():
+                    RateLimitBucket.objects.create(key=key, tokens=capacity - 1, updated_at=now)
+                return True, capacity - 1
+            except IntegrityError:
+                continue  # created concurrently by another worker; take from theirs
+        return True, capacity
+
+    def _maybe_prune(self, now: float):
+        global _last_prune
+        if now - _last_prune < _PRUNE_EVERY_S:
+            return
+        _last_prune = now
+        try:
+            prune_idle_buckets(self.scope, now)
+        except Exception as e:
+            logger.warning("Pruning idle throttle buckets failed: %s", e)
@@ -0,0 +1,77 @@
+import hashlib
+import io
+from typing import Optional
+
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Identify JPEG/PNG/WEBP from magic bytes (PIL names)."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if len(head) >= 12 and head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class HashedUploadedFile(InMemoryUploadedFile):
+    """In-memory upload that also carries its SHA-256 digest and sniffed format."""
+
+    def __init__(self, *args, digest: str, sniffed_format: Optional[str], truncated: bool, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.digest = digest
+        self.sniffed_format = sniffed_format
+        self.truncated = truncated
+
+    def getbuffer(self) -> memoryview:
+        """Zero-copy view of the uploaded bytes."""
+        return self.file.getbuffer()
+
+
+class HashingMemoryUploadHandler(FileUploadHandler):
+    """Read each uploaded file exactly once into memory, hashing it as chunks stream in.
+
+    Files larger than `max_bytes` stop being buffered (only their size is
+    tracked) so the view can reject them without holding them in memory.
+    """
+
+    def __init__(self, request=None, max_bytes: int = MAX_IMAGE_BYTES):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.buffer = io.BytesIO()
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.sniffed_format = None
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            self.sniffed_format = sniff_image_format(raw_data[:16])
+        self.received += len(raw_data)
+        if self.received <= self.max_bytes:
+            self.hasher.update(raw_data)
+            self.buffer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.buffer.seek(0)
+        return HashedUploadedFile(
+            file=self.buffer,
+            field_name=self.field_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            digest=self.hasher.hexdigest(),
+            sniffed_format=self.sniffed_format,
+            truncated=self.received > self.max_bytes,
+        )
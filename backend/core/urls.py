@@ -6,15 +6,37 @@ from .views import (
     LoginView,
     DemoLoginView,
     ProfileView,
-    ProductChatView
+    ProductChatView,
+    AnalysisHistoryView,
+    AnalysisSearchView,
+    AnalysisDetailView,
+    AnalysisRetryView,
+    MediaThumbnailView,
+    SchedulerMetricsView,
+    CacheMetricsView,
+    VisionMetricsView,
+    LLMMetricsView
 )
 
 urlpatterns = [
     # Analysis
     path('analyze/', AnalyzeImageView.as_view(), name='analyze_image'),
     path('health/', HealthCheckView.as_view(), name='health_check'),
+    path('metrics/scheduler/', SchedulerMetricsView.as_view(), name='scheduler_metrics'),
+    path('metrics/cache/', CacheMetricsView.as_view(), name='cache_metrics'),
+    path('metrics/vision/', VisionMetricsView.as_view(), name='vision_metrics'),
+    path('metrics/llm/', LLMMetricsView.as_view(), name='llm_metrics'),
     path('chat/', ProductChatView.as_view(), name='product_chat'),
+
+    # History
+    path('history/', AnalysisHistoryView.as_view(), name='analysis_history'),
+    path('history/search/', AnalysisSearchView.as_view(), name='analysis_search'),
+    path('history/<int:pk>/', AnalysisDetailView.as_view(), name='analysis_detail'),
+    path('history/<int:pk>/retry/', AnalysisRetryView.as_view(), name='analysis_retry'),
     
+    # Media
+    path('media/<str:digest>/thumb/<int:size>/', MediaThumbnailView.as_view(), name='media_thumbnail'),
+
     # Authentication
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', LoginView.as_view(), name='login'),
@@ -4,22 +4,60 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from django.contrib.auth import authenticate, get_user_model
-from PIL import Image
-from .models import UploadedImage
-from .serializers import RegisterSerializer, LoginSerializer, UserSerializer
+from .models import AnalysisCheckpoint, UploadedImage, ChatSession, MediaObject
+from .serializers import (
+    RegisterSerializer,
+    LoginSerializer,
+    UserSerializer,
+    AnalysisSummarySerializer,
+    AnalysisDetailSerializer,
+)
 from .orchestrator import Orchestrator
+from .deadline import Deadline
+from .checkpoints import (
+    CheckpointWriter,
+    claim_checkpoint,
+    completed_steps,
+    finish_checkpoint,
+    release_checkpoint,
+    start_checkpoint,
+)
 from .web_extract import fetch_url_html, extract_main_image_from_html
-from .agents import ProductChatAgent
+from .agents import ProductChatAgent, ChatSummaryAgent
+from .chat_memory import ChatMemory
+from .cache import cache_stats
+from .metrics import metrics
+from .routing import route_for
+from .chat_cache import chat_answer_cache
+from .product_ids import canonicalize, lookup_identity
+from .report_index import invalidate_report_index, report_cache_key
+from .search import search_analyses
+from .shaping import LEAN_SUMMARY_DROP, lean_report, parse_fields, select_fields, top_level_fields, wants_lean
+from .report_store import split_report, save_detached_sections, load_report
+from .media_store import acquire as acquire_media, store_image_async, ensure_thumbnail, thumbnail_urls
+from .upload_handlers import HashingMemoryUploadHandler, MAX_IMAGE_BYTES
+from .throttling import PlanTokenBucketThrottle, AnalyzeThrottle
+from .admission import pipeline_slots
+from .scheduler import SchedulerTimeout, plan_scheduler
+from django.conf import settings
 import time
 import os
+import logging
 import json
 import re
+import base64
+from datetime import datetime
+from decimal import Decimal
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse, Http404
+from django.core.files.storage import default_storage
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 _TRACKING_PARAM_KEYS = {
     'fbclid',
@@ -85,6 +123,37 @@ def _sanitize_product_url(raw_url: str) -> Optional[str]:
     return final.rstrip('?')
 
 
+def _encode_cursor(upload) -> str:
+    raw = f"{upload.uploaded_at.isoformat()}|{upload.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str):
+    """Return (uploaded_at, id) or None when the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        stamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(stamp), int(pk)
+    except Exception:
+        return None
+
+
+def _summary_context(request, fields):
+    """Serializer context for history rows honouring ?fields= and ?lean=1."""
+    return {
+        'request': request,
+        'only_fields': top_level_fields(fields),
+        'drop_fields': LEAN_SUMMARY_DROP if wants_lean(request) else (),
+    }
+
+
+def _refresh_token_for(user):
+    # SimpleJWT's token classes are only needed by the auth endpoints
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return RefreshToken.for_user(user)
+
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
     
@@ -92,7 +161,7 @@ class RegisterView(APIView):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = _refresh_token_for(user)
             
             return Response({
                 'status': 'success',
@@ -133,7 +202,7 @@ class LoginView(APIView):
             user = authenticate(request, username=user.username, password=password)
             
             if user is not None:
-                refresh = RefreshToken.for_user(user)
+                refresh = _refresh_token_for(user)
                 
                 return Response({
                     'status': 'success',
@@ -178,7 +247,7 @@ class DemoLoginView(APIView):
             demo_user.set_password('demo123')
             demo_user.save()
         
-        refresh = RefreshToken.for_user(demo_user)
+        refresh = _refresh_token_for(demo_user)
         
         return Response({
             'status': 'success',
@@ -222,6 +291,7 @@ class ProfileView(APIView):
 class AnalyzeImageView(APIView):
     permission_classes = [AllowAny]  # Auth handled by Neon Auth on frontend
     parser_classes = (MultiPartParser, FormParser, JSONParser)  # Support both FormData and JSON
+    throttle_classes = [PlanTokenBucketThrottle, AnalyzeThrottle]
 
     def _parse_product_urls(self, raw):
         if not raw:
@@ -251,27 +321,34 @@ class AnalyzeImageView(APIView):
             raw_list = [str(raw).strip()]
 
         sanitized_urls = []
-        seen = set()
         for entry in raw_list:
             if not entry:
                 continue
             cleaned = _sanitize_product_url(entry)
-            if not cleaned or cleaned in seen:
-                continue
-            seen.add(cleaned)
-            sanitized_urls.append(cleaned)
+            if cleaned and cleaned not in sanitized_urls:
+                sanitized_urls.append(cleaned)
         return sanitized_urls
 
+    def initial(self, request, *args, **kwargs):
+        # Must be set before request.data is parsed: each upload is read exactly once,
+        # into memory, hashed and sniffed as it streams in.
+        request.upload_handlers = [HashingMemoryUploadHandler(request._request)]
+        super().initial(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"[ANALYZE] Request received: content_type={request.content_type}, has_image={'image' in request.data}, data_keys={list(request.data.keys())}")
+        logger.debug(
+            "[ANALYZE] Request received",
+            extra={"content_type": request.content_type, "has_image": 'image' in request.data,
+                   "data_keys": list(request.data.keys())},
+        )
         
         start_time = time.time()
+        # One time budget for the whole request, passed down to every model call and page fetch
+        deadline = Deadline(settings.ANALYZE_DEADLINE_S)
 
         # Optional: product URLs provided by user
         product_urls = self._parse_product_urls(request.data.get('product_urls'))
-        logger.info(f"[ANALYZE] Parsed {len(product_urls)} product URLs")
+        logger.debug("[ANALYZE] Parsed %d product URLs", len(product_urls))
         
         # 1. Validate Image Upload (optional if URLs provided)
         image_file = request.data.get('image')
@@ -280,29 +357,64 @@ class AnalyzeImageView(APIView):
             return Response({"error": "Provide an image or product URLs"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Security Check: Size (Max 5MB) - only if image provided
+        image_format = None
         if image_file:
-            if image_file.size > 5 * 1024 * 1024:
+            if image_file.size > MAX_IMAGE_BYTES:
                 return Response({"error": "Image too large. Max size is 5MB."}, status=status.HTTP_400_BAD_REQUEST)
 
+            # Cheap magic-byte check (done while streaming) before the full decode
+            if getattr(image_file, 'sniffed_format', 'unknown') is None:
+                return Response({"error": "Unsupported format. Use JPEG, PNG, or WEBP."}, status=status.HTTP_400_BAD_REQUEST)
+
             # Security Check: Integrity & Format
             try:
+                from PIL import Image
+
                 img = Image.open(image_file)
                 img.verify() # Checks for corruption
                 if img.format not in ['JPEG', 'PNG', 'WEBP']:
                     return Response({"error": "Unsupported format. Use JPEG, PNG, or WEBP."}, status=status.HTTP_400_BAD_REQUEST)
+                image_format = img.format
             except Exception:
                 return Response({"error": "Invalid image file."}, status=status.HTTP_400_BAD_REQUEST)
             
             # Reset file pointer after verify()
             image_file.seek(0)
         
+        # Paying tiers are admitted first when this worker is busy; nothing is saved
+        # until the job is granted a slot, so a timed-out wait leaves no record behind
+        plan = getattr(request.user, 'plan', None) if request.user.is_authenticated else None
+        try:
+            with plan_scheduler.slot(plan, max_wait_s=_queue_wait_s(deadline)):
+                # Admission control: only running jobs hold a global pipeline slot, so a
+                # queue of waiting free-tier jobs cannot shed paying requests with a 503
+                slot = pipeline_slots.try_acquire()
+                if slot is None:
+                    logger.warning("[ANALYZE] Pipeline saturated; rejecting request")
+                    return _server_busy()
+                try:
+                    return self._analyze(request, start_time, deadline, product_urls, image_file, image_format)
+                finally:
+                    pipeline_slots.release(slot)
+        except SchedulerTimeout:
+            logger.warning("[ANALYZE] No scheduler slot within the request deadline; rejecting request")
+            return _server_busy()
+
+    def _analyze(self, request, start_time, deadline, product_urls, image_file, image_format):
+        # Slug, ref-path and short-link variants of one product collapse to a single URL.
+        # Short links need a network round trip, so this runs only once admitted.
+        product_urls = _canonical_product_urls(product_urls, deadline)
+
         # 2. Save Initial Record
         # Try to fetch a representative product image from provided URLs when no file uploaded
         fetched_image_url = None
-        if not image_file and product_urls:
+        known_identity = lookup_identity(product_urls) if not image_file and product_urls else None
+        if known_identity is not None and known_identity.image_url:
+            fetched_image_url = known_identity.image_url
+        elif not image_file and product_urls:
             for u in product_urls:
                 try:
-                    html = fetch_url_html(u)
+                    html = fetch_url_html(u, deadline=deadline)
                     if not html:
                         continue
                     img = extract_main_image_from_html(html, base_url=u)
@@ -312,39 +424,393 @@ class AnalyzeImageView(APIView):
                 except Exception:
                     continue
 
-        upload_instance = UploadedImage.objects.create(image=image_file) if image_file else UploadedImage.objects.create()
+        owner = request.user if request.user.is_authenticated else None
+        upload_instance = UploadedImage.objects.create(user=owner)
+        # If we fetched an image URL from the product page, pass it to the orchestrator
+        image_path = fetched_image_url if (fetched_image_url and not image_file) else None
+
+        # Each step's output is checkpointed, so signed-in users can retry an interrupted
+        # or partly failed analysis without paying for the finished steps again
+        checkpoint = None
+        if owner is not None:
+            checkpoint = start_checkpoint(upload_instance, {
+                "product_urls": product_urls,
+                "image_path": image_path,
+                "image_digest": getattr(image_file, 'digest', None) if image_file else None,
+                "image_format": image_format,
+            })
+
+        # The upload was read once into memory; the same buffer feeds the content-addressed
+        # store (on a worker thread, overlapping the model calls) and the vision agent.
+        image_bytes = None
+        media_future = None
+        if image_file:
+            image_bytes = image_file.getbuffer() if hasattr(image_file, 'getbuffer') else image_file.read()
+            media_future = store_image_async(image_bytes, image_format, digest=getattr(image_file, 'digest', None))
         
         # 3. Trigger Orchestrator
         # Note: In production, this should be a Celery task.
         # For MVP, we run synchronously (User waits ~10-20s).
         try:
-            if image_file:
-                image_path = upload_instance.image.path
-            else:
-                # If we fetched an image URL from the product page, pass it to the orchestrator
-                image_path = fetched_image_url if fetched_image_url else None
             orchestrator = Orchestrator()
-            report = orchestrator.process(image_path, product_urls=product_urls)
+            report = orchestrator.process(
+                image_path,
+                product_urls=product_urls,
+                image_bytes=image_bytes,
+                image_format=image_format,
+                known_identity=known_identity,
+                deadline=deadline,
+                checkpoint=CheckpointWriter(checkpoint) if checkpoint is not None else None,
+            )
             
-            upload_instance.analysis_report = report
             upload_instance.processed = True
         except Exception as e:
-            upload_instance.analysis_report = {"error": str(e), "status": "failed"}
-        
-        processing_time = int((time.time() - start_time) * 1000)
-        upload_instance.processing_time_ms = processing_time
-        upload_instance.save()
+            report = {"error": str(e), "status": "failed"}
+
+        media = None
+        if media_future is not None:
+            try:
+                # Identical photos share one stored file (and its thumbnails)
+                media = media_future.result()
+                upload_instance.media = media
+                upload_instance.image.name = media.file.name
+            except Exception as e:
+                logger.error("[ANALYZE] Storing upload failed: %s", e)
+        if isinstance(image_bytes, memoryview):
+            # Release the export so the upload buffer can be closed with the request
+            image_bytes.release()
+
+        _save_analysis(upload_instance, report, int((time.time() - start_time) * 1000))
+        if checkpoint is not None:
+            finish_checkpoint(checkpoint, report)
 
         return Response({
             "status": "success",
             "message": "Analysis complete.",
+            "data": _analysis_data(request, upload_instance, report, media, fallback_image_url=fetched_image_url),
+        }, status=status.HTTP_201_CREATED)
+
+
+def _canonical_product_urls(urls, deadline):
+    canonical = []
+    seen = set()
+    for url in urls:
+        url, ref = canonicalize(url, deadline=deadline)
+        key = ref.canonical_id if ref else url
+        if key not in seen:
+            seen.add(key)
+            canonical.append(url)
+    return canonical
+
+
+def _server_busy():
+    return Response(
+        {"error": "Server is busy. Please retry shortly."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(settings.PIPELINE_RETRY_AFTER_S)},
+    )
+
+
+def _queue_wait_s(deadline):
+    """How long a job may wait for a scheduler slot and still have time to run a step."""
+    return max(0.0, deadline.remaining() - settings.DEADLINE_MIN_CALL_S)
+
+
+def _save_analysis(upload, report, processing_time_ms):
+    """Store a finished (or failed) report with its timing and model cost."""
+    # Heavy sections (web_context) go to a compressed side table; the row keeps a lean core
+    upload.analysis_report, detached = split_report(report)
+    upload.processing_time_ms = processing_time_ms
+    meta = report.get('meta') if isinstance(report, dict) else None
+    if isinstance(meta, dict) and meta.get('llm_cost_usd') is not None:
+        upload.cost_incurred = round(Decimal(str(meta['llm_cost_usd'])), 4)
+    upload.save()
+    save_detached_sections(upload, detached)
+
+
+def _analysis_data(request, upload, report, media=None, fallback_image_url=None):
+    # ?lean=1 drops rarely displayed sections; ?fields=id,report.data.impact selects paths
+    data = {
+        "id": upload.id,
+        "image_url": request.build_absolute_uri(upload.image.url) if upload.image else fallback_image_url,
+        "thumbnails": thumbnail_urls(media, request),
+        "created_at": upload.uploaded_at,
+        "report": lean_report(report) if wants_lean(request) else report,
+    }
+    return select_fields(data, parse_fields(request.query_params.get('fields')))
+
+
+class AnalysisRetryView(APIView):
+    """Resume an interrupted or partly failed analysis from its checkpoint.
+
+    Only steps without output run again, so a retry costs just the remaining model
+    calls. Idempotent: an analysis with nothing left to run is returned as-is, and a
+    retry while another run holds the checkpoint gets 409.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [PlanTokenBucketThrottle, AnalyzeThrottle]
+
+    def post(self, request, pk):
+        start_time = time.time()
+        deadline = Deadline(settings.ANALYZE_DEADLINE_S)
+        upload = UploadedImage.objects.filter(pk=pk, user=request.user).select_related('media').first()
+        if upload is None:
+            return Response({"error": "Analysis not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        checkpoint = claim_checkpoint(upload)
+        if checkpoint is None:
+            if AnalysisCheckpoint.objects.filter(upload=upload).exists():
+                return Response(
+                    {"error": "This analysis is already running. Please retry shortly."},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': str(settings.PIPELINE_RETRY_AFTER_S)},
+                )
+            return Response({
+                "status": "success",
+                "message": "Analysis already complete.",
+                "data": _analysis_data(request, upload, load_report(upload), upload.media),
+            }, status=status.HTTP_200_OK)
+
+        try:
+            with plan_scheduler.slot(getattr(request.user, 'plan', None), max_wait_s=_queue_wait_s(deadline)):
+                slot = pipeline_slots.try_acquire()
+                if slot is None:
+                    release_checkpoint(checkpoint)
+                    logger.warning("[RETRY] Pipeline saturated; rejecting request")
+                    return _server_busy()
+                try:
+                    return self._resume(request, upload, checkpoint, start_time, deadline)
+                finally:
+                    pipeline_slots.release(slot)
+        except SchedulerTimeout:
+            release_checkpoint(checkpoint)
+            logger.warning("[RETRY] No scheduler slot within the request deadline; rejecting request")
+            return _server_busy()
+
+    def _resume(self, request, upload, checkpoint, start_time, deadline):
+        inputs = checkpoint.inputs or {}
+        # A worker killed mid-run never linked the stored upload to its record. Linking it
+        # takes a reference, saved right away, so releasing another record's copy of the
+        # same image cannot delete the file this one now uses
+        media = upload.media
+        if media is None and inputs.get('image_digest'):
+            with transaction.atomic():
+                media = acquire_media(inputs['image_digest'])
+                if media is not None:
+                    upload.media = media
+                    upload.image.name = media.file.name
+                    upload.save(update_fields=['media', 'image'])
+
+        image_bytes = None
+        if 'visual_id' not in completed_steps(checkpoint.report) and inputs.get('image_digest'):
+            if media is None:
+                release_checkpoint(checkpoint)
+                return Response(
+                    {"error": "The original image is no longer available. Please upload it again."},
+                    status=status.HTTP_410_GONE,
+                )
+            with media.file.open('rb') as image:
+                image_bytes = image.read()
+
+        try:
+            orchestrator = Orchestrator()
+            report = orchestrator.resume(
+                checkpoint.report,
+                image_path=inputs.get('image_path'),
+                product_urls=inputs.get('product_urls') or [],
+                image_bytes=image_bytes,
+                image_format=inputs.get('image_format'),
+                deadline=deadline,
+                checkpoint=CheckpointWriter(checkpoint),
+            )
+        except Exception as e:
+            # The saved report is left as it was; the checkpoint stays available
+            logger.error("[RETRY] Resuming analysis %s failed: %s", upload.id, e)
+            release_checkpoint(checkpoint)
+            return Response({"error": f"Retry failed: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Chat answers and the retrieval index were built from the report being replaced
+        old_report_key = report_cache_key(load_report(upload), upload.id) if upload.analysis_report else None
+        upload.processed = True
+        # Time and cost accumulate over attempts (llm_cost_usd already includes earlier ones)
+        _save_analysis(upload, report, upload.processing_time_ms + int((time.time() - start_time) * 1000))
+        finish_checkpoint(checkpoint, report)
+        if old_report_key is not None:
+            invalidate_report_index(old_report_key)
+            chat_answer_cache.invalidate(old_report_key)
+        return Response({
+            "status": "success",
+            "message": "Analysis resumed.",
+            "data": _analysis_data(request, upload, report, media),
+        }, status=status.HTTP_200_OK)
+
+
+class AnalysisHistoryView(APIView):
+    """Keyset-paginated list of the requester's analyses, newest first."""
+    permission_classes = [IsAuthenticated]
+    default_page_size = 20
+    max_page_size = 100
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_page_size))
+        except ValueError:
+            limit = self.default_page_size
+        limit = max(1, min(limit, self.max_page_size))
+
+        # Served by upload_user_recent_idx: (user, -uploaded_at, -id)
+        queryset = (
+            UploadedImage.objects
+            .filter(user=request.user)
+            .select_related('media')
+            .defer('analysis_report')
+            .order_by('-uploaded_at', '-id')
+        )
+
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            position = _decode_cursor(cursor)
+            if position is None:
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            uploaded_at, pk = position
+            queryset = queryset.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk))
+
+        rows = list(queryset[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        fields = parse_fields(request.query_params.get('fields'))
+        results = AnalysisSummarySerializer(rows, many=True, context=_summary_context(request, fields)).data
+        return Response({
+            "status": "success",
             "data": {
-                "id": upload_instance.id,
-                "image_url": request.build_absolute_uri(upload_instance.image.url) if image_file else fetched_image_url,
-                "created_at": upload_instance.uploaded_at,
-                "report": upload_instance.analysis_report
+                "results": select_fields(results, fields),
+                "next_cursor": _encode_cursor(rows[-1]) if has_more else None,
             }
-        }, status=status.HTTP_201_CREATED)
+        }, status=status.HTTP_200_OK)
+
+
+class AnalysisSearchView(APIView):
+    """Find earlier analyses of a product by name, category or brand."""
+    permission_classes = [IsAuthenticated]
+    max_results = 50
+
+    def get(self, request):
+        query = (request.query_params.get('q') or '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), self.max_results))
+        except ValueError:
+            limit = 20
+
+        # Staff can check whether anyone has analyzed the product before
+        everyone = request.user.is_staff and request.query_params.get('scope') == 'all'
+        rows = search_analyses(query, user_id=None if everyone else request.user.id, limit=limit)
+        fields = parse_fields(request.query_params.get('fields'))
+        results = AnalysisSummarySerializer(rows, many=True, context=_summary_context(request, fields)).data
+        return Response({
+            "status": "success",
+            "data": {"results": select_fields(results, fields)}
+        }, status=status.HTTP_200_OK)
+
+
+class AnalysisDetailView(APIView):
+    """Full report for a single analysis owned by the requester.
+
+    Detached sections are only decompressed when asked for, e.g. `?include=web_context`.
+    `?fields=` and `?lean=1` trim the response as on the history list.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        upload = UploadedImage.objects.filter(pk=pk, user=request.user).first()
+        if upload is None:
+            return Response({"error": "Analysis not found"}, status=status.HTTP_404_NOT_FOUND)
+        include = [part.strip() for part in request.query_params.get('include', '').split(',') if part.strip()]
+        report = load_report(upload, include=include)
+        fields = parse_fields(request.query_params.get('fields'))
+        context = _summary_context(request, fields)
+        context['report'] = lean_report(report) if wants_lean(request) else report
+        return Response({
+            "status": "success",
+            "data": select_fields(AnalysisDetailSerializer(upload, context=context).data, fields)
+        }, status=status.HTTP_200_OK)
+
+
+class MediaThumbnailView(APIView):
+    """Serve a WebP thumbnail of a stored upload, rendering it on first request."""
+    permission_classes = [AllowAny]
+
+    def get(self, request, digest, size):
+        media = MediaObject.objects.filter(digest=digest).first()
+        if media is None:
+            raise Http404("Unknown media")
+        try:
+            name = ensure_thumbnail(media, size)
+        except Exception:
+            name = None
+        if not name:
+            raise Http404("Thumbnail unavailable")
+
+        response = FileResponse(default_storage.open(name, 'rb'), content_type='image/webp')
+        # Content-addressed: the bytes behind this URL never change
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+
+class SchedulerMetricsView(APIView):
+    """Per-tier queue depth and wait times for this worker's analysis scheduler."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"status": "success", "data": plan_scheduler.stats()}, status=status.HTTP_200_OK)
+
+
+class VisionMetricsView(APIView):
+    """Cascade escalation rate and per-detail-tier latency for this worker."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        snapshot = metrics.snapshot('vision.')
+        cascade = snapshot.get('vision.cascade', {})
+        # Every cascade run ends in exactly one of these; low_failed runs are escalated too
+        outcomes = {label: cascade.get(label, 0) for label in ('accepted_low', 'deadline_low', 'escalated', 'low_failed')}
+        decided = sum(outcomes.values())
+        escalated = outcomes['escalated'] + outcomes['low_failed']
+        data = {
+            "cascade_enabled": settings.VISION_CASCADE,
+            "accept_confidence": settings.VISION_CASCADE_ACCEPT_CONFIDENCE,
+            **outcomes,
+            "escalation_rate": round(escalated / decided, 3) if decided else 0.0,
+            "tier_ms": snapshot.get('vision.tier_ms', {}),
+        }
+        return Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
+
+
+class LLMMetricsView(APIView):
+    """Routing table plus per-route call counts, latency, cost and fallbacks for this worker."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        snapshot = metrics.snapshot('llm.')
+        data = {
+            "routes": {name: route_for(name).as_dict() for name in settings.AGENT_ROUTES if name != 'default'},
+            "calls": snapshot.get('llm.calls', {}),
+            "errors": snapshot.get('llm.errors', {}),
+            "fallbacks": snapshot.get('llm.fallbacks', {}),
+            "latency_ms": snapshot.get('llm.latency_ms', {}),
+            "cost_usd": snapshot.get('llm.cost_usd', {}),
+        }
+        return Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
+
+
+class CacheMetricsView(APIView):
+    """Per-namespace cache hit/miss counts for this worker."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"status": "success", "data": cache_stats()}, status=status.HTTP_200_OK)
 
 
 class HealthCheckView(APIView):
@@ -358,17 +824,77 @@ class ProductChatView(APIView):
     # since the dashboard already guards the UI with Neon auth.
     permission_classes = [AllowAny]
 
+    def _owned_by_requester(self, owner_id, request):
+        # Ownerless sessions and reports are never reachable by id: ids are sequential
+        return owner_id is not None and request.user.is_authenticated and request.user.id == owner_id
+
+    def _resolve_session(self, request):
+        """Return (session, error_response). Both are None for stateless chat."""
+        session_id = request.data.get('session_id')
+        report_id = request.data.get('report_id')
+        if (session_id or report_id) and not request.user.is_authenticated:
+            return None, Response(
+                {"error": "Sign in to chat about a saved analysis; anonymous clients send report_context."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        if session_id:
+            session = ChatSession.objects.select_related('report').filter(pk=session_id).first()
+            if not session or not self._owned_by_requester(session.user_id, request):
+                return None, Response({"error": "Chat session not found"}, status=status.HTTP_404_NOT_FOUND)
+            return session, None
+
+        if report_id:
+            upload = UploadedImage.objects.filter(pk=report_id).first()
+            if not upload or not upload.analysis_report or not self._owned_by_requester(upload.user_id, request):
+                return None, Response({"error": "Report not found"}, status=status.HTTP_404_NOT_FOUND)
+            session = ChatSession.objects.create(report=upload, user=request.user)
+            return session, None
+
+        return None, None
+
     def post(self, request):
         message = (request.data.get('message') or '').strip()
-        report_context = request.data.get('report_context')
         if not message:
             return Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        session, error = self._resolve_session(request)
+        if error:
+            return error
+
+        report_context = load_report(session.report) if session else request.data.get('report_context')
         if report_context is None:
-            return Response({"error": "report_context is required"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "report_context, report_id or session_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Cached answers only make sense for standalone questions, not mid-conversation follow-ups
+        use_cache = str(request.data.get('use_cache', 'true')).lower() not in ('false', '0', 'no')
+        if session is not None and session.turn_count:
+            use_cache = False
+        report_key = report_cache_key(report_context, session.report_id if session else None)
 
         try:
-            agent = ProductChatAgent()
-            answer = agent.run(message=message, report_context=report_context)
-            return Response({"status": "success", "data": {"answer": answer}}, status=status.HTTP_200_OK)
+            answer = chat_answer_cache.get(report_key, message) if use_cache else None
+            cached = answer is not None
+            if session is None:
+                if not cached:
+                    answer = ProductChatAgent().run(message=message, report_context=report_context)
+                    chat_answer_cache.set(report_key, message, answer)
+                return Response({"status": "success", "data": {"answer": answer, "cached": cached}}, status=status.HTTP_200_OK)
+
+            memory = ChatMemory(session, summarizer=ChatSummaryAgent())
+            if not cached:
+                answer = ProductChatAgent().run(
+                    message=message,
+                    report_context=report_context,
+                    history=memory.context_messages(),
+                    report_id=session.report_id,
+                )
+                if not session.turn_count:
+                    chat_answer_cache.set(report_key, message, answer)
+            memory.record(message, answer)
+            return Response({
+                "status": "success",
+                "data": {"answer": answer, "session_id": session.id, "cached": cached}
+            }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Do the one-off work a worker's first request would otherwise pay for.
+
+    Meant for the gunicorn master with preload_app (see gunicorn.conf.py): the
+    imported modules, compiled regexes and route tables are then shared by every
+    forked worker. Opens no sockets and starts no threads, so it is fork-safe.
+    """
+    started = time.perf_counter()
+
+    # URLconf -> core.views -> orchestrator, agents, extractors, caches
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+    # DRF resolves these classes (SimpleJWT auth, throttles, renderers) lazily per first request
+    from rest_framework.settings import api_settings
+    for name in ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_RENDERER_CLASSES',
+                 'DEFAULT_PARSER_CLASSES', 'DEFAULT_THROTTLE_CLASSES'):
+        getattr(api_settings, name)
+
+    # Deferred by core.agents / core.views / core.web_extract; import them once here
+    import openai  # noqa: F401
+    import requests  # noqa: F401
+    from PIL import Image
+    from rest_framework_simplejwt.tokens import RefreshToken  # noqa: F401
+    Image.init()
+
+    from .routing import route_for
+    for agent in settings.AGENT_ROUTES:
+        route_for(agent)
+
+    from django.db import connections
+    connections.close_all()
+    logger.info("Warm-up done in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def after_fork():
+    """Per-worker initialisation: drop inherited handles and build this worker's shared clients."""
+    from django.core.cache import caches
+
+    from .clients import get_openai_client, reset_clients
+
+    # DB connections were closed in the master by warm_up(); closing inherited
+    # sockets here would also end the master's session on PostgreSQL
+    for cache in caches.all(initialized_only=True):
+        reset = getattr(cache, 'reset_after_fork', None)
+        if reset:
+            reset()
+    reset_clients()
+    get_openai_client()
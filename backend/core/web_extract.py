@@ -4,7 +4,8 @@ import logging
 from html import unescape
 from typing import Any, Dict, Optional
 
-import requests
+from .deadline import Deadline, DeadlineExceeded, capped
+from .extract_profiles import ExtractionProfile, profile_for_url
 
 logger = logging.getLogger(__name__)
 
@@ -18,81 +19,126 @@ _DEFAULT_HEADERS = {
 }
 
 
-def _first_match(pattern: str, text: str, flags: int = 0) -> Optional[str]:
-    match = re.search(pattern, text, flags)
-    return match.group(1).strip() if match else None
-
+_META_PRICE_AMOUNT = re.compile(
+    r"<meta[^>]+(?:property|name)=\"product:price:amount\"[^>]+content=\"([^\"]+)\"", re.IGNORECASE
+)
+_META_PRICE_CURRENCY = re.compile(
+    r"<meta[^>]+(?:property|name)=\"product:price:currency\"[^>]+content=\"([^\"]+)\"", re.IGNORECASE
+)
+_JSONLD_SCRIPT = re.compile(r"<script[^>]+type=\"application/ld\+json\"[^>]*>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+_CURRENCY_PRICE = re.compile(r"(?:₹|\$|€|£)\s?([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]{1,2})?)")
+_CURRENCY_SYMBOLS = {"₹": "INR", "$": "USD", "€": "EUR", "£": "GBP"}
 
-def extract_price_from_html(html: str) -> Optional[Dict[str, Any]]:
-    if not html:
-        return None
 
-    text = unescape(html)
+def _first_match(pattern, text: str, flags: int = 0) -> Optional[str]:
+    match = re.search(pattern, text, flags) if isinstance(pattern, str) else pattern.search(text)
+    return match.group(1).strip() if match else None
 
-    # 1) OpenGraph / product meta
-    amount = _first_match(
-        r"<meta[^>]+(?:property|name)=\"product:price:amount\"[^>]+content=\"([^\"]+)\"",
-        text,
-        flags=re.IGNORECASE,
-    )
-    currency = _first_match(
-        r"<meta[^>]+(?:property|name)=\"product:price:currency\"[^>]+content=\"([^\"]+)\"",
-        text,
-        flags=re.IGNORECASE,
-    )
-    if amount:
-        display = f"{currency + ' ' if currency else ''}{amount}".strip()
-        return {"display": display, "amount": amount, "currency": currency, "source": "meta"}
 
-    # 2) JSON-LD offers.price / priceCurrency
-    for script in re.findall(
-        r"<script[^>]+type=\"application/ld\+json\"[^>]*>(.*?)</script>",
-        text,
-        flags=re.IGNORECASE | re.DOTALL,
-    ):
+def _jsonld_blocks(text: str):
+    for script in _JSONLD_SCRIPT.findall(text):
         blob = script.strip()
         if not blob:
             continue
         try:
-            payload = json.loads(blob)
+            yield json.loads(blob)
         except Exception:
             continue
 
-        def scan(node: Any) -> Optional[Dict[str, Any]]:
-            if isinstance(node, dict):
-                # direct price
-                if "price" in node:
-                    a = str(node.get("price"))
-                    c = node.get("priceCurrency")
-                    disp = f"{c + ' ' if c else ''}{a}".strip()
-                    return {"display": disp, "amount": a, "currency": c, "source": "jsonld"}
-                # offer object
-                offers = node.get("offers")
-                if offers is not None:
-                    found = scan(offers)
-                    if found:
-                        return found
-                for v in node.values():
-                    found = scan(v)
-                    if found:
-                        return found
-            elif isinstance(node, list):
-                for item in node:
-                    found = scan(item)
-                    if found:
-                        return found
-            return None
 
+def _price_from_jsonld(text: str) -> Optional[Dict[str, Any]]:
+    def scan(node: Any) -> Optional[Dict[str, Any]]:
+        if isinstance(node, dict):
+            # direct price
+            if "price" in node:
+                a = str(node.get("price"))
+                c = node.get("priceCurrency")
+                disp = f"{c + ' ' if c else ''}{a}".strip()
+                return {"display": disp, "amount": a, "currency": c, "source": "jsonld"}
+            # offer object
+            offers = node.get("offers")
+            if offers is not None:
+                found = scan(offers)
+                if found:
+                    return found
+            for v in node.values():
+                found = scan(v)
+                if found:
+                    return found
+        elif isinstance(node, list):
+            for item in node:
+                found = scan(item)
+                if found:
+                    return found
+        return None
+
+    for payload in _jsonld_blocks(text):
         found = scan(payload)
         if found:
             return found
+    return None
+
+
+def _price_from_profile(html: str, profile: ExtractionProfile) -> Optional[Dict[str, Any]]:
+    for pattern in profile.price_patterns:
+        match = pattern.search(html)
+        if not match:
+            continue
+        raw = match.group('amount')
+        symbol = unescape(match.groupdict().get('currency') or '').strip()
+        currency = profile.currency or _CURRENCY_SYMBOLS.get(symbol[-1:]) or (symbol if symbol.isalpha() else None)
+        if symbol and not symbol.isalpha():
+            display = f"{symbol}{raw}"
+        else:
+            display = f"{currency or ''} {raw}".strip()
+        amount = raw.replace(',', '')
+        return {"display": display, "amount": amount, "currency": currency, "source": f"profile:{profile.name}"}
+    return None
+
+
+def _price_from_meta(text: str) -> Optional[Dict[str, Any]]:
+    amount = _first_match(_META_PRICE_AMOUNT, text)
+    if not amount:
+        return None
+    currency = _first_match(_META_PRICE_CURRENCY, text)
+    display = f"{currency + ' ' if currency else ''}{amount}".strip()
+    return {"display": display, "amount": amount, "currency": currency, "source": "meta"}
+
+
+def extract_price_from_html(html: str, url: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Extract the selling price from a product page.
+
+    When `url` belongs to a known marketplace/brand store only its extraction
+    profile (see core.extract_profiles) is trusted: its patterns, then JSON-LD if
+    the profile allows it, then product meta tags. A page the profile cannot read
+    has no price, rather than whatever currency amount the page mentions first.
+    Other pages go through the generic meta / JSON-LD / currency-regex chain.
+    """
+    if not html:
+        return None
+
+    profile = profile_for_url(url)
+    if profile is not None:
+        found = _price_from_profile(html, profile)
+        if not found and profile.use_jsonld:
+            found = _price_from_jsonld(html)
+        return found or _price_from_meta(unescape(html))
+
+    text = unescape(html)
+
+    # 1) OpenGraph / product meta
+    found = _price_from_meta(text)
+    if found:
+        return found
+
+    # 2) JSON-LD offers.price / priceCurrency
+    found = _price_from_jsonld(text)
+    if found:
+        return found
 
     # 3) Heuristic regex (last resort)
     # Currency symbol + number, prefer typical price-like numbers
-    m = re.search(
-        r"(?:₹|\$|€|£)\s?([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]{1,2})?)",
-        text,
-    )
+    m = _CURRENCY_PRICE.search(text)
     if m:
         raw = m.group(0).strip()
         return {"display": raw, "amount": m.group(1), "currency": None, "source": "regex"}
@@ -100,7 +146,7 @@ def extract_price_from_html(html: str) -> Optional[Dict[str, Any]]:
     return None
 
 
-def extract_basic_page_info_from_html(html: str) -> Dict[str, Any]:
+def extract_basic_page_info_from_html(html: str, url: Optional[str] = None) -> Dict[str, Any]:
     if not html:
         return {"title": None, "description": None, "price": None}
 
@@ -115,12 +161,20 @@ def extract_basic_page_info_from_html(html: str) -> Dict[str, Any]:
         flags=re.IGNORECASE,
     )
 
-    price = extract_price_from_html(text)
+    price = extract_price_from_html(html, url=url)
 
     return {"title": title, "description": description, "price": price}
 
 
-def fetch_url_html(url: str, timeout_s: int = 12) -> Optional[str]:
+def fetch_url_html(url: str, timeout_s: int = 12, deadline: Optional[Deadline] = None) -> Optional[str]:
+    """Page HTML or None; the timeout is capped by the request `deadline` when given."""
+    import requests  # deferred: keeps worker start-up light
+
+    try:
+        timeout_s = capped(timeout_s, deadline, min_s=1)
+    except DeadlineExceeded:
+        logger.info("fetch_url_html skipped (deadline) url=%s", url)
+        return None
     try:
         resp = requests.get(url, headers=_DEFAULT_HEADERS, timeout=timeout_s, allow_redirects=True)
         if resp.status_code >= 400:
@@ -132,12 +186,12 @@ def fetch_url_html(url: str, timeout_s: int = 12) -> Optional[str]:
         return None
 
 
-def summarize_product_urls(urls) -> Dict[str, Any]:
+def summarize_product_urls(urls, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
     """Fetch pages and extract lightweight product signals (title/description/price)."""
     results = []
     for url in urls or []:
-        html = fetch_url_html(url)
-        info = extract_basic_page_info_from_html(html) if html else {"title": None, "description": None, "price": None}
+        html = fetch_url_html(url, deadline=deadline)
+        info = extract_basic_page_info_from_html(html, url=url) if html else {"title": None, "description": None, "price": None}
         results.append({"url": url, **info})
 
     return {"sources": results}
@@ -146,13 +200,21 @@ def summarize_product_urls(urls) -> Dict[str, Any]:
 def extract_main_image_from_html(html: str, base_url: Optional[str] = None) -> Optional[str]:
     """Try to extract a main product image URL from HTML.
 
-    Checks common metadata patterns (og:image, twitter:image), JSON-LD `image`,
+    Uses the site's extraction profile when `base_url` is a known store, then
+    checks common metadata patterns (og:image, twitter:image), JSON-LD `image`,
     then falls back to the first large <img> src found.
     Returns an absolute URL when possible.
     """
     if not html:
         return None
 
+    profile = profile_for_url(base_url)
+    if profile is not None:
+        for pattern in profile.image_patterns:
+            match = pattern.search(html)
+            if match:
+                return _resolve_url(unescape(match.group('url')), base_url)
+
     text = unescape(html)
 
     # 1) OpenGraph / twitter
@@ -163,34 +225,26 @@ def extract_main_image_from_html(html: str, base_url: Optional[str] = None) -> O
         return _resolve_url(img, base_url)
 
     # 2) JSON-LD image
-    for script in re.findall(r"<script[^>]+type=\"application/ld\+json\"[^>]*>(.*?)</script>", text, flags=re.IGNORECASE | re.DOTALL):
-        blob = script.strip()
-        if not blob:
-            continue
-        try:
-            payload = json.loads(blob)
-        except Exception:
-            continue
-        # Look for image or image.url
-        def scan_for_image(node):
-            if isinstance(node, dict):
-                if 'image' in node:
-                    v = node['image']
-                    if isinstance(v, str):
-                        return v
-                    if isinstance(v, dict) and 'url' in v:
-                        return v['url']
-                for val in node.values():
-                    found = scan_for_image(val)
-                    if found:
-                        return found
-            elif isinstance(node, list):
-                for item in node:
-                    found = scan_for_image(item)
-                    if found:
-                        return found
-            return None
+    def scan_for_image(node):
+        if isinstance(node, dict):
+            if 'image' in node:
+                v = node['image']
+                if isinstance(v, str):
+                    return v
+                if isinstance(v, dict) and 'url' in v:
+                    return v['url']
+            for val in node.values():
+                found = scan_for_image(val)
+                if found:
+                    return found
+        elif isinstance(node, list):
+            for item in node:
+                found = scan_for_image(item)
+                if found:
+                    return found
+        return None
 
+    for payload in _jsonld_blocks(text):
         found = scan_for_image(payload)
         if found:
             return _resolve_url(found, base_url)
@@ -0,0 +1,23 @@
+"""Gunicorn settings (picked up automatically when started from backend/).
+
+The app is loaded once in the master (preload_app) and warmed there, so forked
+workers start with Django, DRF, the OpenAI SDK and the URLconf already imported.
+"""
+import os
+
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+
+def when_ready(server):
+    if preload_app:
+        from core.warmup import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from core.warmup import after_fork
+        after_fork()